@@ -13,6 +13,12 @@ from fastapi.encoders import (
 from fastapi.security import (
     OAuth2PasswordRequestForm,
 )
+from odmantic import (
+    query,
+)
+from odmantic.exceptions import (
+    DuplicateKeyError,
+)
 from odmantic.session import (
     AIOSession,
 )
@@ -23,18 +29,24 @@ from typing import (
     Any,
     Dict,
     Optional,
+    Tuple,
 )
 
 from app.auth import (
     models as auth_models,
     schemas as auth_schemas,
 )
+from app.config import (
+    settings,
+)
 from app.users import (
     models as users_models,
     schemas as users_schemas,
 )
 from app.utils import (
+    cache,
     crypt,
+    engine,
     jwt,
 )
 
@@ -58,14 +70,14 @@ async def create_user(
 
 
 async def find_existed_user(
-    email: str, session: AIOSession
+    email: str, session: engine.AnySession
 ) -> users_models.User:
     """
     A method to fetch a user info given an email.
 
     Args:
         email (EmailStr) : A given user email.
-        session (odmantic.session.AIOSession) : Odmantic session object.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
 
     Returns:
         users_models.User: The current user object.
@@ -77,14 +89,14 @@ async def find_existed_user(
 
 
 async def find_existed_user_id(
-    user_id: str, session: AIOSession
+    user_id: str, session: engine.AnySession
 ) -> Optional[users_models.User]:
     """
     A method to fetch a user info given an id.
 
     Args:
         user_id (str) : A given user id.
-        session (odmantic.session.AIOSession) : Odmantic session object.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
 
     Returns:
         users_models.User: The current user object.
@@ -103,9 +115,13 @@ async def login_user(
     """
     A method to fetch and return serialized user info upon logging in.
 
+    Note:
+        The password is verified outside of the transaction storing the
+        token, which is committed before the token is returned.
+
     Args:
         form_data (OAuth2PasswordRequestForm) : OAuth2 request form.
-        session (odmantic.session.AIOSession) : Odmantic session object.
+        session (odmantic.session.AIOSession) : odmantic session object.
 
     Returns:
         Dict[str, Any]: a dict object that contains info about a given user.
@@ -116,43 +132,41 @@ async def login_user(
     user = auth_schemas.UserLoginSchema(
         email=user_obj.email, password=user_obj.password
     )
-    is_valid = crypt.verify_password(form_data.password, user.password)
+    is_valid = await crypt.hasher.verify(form_data.password, user.password)
     if not is_valid:
         return {"status_code": 401, "message": "Invalid Credentials!"}
 
     access_token_expires = timedelta(days=15)
-    access_token = await jwt.create_access_token(
-        data={"sub": form_data.username},
-        expires_delta=access_token_expires,
-    )
 
-    token = await session.find_one(
-        auth_models.AccessToken, auth_models.AccessToken.user == user_obj.id
-    )
-    if not token:
-        token = auth_models.AccessToken(
-            user=user_obj.id,
-            tokens=[
-                access_token["access_token"],
-            ],
+    async def issue_token(transaction: AIOSession) -> Dict[str, Any]:
+        access_token = await jwt.create_access_token(
+            data={"sub": form_data.username},
+            expires_delta=access_token_expires,
         )
-    else:
-        tokens = token.tokens
-        tokens.extend(
-            [
-                access_token["access_token"],
-            ]
+        if "access_token" not in access_token:
+            return access_token
+        await transaction.save(
+            auth_models.AccessToken(
+                user=user_obj.id,
+                token_hash=crypt.hash_token(access_token["access_token"]),
+                expires_at=datetime.utcnow() + access_token_expires,
+            )
         )
-        token.update(
-            {
-                "user": user_obj.id,
-                "tokens": tokens,
-                "modified_date": datetime.utcnow(),
-            }
-        )
-    await session.save(token)
+        await remove_stale_tokens(user_obj.id, transaction)
+        return access_token
 
-    return access_token
+    try:
+        # tokens carry a random `jti`, a duplicate is only retried to never
+        # hand out a token another device already holds.
+        return await engine.run_in_transaction(
+            session, issue_token, retry_on=(DuplicateKeyError,)
+        )
+    except DuplicateKeyError:
+        return {
+            "status_code": 409,
+            "message": "An error has occurred while generating an access"
+            " token!",
+        }
 
 
 async def register_user(
@@ -173,7 +187,7 @@ async def register_user(
         return {"status_code": 400, "message": "User already signed up!"}
 
     # Create new user
-    user.password = crypt.get_password_hash(user.password)
+    user.password = await crypt.hasher.hash(user.password)
     await create_user(user, session)
     user = await find_existed_user(user.email, session)
     access_token_expires = timedelta(days=15)
@@ -191,25 +205,93 @@ async def register_user(
     return results
 
 
-async def find_existed_token(
-    email: EmailStr, token: str, session: AIOSession
-) -> Optional[str]:
+async def find_existed_identity(
+    email: str, token: str, session: engine.AnySession
+) -> Optional[Tuple[cache.UserIdentity, bool]]:
     """
-    A method for finding a token in a token list.
+    A method for resolving a user and checking one of its tokens in a
+    single round trip.
 
     Args:
-        email (pydantic.EmailStr) : An email address of an authenticated user.
+        email (str) : An email address of an authenticated user.
         token (str) : A token value.
-        session (odmantic.session.AIOSession) : odmantic session object.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+
+    Returns:
+        Optional[Tuple[app.utils.cache.UserIdentity, bool]]: The user
+            identity and whether the token is still active, None if the
+            user doesn't exist.
     """
-    user = await find_existed_user(email, session)
-    token_obj = await session.find_one(
-        auth_models.AccessToken, auth_models.AccessToken.user == user.id
+    # the token is looked up by its unique hash, at most one document is
+    # joined whatever the number of devices, and only the identity fields
+    # of the user are returned.
+    pipeline = [
+        {"$match": {"email": email}},
+        {"$limit": 1},
+        {
+            "$lookup": {
+                "from": auth_models.AccessToken.__collection__,
+                "pipeline": [
+                    {"$match": {"token_hash": crypt.hash_token(token)}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0, "user": 1}},
+                ],
+                "as": "access_tokens",
+            }
+        },
+        {
+            "$project": {
+                "_id": 1,
+                "email": 1,
+                "user_status": 1,
+                "user_role": 1,
+                "is_active": {"$in": ["$_id", "$access_tokens.user"]},
+            }
+        },
+    ]
+    cursor = engine.get_collection(session, users_models.User).aggregate(
+        pipeline, session=engine.get_driver_session(session)
     )
-    try:
-        tokens = token_obj.tokens
-        if token in tokens:
-            return token
-    except Exception:
-        ...
-    return None
+    documents = await cursor.to_list(length=1)
+    if not documents:
+        return None
+    document = documents[0]
+    identity = cache.UserIdentity(
+        id=document["_id"],
+        email=document["email"],
+        user_status=users_models.UserStatus(
+            document.get("user_status", users_models.UserStatus.ACTIVE)
+        ),
+        user_role=users_models.UserRole(
+            document.get("user_role", users_models.UserRole.REGULAR)
+        ),
+    )
+    return identity, bool(document["is_active"])
+
+
+async def remove_stale_tokens(
+    user_id: ObjectId, session: engine.AnySession
+) -> None:
+    """
+    A method for revoking the oldest tokens of a user beyond the allowed
+    number of devices.
+
+    Args:
+        user_id (bson.ObjectId) : A user id.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    stale_tokens = await session.find(
+        auth_models.AccessToken,
+        auth_models.AccessToken.user == user_id,
+        sort=query.desc(auth_models.AccessToken.creation_date),
+        skip=settings().MAX_DEVICES_PER_USER,
+    )
+    if stale_tokens:
+        await session.remove(
+            auth_models.AccessToken,
+            auth_models.AccessToken.id.in_(
+                [token.id for token in stale_tokens]
+            ),
+        )
+        for token in stale_tokens:
+            cache.token_cache.pop(token.token_hash)
@@ -0,0 +1,146 @@
+"""The auth migrations module.
+
+Run the pending migrations with:
+
+    >>> python -m app.auth.migrations
+"""
+
+import asyncio
+from datetime import (
+    datetime,
+)
+import jwt
+from jwt import (
+    PyJWTError,
+)
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+)
+from odmantic import (
+    AIOEngine,
+    Model,
+)
+from pymongo import (
+    UpdateOne,
+)
+from typing import (
+    List,
+    Optional,
+    Type,
+)
+
+from app.auth import (
+    models as auth_models,
+)
+from app.config import (
+    settings,
+)
+from app.utils import (
+    crypt,
+    jwt as jwt_utils,
+)
+
+logger = logging.getLogger(__name__)
+
+# the collection of the per-user token arrays, before one document per token.
+LEGACY_TOKENS_COLLECTION = "access_token"
+
+
+def get_token_expiry(token: str) -> Optional[datetime]:
+    """
+    Get the expiry date of a token issued by the app.
+
+    Args:
+        token (str) : An access token.
+
+    Returns:
+        Optional[datetime]: The expiry date, None if the token is invalid
+            or expired.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            jwt_utils.JWT_SECRET_KEY,
+            algorithms=[jwt_utils.JWT_ALGORITHM],
+        )
+    except PyJWTError:
+        return None
+    if "exp" not in payload:
+        return None
+    return datetime.utcfromtimestamp(payload["exp"])
+
+
+async def migrate_access_tokens(
+    engine: AIOEngine, batch_size: int = 500
+) -> int:
+    """
+    Move the legacy per-user token arrays into the `access_tokens`
+    collection, one hashed token per document, so that the users logged in
+    before stay logged in.
+
+    Only the latest `MAX_DEVICES_PER_USER` valid tokens of each user are
+    kept. The migration is resumable: tokens are upserted by their hash and
+    a legacy document is only deleted once its tokens are moved.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of legacy documents read per batch.
+
+    Returns:
+        int: The number of migrated tokens.
+    """
+    legacy_tokens = engine.database[LEGACY_TOKENS_COLLECTION]
+    access_tokens = engine.get_collection(auth_models.AccessToken)
+    max_devices = settings().MAX_DEVICES_PER_USER
+    migrated = 0
+    async for legacy in legacy_tokens.find(
+        {"tokens": {"$exists": True}}
+    ).batch_size(batch_size):
+        now = datetime.utcnow()
+        operations: List[UpdateOne] = []
+        # tokens were appended on login, the latest come last.
+        for token in (legacy.get("tokens") or [])[-max_devices:]:
+            expires_at = get_token_expiry(token)
+            if not expires_at or expires_at <= now:
+                continue
+            operations.append(
+                UpdateOne(
+                    {"token_hash": crypt.hash_token(token)},
+                    {
+                        "$setOnInsert": {
+                            "user": legacy["user"],
+                            "expires_at": expires_at,
+                            "creation_date": now,
+                            "modified_date": now,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+        if operations:
+            await access_tokens.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+        await legacy_tokens.delete_one({"_id": legacy["_id"]})
+    logger.info("Migrated %s access tokens.", migrated)
+    return migrated
+
+
+async def run_migrations() -> None:
+    """
+    Connect to the configured database and run the auth migrations.
+    """
+    app_settings = settings()
+    client = AsyncIOMotorClient(app_settings.db_url)
+    engine = AIOEngine(client=client, database=app_settings.database_name)
+    try:
+        models: List[Type[Model]] = [auth_models.AccessToken]
+        await engine.configure_database(models)
+        await migrate_access_tokens(engine)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_migrations())
@@ -8,23 +8,57 @@ from datetime import (
 )
 from odmantic import (
     Field,
+    Index,
     Model,
 )
+from odmantic.query import (
+    desc,
+)
+import pymongo
 from typing import (
-    List,
+    Iterator,
     Optional,
+    Union,
 )
 
 
 class AccessToken(Model):
     """
-    The AccessToken model
+    The AccessToken model, one document per issued token.
 
     Args:
         Model (odmantic.Model): Base odmantic model.
     """
 
     user: ObjectId
-    tokens: List[str] = []
+    token_hash: str = Field(unique=True)
+    expires_at: datetime
     creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
     modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        """
+        The AccessToken Config class.
+        """
+
+        collection = "access_tokens"
+
+        @staticmethod
+        def indexes() -> Iterator[Union[Index, pymongo.IndexModel]]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: a compound index on the user and creation date fields
+                    and a TTL index purging expired tokens.
+            """
+            yield Index(
+                AccessToken.user,
+                desc(AccessToken.creation_date),
+                name="user_creation_date_index",
+            )
+            yield pymongo.IndexModel(
+                [("expires_at", pymongo.ASCENDING)],
+                expireAfterSeconds=0,
+                name="expires_at_ttl_index",
+            )
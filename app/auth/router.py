@@ -52,7 +52,7 @@ router = APIRouter(prefix="/api/v1")
 )
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     Authenticate a user.
@@ -80,7 +80,7 @@ async def login(
 )
 async def register(
     user: auth_schemas.UserCreate,
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     register a new user.
@@ -35,7 +35,7 @@ class UserSchema(BaseModel):
             display_gender=1,
             passion="swimming,cardio",
             email="user@test.com",
-            profile_picture="A relative URL to Deta Drive.",
+            profile_picture="https://ipfs.io/ipfs/QmFull/5a6b",
         ),
     )
     token: Optional[Dict[str, str]] = Field(
@@ -74,7 +74,9 @@ class UserCreate(BaseModel):
     passion: str = Field(..., example="swimming,cardio")
     email: EmailStr = Field(..., example="user@test.com")
     password: str = Field(..., example="A secure password goes here.")
-    profile_picture: str = Field(..., example="A relative URL to Deta Drive.")
+    profile_picture: str = Field(
+        ..., example="https://ipfs.io/ipfs/QmFull/5a6b"
+    )
 
 
 class Token(BaseModel):
@@ -24,33 +24,179 @@ class Settings(BaseSettings):
         MONGODB_USERNAME (str) : MONGODB username.
         MONGODB_PASSWORD (str) : MONGODB password.
         MONGODB_DATABASE (str) : MONGODB database name.
+        MONGODB_MAX_POOL_SIZE (int) : Max number of connections per server and worker.
+        MONGODB_MIN_POOL_SIZE (int) : Number of connections kept open per server and worker.
+        MONGODB_MAX_IDLE_TIME_MS (int) : Milliseconds an idle connection stays in the pool.
+        MONGODB_WAIT_QUEUE_TIMEOUT_MS (int) : Milliseconds to wait for a free connection.
+        MONGODB_COMPRESSORS (str) : Comma separated wire compressors, e.g. "zstd,snappy,zlib".
+        MONGODB_READ_PREFERENCE (str) : Read preference of read-routed endpoints.
+        MONGODB_MAX_STALENESS_SECONDS (int) : Max secondary lag for read-routed endpoints, -1 for no max.
+        MONGODB_DROP_OBSOLETE_INDEXES (bool) : Drop indexes no model declares at startup.
+        MONGODB_TRANSACTION_MAX_ATTEMPTS (int) : Max attempts of a transaction failing with a transient error.
         JWT_SECRET_KEY (str) : A secure app jwt secret key.
         DEBUG (str) : A variable used to separate testing env from production env.
         CORS_ORIGINS (str) : A string that contains comma separated urls for cors origins.
         PINATA_API_KEY (str) : A Pinata api key.
         PINATA_API_SECRET (str) : A Pinata api secret.
+        PINATA_API_URL (str) : The Pinata api url.
+        PINATA_GATEWAY_URL (str) : The IPFS gateway url of the pinned files.
+        PINATA_TIMEOUT_SECONDS (float) : Seconds to wait for Pinata to connect or answer.
+        PINATA_MAX_CONCURRENT_UPLOADS (int) : Max number of uploads in flight per worker.
+        MAX_UPLOAD_BYTES (int) : Max size in bytes of an uploaded image.
+        IMAGE_PROCESS_WORKERS (int) : Number of processes rendering image variants.
+        IMAGE_PROCESS_MAX_QUEUE (int) : Images allowed to wait for a process before failing fast.
+        IMAGE_WEBP_QUALITY (int) : WebP quality of the image variants, from 0 to 100.
+        MEDIA_STORAGE (str) : The media storage backend, "pinata" or "local".
+        MEDIA_LOCAL_ROOT (str) : The directory of the local media storage.
+        MEDIA_BASE_URL (str) : The url the media are served from, relative to the api host unless absolute.
+        MEDIA_CACHE_ROOT (str) : The directory of the IPFS gateway media cache.
+        MEDIA_CACHE_MAX_BYTES (int) : Max size in bytes of the media cache per worker.
+        MEDIA_CACHE_GATEWAY_URL (str) : The IPFS gateway url the media cache fetches from.
+        MEDIA_CACHE_TIMEOUT_SECONDS (float) : Seconds to wait for the gateway to connect or answer.
+        TOKEN_CACHE_SIZE (int) : Max number of verified tokens cached per worker.
+        TOKEN_CACHE_TTL (int) : Seconds a verified token stays cached.
+        PASSWORD_HASH_WORKERS (int) : Number of threads hashing passwords.
+        PASSWORD_HASH_MAX_QUEUE (int) : Hashing calls allowed to wait before failing fast.
+        MAX_DEVICES_PER_USER (int) : Number of access tokens kept per user.
+        MESSAGE_QUEUE_SIZE (int) : Websocket messages waiting to be persisted before senders wait.
+        MESSAGE_BATCH_SIZE (int) : Max number of websocket messages persisted per batch.
+        MESSAGE_FLUSH_INTERVAL_MS (int) : Milliseconds to wait for a batch to fill up.
+        MESSAGE_COLD_AFTER_DAYS (int) : Age in days of the read messages moved into buckets.
+        MESSAGE_BUCKET_SIZE (int) : Number of messages per bucket.
+        MESSAGE_BUCKET_COMPRESSION (bool) : Whether to compress the buckets with zlib.
+        MESSAGE_EXPORT_BATCH_SIZE (int) : Number of messages read and sent per export chunk.
 
     Example:
         >>> MONGODB_HOST=svc-123456789.svc.MONGODB.com
         >>> MONGODB_USERNAME=admin
         >>> MONGODB_PASSWORD=51R0NGPO$$W0RD
         >>> MONGODB_DATABASE=tinder
+        >>> MONGODB_MAX_POOL_SIZE=30
+        >>> MONGODB_MIN_POOL_SIZE=0
+        >>> MONGODB_MAX_IDLE_TIME_MS=60000
+        >>> MONGODB_WAIT_QUEUE_TIMEOUT_MS=2000
+        >>> MONGODB_COMPRESSORS="zstd,snappy,zlib"
+        >>> MONGODB_READ_PREFERENCE=secondaryPreferred
+        >>> MONGODB_MAX_STALENESS_SECONDS=90
+        >>> MONGODB_DROP_OBSOLETE_INDEXES=false
+        >>> MONGODB_TRANSACTION_MAX_ATTEMPTS=3
         >>> JWT_SECRET_KEY=123SDA23sa
         >>> DEBUG="" # "" means production, "test" means testing, "info" means development.
         >>> CORS_ORIGINS="https://app-name.herokuapp.com,http://app-name.pages.dev"
         >>> PINATA_API_KEY=12312dSDJHJSBA
         >>> PINATA_API_SECRET=12312dSDJHJSBA
+        >>> PINATA_API_URL=https://api.pinata.cloud
+        >>> PINATA_GATEWAY_URL=https://ipfs.io/ipfs
+        >>> PINATA_TIMEOUT_SECONDS=30
+        >>> PINATA_MAX_CONCURRENT_UPLOADS=4
+        >>> MAX_UPLOAD_BYTES=5242880
+        >>> IMAGE_PROCESS_WORKERS=2
+        >>> IMAGE_PROCESS_MAX_QUEUE=16
+        >>> IMAGE_WEBP_QUALITY=80
+        >>> MEDIA_STORAGE=pinata
+        >>> MEDIA_LOCAL_ROOT=media
+        >>> MEDIA_BASE_URL=/api/v1/media
+        >>> MEDIA_CACHE_ROOT=media_cache
+        >>> MEDIA_CACHE_MAX_BYTES=1073741824
+        >>> MEDIA_CACHE_GATEWAY_URL=https://ipfs.io/ipfs
+        >>> MEDIA_CACHE_TIMEOUT_SECONDS=30
+        >>> TOKEN_CACHE_SIZE=10000
+        >>> TOKEN_CACHE_TTL=60
+        >>> PASSWORD_HASH_WORKERS=2
+        >>> PASSWORD_HASH_MAX_QUEUE=64
+        >>> MAX_DEVICES_PER_USER=10
+        >>> MESSAGE_QUEUE_SIZE=1000
+        >>> MESSAGE_BATCH_SIZE=100
+        >>> MESSAGE_FLUSH_INTERVAL_MS=50
+        >>> MESSAGE_COLD_AFTER_DAYS=90
+        >>> MESSAGE_BUCKET_SIZE=200
+        >>> MESSAGE_BUCKET_COMPRESSION=true
+        >>> MESSAGE_EXPORT_BATCH_SIZE=500
     """
 
     MONGODB_HOST: str = os.getenv("MONGODB_HOST")  # type: ignore
     MONGODB_USERNAME: str = os.getenv("MONGODB_USERNAME")  # type: ignore
     MONGODB_PASSWORD: str = os.getenv("MONGODB_PASSWORD")  # type: ignore
     MONGODB_DATABASE: str = os.getenv("MONGODB_DATABASE")  # type: ignore
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "30"))
+    MONGODB_MIN_POOL_SIZE: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(
+        os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000")
+    )
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(
+        os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000")
+    )
+    MONGODB_COMPRESSORS: str = os.getenv("MONGODB_COMPRESSORS", "")
+    MONGODB_READ_PREFERENCE: str = os.getenv(
+        "MONGODB_READ_PREFERENCE", "secondaryPreferred"
+    )
+    MONGODB_MAX_STALENESS_SECONDS: int = int(
+        os.getenv("MONGODB_MAX_STALENESS_SECONDS", "90")
+    )
+    MONGODB_DROP_OBSOLETE_INDEXES: bool = (
+        os.getenv("MONGODB_DROP_OBSOLETE_INDEXES", "false").lower() == "true"
+    )
+    MONGODB_TRANSACTION_MAX_ATTEMPTS: int = int(
+        os.getenv("MONGODB_TRANSACTION_MAX_ATTEMPTS", "3")
+    )
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")  # type: ignore
     DEBUG: str = os.getenv("DEBUG")  # type: ignore
     CORS_ORIGINS: str = os.getenv("CORS_ORIGINS")  # type: ignore
     PINATA_API_KEY: str = os.getenv("PINATA_API_KEY")  # type: ignore
     PINATA_API_SECRET: str = os.getenv("PINATA_API_SECRET")  # type: ignore
+    PINATA_API_URL: str = os.getenv(
+        "PINATA_API_URL", "https://api.pinata.cloud"
+    )
+    PINATA_GATEWAY_URL: str = os.getenv(
+        "PINATA_GATEWAY_URL", "https://ipfs.io/ipfs"
+    )
+    PINATA_TIMEOUT_SECONDS: float = float(
+        os.getenv("PINATA_TIMEOUT_SECONDS", "30")
+    )
+    PINATA_MAX_CONCURRENT_UPLOADS: int = int(
+        os.getenv("PINATA_MAX_CONCURRENT_UPLOADS", "4")
+    )
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", "5242880"))
+    IMAGE_PROCESS_WORKERS: int = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+    IMAGE_PROCESS_MAX_QUEUE: int = int(
+        os.getenv("IMAGE_PROCESS_MAX_QUEUE", "16")
+    )
+    IMAGE_WEBP_QUALITY: int = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+    MEDIA_STORAGE: str = os.getenv("MEDIA_STORAGE", "pinata")
+    MEDIA_LOCAL_ROOT: str = os.getenv("MEDIA_LOCAL_ROOT", "media")
+    MEDIA_BASE_URL: str = os.getenv("MEDIA_BASE_URL", "/api/v1/media")
+    MEDIA_CACHE_ROOT: str = os.getenv("MEDIA_CACHE_ROOT", "media_cache")
+    MEDIA_CACHE_MAX_BYTES: int = int(
+        os.getenv("MEDIA_CACHE_MAX_BYTES", "1073741824")
+    )
+    MEDIA_CACHE_GATEWAY_URL: str = os.getenv(
+        "MEDIA_CACHE_GATEWAY_URL", "https://ipfs.io/ipfs"
+    )
+    MEDIA_CACHE_TIMEOUT_SECONDS: float = float(
+        os.getenv("MEDIA_CACHE_TIMEOUT_SECONDS", "30")
+    )
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    TOKEN_CACHE_TTL: int = int(os.getenv("TOKEN_CACHE_TTL", "60"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_QUEUE: int = int(
+        os.getenv("PASSWORD_HASH_MAX_QUEUE", "64")
+    )
+    MAX_DEVICES_PER_USER: int = int(os.getenv("MAX_DEVICES_PER_USER", "10"))
+    MESSAGE_QUEUE_SIZE: int = int(os.getenv("MESSAGE_QUEUE_SIZE", "1000"))
+    MESSAGE_BATCH_SIZE: int = int(os.getenv("MESSAGE_BATCH_SIZE", "100"))
+    MESSAGE_FLUSH_INTERVAL_MS: int = int(
+        os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "50")
+    )
+    MESSAGE_COLD_AFTER_DAYS: int = int(
+        os.getenv("MESSAGE_COLD_AFTER_DAYS", "90")
+    )
+    MESSAGE_BUCKET_SIZE: int = int(os.getenv("MESSAGE_BUCKET_SIZE", "200"))
+    MESSAGE_BUCKET_COMPRESSION: bool = (
+        os.getenv("MESSAGE_BUCKET_COMPRESSION", "true").lower() == "true"
+    )
+    MESSAGE_EXPORT_BATCH_SIZE: int = int(
+        os.getenv("MESSAGE_EXPORT_BATCH_SIZE", "500")
+    )
 
     class Config:  # pylint: disable=R0903
         """
@@ -60,6 +206,19 @@ class Settings(BaseSettings):
         env_file = ".env"
         env_file_encoding = "utf-8"
 
+    @property
+    def database_name(self) -> str:
+        """
+        Get the database name, `test` when running the tests.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            str: The database name.
+        """
+        return "test" if self.DEBUG == "test" else self.MONGODB_DATABASE
+
     @property
     def db_url(self) -> str:
         """
@@ -71,39 +230,20 @@ class Settings(BaseSettings):
         Returns:
             str: The assembled database URL.
         """
-
-        if self.DEBUG == "test":
-            mongodb_database_url = (
-                "mongodb+srv://"
-                + self.MONGODB_USERNAME
-                + ":"
-                + self.MONGODB_PASSWORD
-                + "@"
-                + self.MONGODB_HOST
-                + "/"
-                + "test"
-                + "?"
-                + "retryWrites=true"
-                + "&"
-                + "w=majority"
-            )
-
-        else:
-            mongodb_database_url = (
-                "mongodb+srv://"
-                + self.MONGODB_USERNAME
-                + ":"
-                + self.MONGODB_PASSWORD
-                + "@"
-                + self.MONGODB_HOST
-                + "/"
-                + self.MONGODB_DATABASE
-                + "?"
-                + "retryWrites=true"
-                + "&"
-                + "w=majority"
-            )
-        return mongodb_database_url
+        return (
+            "mongodb+srv://"
+            + self.MONGODB_USERNAME
+            + ":"
+            + self.MONGODB_PASSWORD
+            + "@"
+            + self.MONGODB_HOST
+            + "/"
+            + self.database_name
+            + "?"
+            + "retryWrites=true"
+            + "&"
+            + "w=majority"
+        )
 
     @property
     def cors_origins(self) -> List[str]:
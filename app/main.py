@@ -1,16 +1,24 @@
 """The main module"""
 
 from fastapi import (
+    Depends,
     FastAPI,
 )
 from fastapi.middleware.cors import (
     CORSMiddleware,
 )
+from fastapi.requests import (
+    Request,
+)
+from fastapi.responses import (
+    JSONResponse,
+)
 from functools import (
     lru_cache,
 )
 import logging
 from typing import (
+    Any,
     Dict,
 )
 import uvicorn
@@ -24,14 +32,24 @@ from app.config import (
 from app.matches import (
     router as matches_router,
 )
+from app.media import (
+    cache as media_cache,
+    images as media_images,
+    router as media_router,
+)
 from app.messages import (
+    pipeline as messages_pipeline,
     router as messages_router,
 )
 from app.users import (
     router as users_router,
 )
 from app.utils import (
+    crypt,
     engine,
+    jwt,
+    pinata,
+    uploads,
 )
 from app.websockets import (
     router as websockets_router,
@@ -85,6 +103,10 @@ def get_app() -> FastAPI:
 
     origins.extend(app_settings.cors_origins)
 
+    app.add_middleware(
+        uploads.MaxBodySizeMiddleware,
+        max_body_size=uploads.get_max_body_size(),
+    )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
@@ -97,9 +119,12 @@ def get_app() -> FastAPI:
         logger.info("Connecting to MongoDB...")
         await engine.init_engine_app(app)
         logger.info("Connected to MongoDB!")
+        await messages_pipeline.pipeline.start(app.state.engine)
 
     @app.on_event("shutdown")
     async def shutdown() -> None:
+        logger.info("Flushing queued messages...")
+        await messages_pipeline.pipeline.stop()
         logger.info("Closing connection with MongoDB...")
         # bug: TypeError: object NoneType can't be used in 'await' expression
         try:
@@ -107,15 +132,61 @@ def get_app() -> FastAPI:
         except Exception as err:
             logger.error(repr(err))
         logger.info("Closed connection with MongoDB!")
+        crypt.hasher.shutdown()
+        media_images.processor.shutdown()
+        await pinata.pinata.close()
+        await media_cache.gateway_cache.close()
+
+    @app.exception_handler(crypt.PasswordHasherBusyError)
+    async def password_hasher_busy(
+        request: Request, exc: crypt.PasswordHasherBusyError
+    ) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status_code": 503,
+                "message": "The server is busy, please try again later!",
+            },
+            headers={"Retry-After": "1"},
+        )
+
+    @app.exception_handler(media_images.ImageProcessorBusyError)
+    async def image_processor_busy(
+        request: Request, exc: media_images.ImageProcessorBusyError
+    ) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status_code": 503,
+                "message": "The server is busy, please try again later!",
+            },
+            headers={"Retry-After": "1"},
+        )
 
     @app.get("/api")
     async def root() -> Dict[str, str]:
         return {"message": "Welcome to the Brave Date Server."}
 
+    # server addresses, pool and queue states are internal, admins only.
+    @app.get(
+        "/api/metrics", dependencies=[Depends(jwt.get_current_admin_user)]
+    )
+    async def metrics(request: Request) -> Dict[str, Any]:
+        return {
+            "password_hasher": crypt.hasher.stats(),
+            "mongodb_pools": engine.pool_monitor.stats(),
+            "message_pipeline": messages_pipeline.pipeline.stats(),
+            "index_coverage": getattr(request.app.state, "index_report", []),
+            "pinata": pinata.pinata.stats(),
+            "image_processor": media_images.processor.stats(),
+            "media_cache": media_cache.gateway_cache.stats(),
+        }
+
     app.include_router(auth_router.router, tags=["auth"])
     app.include_router(users_router.router, tags=["users"])
     app.include_router(matches_router.router, tags=["matches"])
     app.include_router(messages_router.router, tags=["messages"])
+    app.include_router(media_router.router, tags=["media"])
     app.include_router(websockets_router.router, tags=["websockets"])
 
     return app
@@ -29,6 +29,9 @@ from app.matches import (
 from app.users import (
     models as users_models,
 )
+from app.utils import (
+    engine,
+)
 
 
 async def add_new_match(
@@ -97,14 +100,14 @@ async def add_new_match(
 
 
 async def get_user_matches(
-    user_id: ObjectId, session: AIOSession
+    user_id: ObjectId, session: engine.AnySession
 ) -> Dict[str, Any]:
     """
     A method to fetch all user matches info.
 
     Args:
         user_id (bson.ObjectId) : A given id of an authenticated user.
-        session (odmantic.session.AIOSession) : odmantic session object.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
 
     Returns:
         Dict[str, Any]: A User model instance
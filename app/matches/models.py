@@ -24,7 +24,7 @@ class Match(Model):
         Model (odmantic.Model): Odmantic base model.
     """
 
-    user: ObjectId
+    user: ObjectId = Field(unique=True)
     matches: List[ObjectId] = []
     creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
     modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
@@ -4,6 +4,9 @@ from fastapi import (
     APIRouter,
     Depends,
 )
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
@@ -21,10 +24,8 @@ from app.matches.schemas import (
     AddMatch,
     GetAllMatchesResults,
 )
-from app.users import (
-    schemas as users_schemas,
-)
 from app.utils import (
+    cache,
     dependencies,
     jwt,
 )
@@ -52,10 +53,8 @@ router = APIRouter(prefix="/api/v1")
 )
 async def add_match(
     match: AddMatch,
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     Add new user to an authenticated user matches list.
@@ -83,10 +82,8 @@ async def add_match(
     },
 )
 async def get_matches_for_user(
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
 ) -> Dict[str, Any]:
     """
     Get all matches for an authenticated user.
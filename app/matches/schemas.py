@@ -54,7 +54,7 @@ class GetAllMatchesResults(BaseModel):
                 display_gender=1,
                 passion="swimming,cardio",
                 email="user@test.com",
-                profile_picture="A relative URL to Deta Drive.",
+                profile_picture="https://ipfs.io/ipfs/QmFull/5a6b",
             ),
         ],
     )
@@ -0,0 +1,14 @@
+"""
+Media package.
+"""
+
+from app.media import (
+    cache,
+    crud,
+    images,
+    models,
+    router,
+    storage,
+)
+
+__all__ = ["cache", "crud", "images", "models", "router", "storage"]
@@ -0,0 +1,337 @@
+"""The media cache module."""
+
+import anyio
+import asyncio
+from collections import (
+    OrderedDict,
+)
+import hashlib
+import httpx
+import os
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+import uuid
+
+from app.config import (
+    settings,
+)
+from app.utils import (
+    uploads,
+)
+
+
+class GatewayError(Exception):
+    """
+    Raised when a media can't be fetched from the gateway.
+    """
+
+
+class CacheEntry(NamedTuple):
+    """
+    A cached media size and content type.
+    """
+
+    size: int
+    content_type: str
+
+
+class GatewayCache:
+    """
+    A size bounded, least recently used, on-disk cache of the media served
+    by an IPFS gateway.
+
+    Concurrent misses for the same media share a single upstream fetch.
+    The index lives in memory, guarded by a lock, and is rebuilt from the
+    cache directory on first use: workers sharing a directory each enforce
+    the bound on the files they know of, and a file evicted by another
+    worker is fetched again. Media being served are pinned, they are only
+    evicted once released.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        max_file_bytes: int,
+        gateway_url: str,
+        timeout: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        """
+        A constructor that sets the cache directory, its bounds and the
+        gateway.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            root (str) : The cache directory.
+            max_bytes (int) : The max total size of the cached media.
+            max_file_bytes (int) : The max size of a single media.
+            gateway_url (str) : The IPFS gateway url, e.g. a local fake gateway.
+            timeout (float) : Seconds to wait for the gateway to connect or answer.
+            transport (httpx.AsyncBaseTransport) : A custom transport, if any.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.gateway_url = gateway_url.rstrip("/")
+        self.timeout = timeout
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._pins: Dict[str, int] = {}
+        self._fetches: Dict[str, "asyncio.Task[CacheEntry]"] = {}
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """
+        Close the pooled connections.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def get_key(cid: str, filename: str) -> str:
+        """
+        Get the cache key of a media.
+
+        Args:
+            cid (str) : The IPFS hash of the media directory.
+            filename (str) : The media file name in the directory.
+
+        Returns:
+            str: The cache key.
+        """
+        return hashlib.sha256(f"{cid}/{filename}".encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        """
+        Get the path of a cached media, sharded by the first characters of
+        its key.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (str) : The cache key.
+
+        Returns:
+            str: The cached file path.
+        """
+        return os.path.join(self.root, key[:2], key)
+
+    async def get(self, cid: str, filename: str) -> Tuple[str, str]:
+        """
+        Get the path of a media, fetching it from the gateway on a miss.
+        The media is pinned until it is released.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            cid (str) : The IPFS hash of the media directory.
+            filename (str) : The media file name in the directory.
+
+        Raises:
+            GatewayError: If the media can't be fetched or isn't an image.
+
+        Returns:
+            Tuple[str, str]: The cached file path and its content type.
+        """
+        if not self._loaded:
+            await self._load()
+        key = self.get_key(cid, filename)
+        path = self.get_path(key)
+        # pinned before the fetch completes, a new entry is never evicted
+        # before it is served.
+        self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            entry = self._entries.get(key)
+            if entry and await anyio.Path(path).exists():
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return path, entry.content_type
+            if entry:
+                async with self._lock:
+                    if self._entries.get(key) is entry:
+                        self._forget(key)
+            fetch = self._fetches.get(key)
+            if fetch:
+                self._counters["coalesced"] += 1
+            else:
+                self._counters["misses"] += 1
+                fetch = asyncio.create_task(self._fetch(key, cid, filename))
+                self._fetches[key] = fetch
+                fetch.add_done_callback(lambda _: self._fetches.pop(key, None))
+            # a cancelled request must not cancel the fetch other requests
+            # wait on.
+            entry = await asyncio.shield(fetch)
+            return path, entry.content_type
+        except BaseException:
+            self._unpin(key)
+            raise
+
+    async def release(self, cid: str, filename: str) -> None:
+        """
+        Unpin a media once it has been served, evicting the media the pin
+        kept over the bound.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            cid (str) : The IPFS hash of the media directory.
+            filename (str) : The media file name in the directory.
+        """
+        self._unpin(self.get_key(cid, filename))
+        async with self._lock:
+            await self._evict()
+
+    async def _fetch(self, key: str, cid: str, filename: str) -> CacheEntry:
+        path = self.get_path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await anyio.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            size, head = 0, b""
+            async with self._get_client().stream(
+                "GET", f"{self.gateway_url}/{cid}/{filename}"
+            ) as response:
+                response.raise_for_status()
+                async with await anyio.open_file(temp_path, mode="wb") as file:
+                    async for chunk in response.aiter_bytes(
+                        uploads.CHUNK_SIZE
+                    ):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise GatewayError(
+                                f"{cid}/{filename} is too large!"
+                            )
+                        if len(head) < uploads.CHUNK_SIZE:
+                            head += chunk[: uploads.CHUNK_SIZE - len(head)]
+                        await file.write(chunk)
+            content_type = uploads.sniff_image_type(head)
+            if content_type is None:
+                raise GatewayError(f"{cid}/{filename} isn't an image!")
+            await anyio.Path(temp_path).replace(path)
+        except (httpx.HTTPError, OSError) as err:
+            self._counters["errors"] += 1
+            raise GatewayError(
+                f"Failed to fetch {cid}/{filename}: {err!r}"
+            ) from err
+        except GatewayError:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            await anyio.Path(temp_path).unlink(missing_ok=True)
+        entry = CacheEntry(size, content_type)
+        async with self._lock:
+            if key in self._entries:
+                self._forget(key)
+            self._entries[key] = entry
+            self._size += size
+            await self._evict()
+        return entry
+
+    async def _evict(self) -> None:
+        for key in list(self._entries):
+            if self._size <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            self._forget(key)
+            self._counters["evictions"] += 1
+            await anyio.Path(self.get_path(key)).unlink(missing_ok=True)
+
+    def _forget(self, key: str) -> None:
+        self._size -= self._entries.pop(key).size
+
+    def _unpin(self, key: str) -> None:
+        self._pins[key] -= 1
+        if not self._pins[key]:
+            del self._pins[key]
+
+    async def _load(self) -> None:
+        async with self._lock:
+            if self._loaded:
+                return
+            files = await anyio.to_thread.run_sync(self._scan)
+            for _, key, size, content_type in sorted(files):
+                self._entries[key] = CacheEntry(size, content_type)
+                self._size += size
+            self._loaded = True
+
+    def _scan(self) -> List[Tuple[float, str, int, str]]:
+        files: List[Tuple[float, str, int, str]] = []
+        if not os.path.isdir(self.root):
+            return files
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    with open(path, "rb") as file:
+                        head = file.read(16)
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    # evicted by another worker meanwhile.
+                    continue
+                files.append(
+                    (
+                        stat_result.st_atime,
+                        name,
+                        stat_result.st_size,
+                        uploads.sniff_image_type(head)
+                        or "application/octet-stream",
+                    )
+                )
+        return files
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the cache usage counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, int]: The cache size, its bound and the counters.
+        """
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": self._size,
+            "entries": len(self._entries),
+            "fetching": len(self._fetches),
+            "pinned": len(self._pins),
+            **self._counters,
+        }
+
+
+gateway_cache = GatewayCache(
+    root=settings().MEDIA_CACHE_ROOT,
+    max_bytes=settings().MEDIA_CACHE_MAX_BYTES,
+    max_file_bytes=settings().MAX_UPLOAD_BYTES,
+    gateway_url=settings().MEDIA_CACHE_GATEWAY_URL,
+    timeout=settings().MEDIA_CACHE_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,408 @@
+"""The media crud module"""
+
+import anyio
+from datetime import (
+    datetime,
+    timedelta,
+)
+from fastapi import (
+    UploadFile,
+)
+import hashlib
+import logging
+from pymongo.errors import (
+    DuplicateKeyError,
+)
+from typing import (
+    Any,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    Optional,
+    Union,
+)
+
+from app.config import (
+    settings,
+)
+from app.media import (
+    images,
+    models as media_models,
+    storage,
+)
+from app.utils import (
+    engine,
+    uploads,
+)
+
+logger = logging.getLogger(__name__)
+
+# a media being deleted is polled until it is gone before its content is
+# saved again, and a deletion lasting longer, e.g. whose worker crashed,
+# is taken over.
+DELETE_POLL_SECONDS = 0.05
+DELETE_TIMEOUT_SECONDS = 120
+
+
+def get_source_key(sha256: str, variant: str) -> str:
+    """
+    Build the key a variant is looked up by, given the digest of the
+    uploaded image it was rendered from.
+
+    Args:
+        sha256 (str) : The hex sha256 digest of the uploaded image.
+        variant (str) : The variant name, e.g. `thumbnail`.
+
+    Returns:
+        str: The source key.
+    """
+    return f"{sha256}/{variant}"
+
+
+async def acquire_media(
+    sha256: str, session: engine.AnySession, source: Optional[str] = None
+) -> Optional[str]:
+    """
+    A method to add a reference to a stored media given its digest.
+
+    Args:
+        sha256 (str) : The hex sha256 digest of the media content.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        source (str) : The source key of the media, if it is an image variant.
+
+    Returns:
+        Optional[str]: The media url, None if it isn't stored yet.
+    """
+    update: Dict[str, Any] = {
+        "$inc": {"ref_count": 1},
+        "$set": {"modified_date": datetime.utcnow()},
+    }
+    if source:
+        update["$addToSet"] = {"sources": source}
+    media = await engine.get_collection(
+        session, media_models.MediaObject
+    ).find_one_and_update(
+        {"sha256": sha256, "ref_count": {"$gt": 0}},
+        update,
+        projection={"url": 1},
+        session=engine.get_driver_session(session),
+    )
+    return media["url"] if media else None
+
+
+async def acquire_image(
+    sha256: str, session: engine.AnySession
+) -> Optional[Dict[str, str]]:
+    """
+    A method to add a reference to each stored variant of an uploaded
+    image given its digest, so that it isn't rendered again.
+
+    Args:
+        sha256 (str) : The hex sha256 digest of the uploaded image.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+
+    Returns:
+        Optional[Dict[str, str]]: The variants urls by name, None unless
+        all of them are stored.
+    """
+    collection = engine.get_collection(session, media_models.MediaObject)
+    urls: Dict[str, str] = {}
+    for name in images.VARIANT_SIZES:
+        media = await collection.find_one_and_update(
+            {
+                "sources": get_source_key(sha256, name),
+                "ref_count": {"$gt": 0},
+            },
+            {
+                "$inc": {"ref_count": 1},
+                "$set": {"modified_date": datetime.utcnow()},
+            },
+            projection={"url": 1},
+            session=engine.get_driver_session(session),
+        )
+        if not media:
+            await release_images(urls.values(), session)
+            return None
+        urls[name] = media["url"]
+    return urls
+
+
+async def store_media(
+    source: Union[bytes, UploadFile],
+    session: engine.AnySession,
+    source_key: Optional[str] = None,
+) -> str:
+    """
+    A method to store an image once per content and get its url.
+
+    Note:
+        The image is hashed before anything is sent out: a known digest
+        only adds a reference to the stored media, otherwise the image is
+        saved under its digest, so that the same content always gets the
+        same location. A media being deleted is only saved again once it
+        is gone, so that the deletion doesn't remove the new copy.
+
+    Args:
+        source (bytes | fastapi.UploadFile) : The image content.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        source_key (str) : The source key of the image, if it is a variant.
+
+    Raises:
+        app.utils.uploads.UploadError: If the image is too large or unsupported.
+        app.media.storage.StorageError: If the image can't be saved.
+
+    Returns:
+        str: The media url.
+    """
+    max_size = settings().MAX_UPLOAD_BYTES
+    body: Union[bytes, AsyncIterable[bytes]]
+    if isinstance(source, bytes):
+        content_type = uploads.check_image(source, max_size)
+        sha256, size = hashlib.sha256(source).hexdigest(), len(source)
+        body = source
+    else:
+        # hash the spooled upload first, it is only streamed out on a miss.
+        stream = uploads.UploadStream(source, max_size)
+        async for _ in stream:
+            pass
+        content_type, sha256, size = (
+            stream.content_type,  # type: ignore
+            stream.sha256,
+            stream.size,
+        )
+        await stream.rewind()
+        body = stream
+    collection = engine.get_collection(session, media_models.MediaObject)
+    live = {"sha256": sha256, "deleting": {"$ne": True}}
+    while True:
+        url = await acquire_media(sha256, session, source_key)
+        if url:
+            return url
+        # saving the content of a media being deleted would let the
+        # deletion remove it, it is saved again once the media is gone.
+        await wait_for_deletion(sha256, session)
+        location = await storage.storage.save(sha256, body, content_type, size)
+        url = storage.storage.get_url(location, sha256)
+        now = datetime.utcnow()
+        upsert: Dict[str, Any] = {
+            "$setOnInsert": {
+                "location": location,
+                "url": url,
+                "size": size,
+                "content_type": content_type,
+                "deleting": False,
+                "creation_date": now,
+            },
+            "$set": {"modified_date": now},
+            "$inc": {"ref_count": 1},
+        }
+        if source_key:
+            upsert["$addToSet"] = {"sources": source_key}
+        try:
+            await collection.update_one(
+                live,
+                upsert,
+                upsert=True,
+                session=engine.get_driver_session(session),
+            )
+            return url
+        except DuplicateKeyError:
+            # a concurrent upload of the same content inserted it first,
+            # unless it is being deleted since, then it is saved again.
+            updated = await collection.update_one(
+                live, upsert, session=engine.get_driver_session(session)
+            )
+            if updated.matched_count:
+                return url
+        if isinstance(body, uploads.UploadStream):
+            await body.rewind()
+
+
+async def wait_for_deletion(sha256: str, session: engine.AnySession) -> None:
+    """
+    A method to wait until a media being deleted is gone, taking the
+    deletion over once it lasts longer than `DELETE_TIMEOUT_SECONDS`.
+
+    Args:
+        sha256 (str) : The hex sha256 digest of the media content.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    collection = engine.get_collection(session, media_models.MediaObject)
+    driver_session = engine.get_driver_session(session)
+    while True:
+        media = await collection.find_one(
+            {"sha256": sha256, "deleting": True},
+            projection={"modified_date": 1},
+            session=driver_session,
+        )
+        if not media:
+            return
+        stale_date = datetime.utcnow() - timedelta(
+            seconds=DELETE_TIMEOUT_SECONDS
+        )
+        if media["modified_date"] < stale_date:
+            # claimed by a single waiter, the others keep waiting.
+            media = await collection.find_one_and_update(
+                {"_id": media["_id"], "modified_date": media["modified_date"]},
+                {"$set": {"modified_date": datetime.utcnow()}},
+                projection={"sha256": 1, "location": 1},
+                session=driver_session,
+            )
+            if media:
+                await delete_media(media, session)
+            continue
+        await anyio.sleep(DELETE_POLL_SECONDS)
+
+
+async def delete_media(
+    media: Dict[str, Any], session: engine.AnySession
+) -> None:
+    """
+    A method to delete a media marked as being deleted from the storage,
+    and only then its document.
+
+    Args:
+        media (Dict[str, Any]) : The media document, its id, digest and location.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    try:
+        await storage.storage.delete(media["location"], media["sha256"])
+    except storage.StorageError as err:
+        logger.error(repr(err))
+    await engine.get_collection(session, media_models.MediaObject).delete_one(
+        {"_id": media["_id"], "deleting": True},
+        session=engine.get_driver_session(session),
+    )
+
+
+async def release_media(url: str, session: engine.AnySession) -> None:
+    """
+    A method to remove a reference to a stored media, deleting it once
+    nothing refers to it anymore.
+
+    Note:
+        The last reference marks the media as being deleted in the same
+        atomic step, so that a concurrent upload never acquires it. The
+        document is only deleted once the media is deleted from the
+        storage: an upload of the same content waits for it meanwhile,
+        rather than saving content the deletion would remove. Urls that
+        aren't stored media, e.g. uploaded before media were deduplicated,
+        are ignored.
+
+    Args:
+        url (str) : The media url.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    collection = engine.get_collection(session, media_models.MediaObject)
+    driver_session = engine.get_driver_session(session)
+    while True:
+        released = await collection.update_one(
+            {"url": url, "ref_count": {"$gt": 1}},
+            {
+                "$inc": {"ref_count": -1},
+                "$set": {"modified_date": datetime.utcnow()},
+            },
+            session=driver_session,
+        )
+        if released.matched_count:
+            return
+        media = await collection.find_one_and_update(
+            {"url": url, "ref_count": {"$lte": 1}, "deleting": {"$ne": True}},
+            {
+                "$set": {
+                    "ref_count": 0,
+                    "deleting": True,
+                    "modified_date": datetime.utcnow(),
+                }
+            },
+            projection={"sha256": 1, "location": 1},
+            session=driver_session,
+        )
+        if media:
+            break
+        # gone, or acquired again in between: check before another round.
+        if not await collection.count_documents(
+            {"url": url, "deleting": {"$ne": True}},
+            limit=1,
+            session=driver_session,
+        ):
+            return
+    await delete_media(media, session)
+
+
+async def store_image(
+    source: Union[bytes, UploadFile], session: engine.AnySession
+) -> Dict[str, str]:
+    """
+    A method to render the size variants of an image and store each of
+    them once per content.
+
+    Note:
+        The uploaded image is hashed while it is spooled to a temporary
+        file, unless the upload is already on disk, which the worker reads
+        it from: the variants of an image uploaded before are only
+        referenced again, without rendering.
+
+    Args:
+        source (bytes | fastapi.UploadFile) : The image content.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+
+    Raises:
+        app.utils.uploads.UploadError: If the image is too large or invalid.
+        app.media.images.ImageProcessorBusyError: If the image processing queue is full.
+        app.media.storage.StorageError: If a variant can't be saved.
+
+    Returns:
+        Dict[str, str]: The variants urls by name, e.g. `thumbnail`.
+    """
+    image: Union[bytes, str]
+    temp_path = None
+    try:
+        if isinstance(source, bytes):
+            uploads.check_image(source, settings().MAX_UPLOAD_BYTES)
+            image, sha256 = source, hashlib.sha256(source).hexdigest()
+        else:
+            # the worker reads the upload from disk, it is never held in
+            # memory as a whole. An upload already on disk is only hashed
+            # and checked, the worker reads it in place.
+            stream = uploads.UploadStream(source, settings().MAX_UPLOAD_BYTES)
+            upload_path = uploads.get_upload_path(source)
+            if upload_path:
+                async for _ in stream:
+                    pass
+                image = upload_path
+            else:
+                image = temp_path = await uploads.spool_to_file(stream)
+            sha256 = stream.sha256
+        # a known upload is not rendered again, its variants are shared.
+        known_urls = await acquire_image(sha256, session)
+        if known_urls:
+            return known_urls
+        variants = await images.processor.render(image)
+    finally:
+        if temp_path:
+            await anyio.Path(temp_path).unlink(missing_ok=True)
+    urls: Dict[str, str] = {}
+    try:
+        for name, variant in variants.items():
+            urls[name] = await store_media(
+                variant, session, get_source_key(sha256, name)
+            )
+    except storage.StorageError:
+        await release_images(urls.values(), session)
+        raise
+    return urls
+
+
+async def release_images(
+    urls: Iterable[str], session: engine.AnySession
+) -> None:
+    """
+    A method to remove a reference to each variant of an image.
+
+    Args:
+        urls (Iterable[str]) : The variants urls.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    for url in urls:
+        await release_media(url, session)
@@ -0,0 +1,217 @@
+"""The media images module."""
+
+from PIL import (
+    Image,
+    ImageOps,
+)
+import asyncio
+from concurrent.futures import (
+    ProcessPoolExecutor,
+)
+from concurrent.futures.process import (
+    BrokenProcessPool,
+)
+from io import (
+    BytesIO,
+)
+import multiprocessing
+from typing import (
+    Dict,
+    Union,
+)
+
+from app.config import (
+    settings,
+)
+from app.utils import (
+    uploads,
+)
+
+# the longest edge, in pixels, of every variant.
+VARIANT_SIZES = {"thumbnail": 128, "medium": 640, "full": 2048}
+
+# images decoding to more pixels are rejected rather than decompressed.
+MAX_IMAGE_PIXELS = 40_000_000
+
+
+class ImageProcessorBusyError(Exception):
+    """
+    Raised when the image processing queue is saturated.
+    """
+
+
+def render_variants(data: Union[bytes, str], quality: int) -> Dict[str, bytes]:
+    """
+    Decode an image and encode its size variants as WebP, without any of
+    the original metadata.
+
+    Note:
+        The EXIF orientation is applied before the metadata is dropped and
+        only the first frame of animated images is kept. Variants are
+        never upscaled.
+
+    Args:
+        data (bytes | str) : The image content, or the path of a file holding it.
+        quality (int) : The WebP quality, from 0 to 100.
+
+    Raises:
+        ValueError: If the image can't be decoded.
+
+    Returns:
+        Dict[str, bytes]: The encoded variants by name.
+    """
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        with Image.open(
+            BytesIO(data) if isinstance(data, bytes) else data
+        ) as decoded:
+            # Pillow only warns up to twice its limit, the size is read
+            # from the header before anything is decoded.
+            width, height = decoded.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise ValueError(f"Invalid image: {width}x{height} pixels")
+            oriented = ImageOps.exif_transpose(decoded)
+            image = oriented.convert("RGBA" if _has_alpha(oriented) else "RGB")
+    except (OSError, Image.DecompressionBombError) as err:
+        raise ValueError(f"Invalid image: {err}") from err
+    variants = {}
+    for name, size in VARIANT_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        variant.save(output, format="WEBP", quality=quality, method=4)
+        variants[name] = output.getvalue()
+    return variants
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+class ImageProcessor:
+    """
+    An async facade that renders image variants in a bounded process pool
+    so that decoding and encoding never block the event loop.
+
+    Note:
+        A worker killed mid-render, e.g. out of memory, breaks the whole
+        pool: it is replaced by a new one and the render is tried once
+        more before the image is rejected.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, quality: int) -> None:
+        """
+        A constructor that sets the pool size, the queue bound and the
+        encoding quality.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            max_workers (int) : The number of images processed concurrently.
+            max_queue (int) : The number of images allowed to wait for a worker.
+            quality (int) : The WebP quality, from 0 to 100.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.quality = quality
+        self._executor = self._create_executor()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._restarts = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn rather than fork, the workers must not inherit the event
+        # loop and the driver threads.
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        # concurrent renders all fail on the same broken pool, only the
+        # first one replaces it.
+        if self._executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            self._restarts += 1
+
+    async def _run(self, data: Union[bytes, str]) -> Dict[str, bytes]:
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, render_variants, data, self.quality
+            )
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    async def render(self, data: Union[bytes, str]) -> Dict[str, bytes]:
+        """
+        Render the variants of an image off the event loop.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            data (bytes | str) : The image content, or the path of a file holding it.
+
+        Raises:
+            ImageProcessorBusyError: If the queue is saturated.
+            app.utils.uploads.UnsupportedMediaTypeError: If the image can't be decoded.
+
+        Returns:
+            Dict[str, bytes]: The encoded variants by name.
+        """
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise ImageProcessorBusyError("Image processing queue is full!")
+        self._in_flight += 1
+        try:
+            try:
+                return await self._run(data)
+            except BrokenProcessPool:
+                # another image may have broken the pool, try once more.
+                return await self._run(data)
+        except (ValueError, BrokenProcessPool) as err:
+            raise uploads.UnsupportedMediaTypeError(
+                "Invalid image file!"
+            ) from err
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the pool usage counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, int]: The pool size, queue depth, call counters and
+            pool restarts.
+        """
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+processor = ImageProcessor(
+    max_workers=settings().IMAGE_PROCESS_WORKERS,
+    max_queue=settings().IMAGE_PROCESS_MAX_QUEUE,
+    quality=settings().IMAGE_WEBP_QUALITY,
+)
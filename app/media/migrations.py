@@ -0,0 +1,206 @@
+"""The media migrations module.
+
+Run the pending migrations with:
+
+    >>> python -m app.media.migrations
+"""
+
+import asyncio
+from datetime import (
+    datetime,
+)
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+)
+from odmantic import (
+    AIOEngine,
+    Model,
+)
+from pymongo import (
+    UpdateOne,
+)
+import re
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Type,
+)
+
+from app.config import (
+    settings,
+)
+from app.media import (
+    models as media_models,
+    router as media_router,
+)
+from app.messages import (
+    compaction,
+    models as messages_models,
+)
+from app.users import (
+    models as users_models,
+)
+
+logger = logging.getLogger(__name__)
+
+# the gateway the uploads were linked to before the media were stored.
+LEGACY_GATEWAY_URL = "https://ipfs.io/ipfs"
+
+
+def get_gateway_pattern(gateway_urls: Sequence[str]) -> "re.Pattern[str]":
+    """
+    Build the pattern of the gateway urls of pinned files.
+
+    Args:
+        gateway_urls (Sequence[str]) : The gateway urls the files were linked to.
+
+    Returns:
+        re.Pattern[str]: A pattern capturing the cid and the filename.
+    """
+    prefixes = "|".join(
+        re.escape(url.rstrip("/")) for url in sorted(set(gateway_urls))
+    )
+    return re.compile(rf"^(?:{prefixes})/([^/]+)/([^/]+)$")
+
+
+async def proxy_gateway_url(
+    engine: AIOEngine, pattern: "re.Pattern[str]", url: Optional[str]
+) -> Optional[str]:
+    """
+    Allow the media proxy to serve the file of a gateway url.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        pattern (re.Pattern[str]) : The pattern of the gateway urls.
+        url (str) : A stored media url.
+
+    Returns:
+        Optional[str]: The proxy url of the file, None if the url isn't
+            the one of a pinned file.
+    """
+    found = pattern.match(url or "")
+    if not found:
+        return None
+    cid, filename = found.groups()
+    if not (
+        media_router.CID_PATTERN.match(cid)
+        and media_router.FILENAME_PATTERN.match(filename)
+    ):
+        return None
+    # the file is allowed before it is linked, so the link is never dead.
+    await engine.get_collection(media_models.GatewayMedia).update_one(
+        {"cid": cid, "filename": filename},
+        {"$setOnInsert": {"creation_date": datetime.utcnow()}},
+        upsert=True,
+    )
+    return f"{settings().MEDIA_BASE_URL}/ipfs/{cid}/{filename}"
+
+
+async def proxy_gateway_urls(engine: AIOEngine, batch_size: int = 500) -> int:
+    """
+    Rewrite the gateway urls stored before the media proxy, the profile
+    pictures, the media of the messages and of the bucketed messages, to
+    their proxy urls, so that they are served from the media cache.
+
+    Every rewritten file is added to the `GatewayMedia` files the proxy
+    serves, then its url is swapped if it wasn't changed meanwhile. The
+    migration is resumable: proxy urls don't match the gateway ones, so a
+    re-run only rewrites the urls left over.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of documents read per batch.
+
+    Returns:
+        int: The number of rewritten documents.
+    """
+    app_settings = settings()
+    pattern = get_gateway_pattern(
+        [LEGACY_GATEWAY_URL, app_settings.PINATA_GATEWAY_URL]
+    )
+    query = {"$regex": pattern.pattern}
+    users = engine.get_collection(users_models.User)
+    messages = engine.get_collection(messages_models.Message)
+    buckets = engine.get_collection(messages_models.MessageBucket)
+    rewritten = 0
+    async for user in users.find(
+        {"profile_picture": query}, {"profile_picture": 1}
+    ).batch_size(batch_size):
+        url = await proxy_gateway_url(engine, pattern, user["profile_picture"])
+        if url:
+            result = await users.update_one(
+                {
+                    "_id": user["_id"],
+                    "profile_picture": user["profile_picture"],
+                },
+                {"$set": {"profile_picture": url}},
+            )
+            rewritten += result.modified_count
+    operations: List[UpdateOne] = []
+    async for message in messages.find(
+        {"media": query}, {"media": 1}
+    ).batch_size(batch_size):
+        url = await proxy_gateway_url(engine, pattern, message["media"])
+        if url:
+            operations.append(
+                UpdateOne(
+                    {"_id": message["_id"], "media": message["media"]},
+                    {"$set": {"media": url}},
+                )
+            )
+        if len(operations) >= batch_size:
+            result = await messages.bulk_write(operations, ordered=False)
+            rewritten += result.modified_count
+            operations = []
+    if operations:
+        result = await messages.bulk_write(operations, ordered=False)
+        rewritten += result.modified_count
+    # the bucketed messages can only be matched once unpacked.
+    async for bucket in buckets.find().batch_size(batch_size):
+        documents: List[Dict[str, Any]] = compaction.unpack_bucket(bucket)
+        changed = False
+        for document in documents:
+            url = await proxy_gateway_url(
+                engine, pattern, document.get("media")
+            )
+            if url:
+                document["media"] = url
+                changed = True
+        if not changed:
+            continue
+        packed = compaction.pack_messages(
+            bucket["conversation_id"],
+            documents,
+            bool(bucket.get("compressed")),
+        )
+        result = await buckets.update_one(
+            {"_id": bucket["_id"], "data": bucket["data"]},
+            {"$set": {"data": packed["data"]}},
+        )
+        rewritten += result.modified_count
+    logger.info("Proxied the gateway urls of %s documents.", rewritten)
+    return rewritten
+
+
+async def run_migrations() -> None:
+    """
+    Connect to the configured database and run the media migrations.
+    """
+    app_settings = settings()
+    client = AsyncIOMotorClient(app_settings.db_url)
+    engine = AIOEngine(client=client, database=app_settings.database_name)
+    try:
+        models: List[Type[Model]] = [media_models.GatewayMedia]
+        await engine.configure_database(models)
+        await proxy_gateway_urls(engine)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_migrations())
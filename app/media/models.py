@@ -0,0 +1,84 @@
+"""The media models module"""
+
+from datetime import (
+    datetime,
+)
+from odmantic import (
+    Field,
+    Index,
+    Model,
+)
+from typing import (
+    Iterator,
+    List,
+    Optional,
+)
+
+
+class MediaObject(Model):
+    """
+    The MediaObject model, a stored file addressed by the sha256 digest of
+    its content, its location in the storage backend, e.g. an IPFS hash,
+    and the number of users and messages referring to it. Image variants
+    also list the uploads they were rendered from as `sources` keys. A
+    media no longer referred to is flagged as `deleting` until it is
+    deleted from the storage.
+
+    Args:
+        Model (odmantic.Model): Odmantic base model.
+    """
+
+    sha256: str = Field(unique=True)
+    location: str
+    url: str = Field(index=True)
+    size: int
+    content_type: str
+    ref_count: int = 0
+    sources: List[str] = Field(default=[], index=True)
+    deleting: bool = False
+    creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        """
+        The MediaObject Config class.
+        """
+
+        collection = "media"
+
+
+class GatewayMedia(Model):
+    """
+    The GatewayMedia model, a file pinned to IPFS before the media were
+    stored by content, referred to by its gateway path from a message or a
+    profile picture, that the media proxy is allowed to serve.
+
+    Args:
+        Model (odmantic.Model): Odmantic base model.
+    """
+
+    cid: str
+    filename: str
+    creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        """
+        The GatewayMedia Config class.
+        """
+
+        collection = "gateway_media"
+
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: a unique compound index on the cid and filename fields.
+            """
+            yield Index(
+                GatewayMedia.cid,
+                GatewayMedia.filename,
+                unique=True,
+                name="cid_filename_index",
+            )
@@ -0,0 +1,199 @@
+"""The media router module"""
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    responses,
+)
+from fastapi.requests import (
+    Request,
+)
+import logging
+from odmantic import (
+    AIOEngine,
+)
+import re
+from starlette.background import (
+    BackgroundTask,
+)
+from typing import (
+    Optional,
+)
+
+from app.media import (
+    cache as media_cache,
+    models as media_models,
+    storage as media_storage,
+)
+from app.utils import (
+    dependencies,
+    responses as response_utils,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1")
+
+# media are addressed by their content, they never change.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# CIDv0 or base32 CIDv1, the only forms the gateway urls are built with.
+CID_PATTERN = re.compile(r"^(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})$")
+FILENAME_PATTERN = re.compile(r"^[\w.-]{1,255}$")
+
+
+async def get_cached_response(
+    request: Request,
+    cid: str,
+    filename: str,
+    etag: str,
+    media_type: Optional[str] = None,
+) -> responses.Response:
+    """
+    Serve a media of the IPFS gateway from the local media cache.
+
+    Args:
+        request (starlette.requests.Request) : The current request.
+        cid (str) : The IPFS hash of the media directory.
+        filename (str) : The media file name in the directory.
+        etag (str) : A strong entity tag of the media content.
+        media_type (str) : The media content type, sniffed if unknown.
+
+    Returns:
+        starlette.responses.Response: The media, a part of it, a 304, a 404,
+            a 416 or a 502 if the gateway failed.
+    """
+    gateway_cache = media_cache.gateway_cache
+    try:
+        path, content_type = await gateway_cache.get(cid, filename)
+    except media_cache.GatewayError as err:
+        logger.error(repr(err))
+        return responses.JSONResponse(
+            status_code=502,
+            content={"status_code": 502, "message": "Media unavailable!"},
+        )
+    # the media stays pinned while it is streamed, so it isn't evicted.
+    release = BackgroundTask(gateway_cache.release, cid, filename)
+    try:
+        response = await response_utils.get_file_response(
+            request, path, media_type or content_type, etag, CACHE_CONTROL
+        )
+    except BaseException:
+        await release()
+        raise
+    if isinstance(response, response_utils.FileSliceResponse):
+        response.background = release
+    else:
+        await release()
+    return response
+
+
+@router.api_route(
+    "/media/{key}",
+    methods=["GET", "HEAD"],
+    name="media:get",
+    responses={
+        200: {"description": "Return the media content."},
+        206: {"description": "Return a byte range of the media content."},
+        304: {"description": "The cached media is still valid."},
+        307: {"description": "Redirect to the media storage url."},
+        404: {"description": "Media not found."},
+        502: {"description": "The media gateway failed."},
+    },
+)
+async def get_media(
+    key: str,
+    request: Request,
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> responses.Response:
+    """
+    Serve a media given its content digest, with range and conditional
+    requests support when it is stored locally or pinned to IPFS.
+    """
+    media = await session.find_one(
+        media_models.MediaObject, media_models.MediaObject.sha256 == key
+    )
+    if not media:
+        return responses.JSONResponse(
+            status_code=404,
+            content={"status_code": 404, "message": "Media not found!"},
+        )
+    storage = media_storage.storage
+    if isinstance(storage, media_storage.LocalStorage):
+        return await response_utils.get_file_response(
+            request,
+            storage.get_path(media.sha256),
+            media.content_type,
+            f'"{media.sha256}"',
+            CACHE_CONTROL,
+        )
+    if isinstance(storage, media_storage.PinataStorage):
+        return await get_cached_response(
+            request,
+            media.location,
+            media.sha256,
+            f'"{media.sha256}"',
+            media.content_type,
+        )
+    return responses.RedirectResponse(
+        storage.get_url(media.location, media.sha256),
+        headers={"cache-control": CACHE_CONTROL},
+    )
+
+
+@router.api_route(
+    "/media/ipfs/{cid}/{filename}",
+    methods=["GET", "HEAD"],
+    name="media:ipfs",
+    responses={
+        200: {"description": "Return the media content."},
+        206: {"description": "Return a byte range of the media content."},
+        304: {"description": "The cached media is still valid."},
+        404: {"description": "Media not found."},
+        502: {"description": "The media gateway failed."},
+    },
+)
+async def get_ipfs_media(
+    cid: str,
+    filename: str,
+    request: Request,
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> responses.Response:
+    """
+    Serve a media pinned to IPFS through the local media cache, the path
+    being the one of its gateway url. Only stored media and the legacy
+    gateway files referred to by messages or profiles are served, the route
+    doesn't proxy any other content of the gateway.
+    """
+    if not (CID_PATTERN.match(cid) and FILENAME_PATTERN.match(filename)):
+        return responses.JSONResponse(
+            status_code=404,
+            content={"status_code": 404, "message": "Media not found!"},
+        )
+    media = await session.find_one(
+        media_models.MediaObject,
+        media_models.MediaObject.sha256 == filename,
+        media_models.MediaObject.location == cid,
+    )
+    if media:
+        return await get_cached_response(
+            request,
+            media.location,
+            media.sha256,
+            f'"{media.sha256}"',
+            media.content_type,
+        )
+    gateway_media = await session.find_one(
+        media_models.GatewayMedia,
+        media_models.GatewayMedia.cid == cid,
+        media_models.GatewayMedia.filename == filename,
+    )
+    if not gateway_media:
+        return responses.JSONResponse(
+            status_code=404,
+            content={"status_code": 404, "message": "Media not found!"},
+        )
+    # the gateway path of a pinned file never changes, nor does its content.
+    return await get_cached_response(
+        request, cid, filename, f'"{cid}/{filename}"'
+    )
@@ -0,0 +1,224 @@
+"""The media storage module."""
+
+from abc import (
+    ABC,
+    abstractmethod,
+)
+import anyio
+import os
+from typing import (
+    AsyncIterable,
+    Optional,
+    Union,
+)
+import uuid
+
+from app.config import (
+    settings,
+)
+from app.utils import (
+    pinata,
+)
+
+
+class StorageError(Exception):
+    """
+    Raised when a media can't be saved or deleted.
+    """
+
+
+class MediaStorage(ABC):
+    """
+    The interface of the backends media are saved to, by key.
+    """
+
+    name: str
+
+    @abstractmethod
+    async def save(
+        self,
+        key: str,
+        body: Union[bytes, AsyncIterable[bytes]],
+        content_type: str,
+        size: Optional[int] = None,
+    ) -> str:
+        """
+        Save a media.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (str) : The media key, its content digest.
+            body (bytes | AsyncIterable[bytes]) : The media content.
+            content_type (str) : The media content type.
+            size (int) : The media size, if known.
+
+        Raises:
+            StorageError: If the media can't be saved.
+
+        Returns:
+            str: The location of the media in the backend.
+        """
+
+    @abstractmethod
+    async def delete(self, location: str, key: str) -> None:
+        """
+        Delete a media.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            location (str) : The location returned by `save`.
+            key (str) : The media key.
+
+        Raises:
+            StorageError: If the media can't be deleted.
+        """
+
+    @abstractmethod
+    def get_url(self, location: str, key: str) -> str:
+        """
+        Get the public url of a media.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            location (str) : The location returned by `save`.
+            key (str) : The media key.
+
+        Returns:
+            str: The media url.
+        """
+
+
+class LocalStorage(MediaStorage):
+    """
+    A backend saving media on the local filesystem, served by the app
+    itself. It also stands in for the remote backends in tests.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str) -> None:
+        """
+        A constructor that sets the media directory and url.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            root (str) : The directory media are saved to.
+            base_url (str) : The url media are served from.
+        """
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def get_path(self, key: str) -> str:
+        """
+        Get the path of a media, sharded by the first characters of its key.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (str) : The media key.
+
+        Returns:
+            str: The media file path.
+        """
+        return os.path.join(self.root, key[:2], key)
+
+    async def save(
+        self,
+        key: str,
+        body: Union[bytes, AsyncIterable[bytes]],
+        content_type: str,
+        size: Optional[int] = None,
+    ) -> str:
+        path = self.get_path(key)
+        # write to a temporary file first, so that a media is never served
+        # partially written.
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await anyio.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            async with await anyio.open_file(temp_path, mode="wb") as file:
+                if isinstance(body, bytes):
+                    await file.write(body)
+                else:
+                    async for chunk in body:
+                        await file.write(chunk)
+            await anyio.Path(temp_path).replace(path)
+        except OSError as err:
+            raise StorageError(f"Failed to save {key}: {err!r}") from err
+        finally:
+            await anyio.Path(temp_path).unlink(missing_ok=True)
+        return key
+
+    async def delete(self, location: str, key: str) -> None:
+        try:
+            await anyio.Path(self.get_path(key)).unlink(missing_ok=True)
+        except OSError as err:
+            raise StorageError(f"Failed to delete {key}: {err!r}") from err
+
+    def get_url(self, location: str, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class PinataStorage(MediaStorage):
+    """
+    A backend pinning media to IPFS through Pinata, served by the app
+    from its gateway cache.
+    """
+
+    name = "pinata"
+
+    def __init__(self, client: pinata.PinataClient, base_url: str) -> None:
+        """
+        A constructor that sets the Pinata client and the media url.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            client (app.utils.pinata.PinataClient) : A Pinata client.
+            base_url (str) : The url media are served from.
+        """
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+
+    async def save(
+        self,
+        key: str,
+        body: Union[bytes, AsyncIterable[bytes]],
+        content_type: str,
+        size: Optional[int] = None,
+    ) -> str:
+        try:
+            return await self.client.pin_file(
+                body, filename=key, content_type=content_type, size=size
+            )
+        except pinata.PinataError as err:
+            raise StorageError(str(err)) from err
+
+    async def delete(self, location: str, key: str) -> None:
+        try:
+            await self.client.unpin(location)
+        except pinata.PinataError as err:
+            raise StorageError(str(err)) from err
+
+    def get_url(self, location: str, key: str) -> str:
+        return f"{self.base_url}/ipfs/{location}/{key}"
+
+
+def get_storage() -> MediaStorage:
+    """
+    Build the media storage backend set by `MEDIA_STORAGE`.
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        MediaStorage: The media storage backend.
+    """
+    app_settings = settings()
+    if app_settings.MEDIA_STORAGE == LocalStorage.name:
+        return LocalStorage(
+            app_settings.MEDIA_LOCAL_ROOT, app_settings.MEDIA_BASE_URL
+        )
+    if app_settings.MEDIA_STORAGE == PinataStorage.name:
+        return PinataStorage(pinata.pinata, app_settings.MEDIA_BASE_URL)
+    raise ValueError(f"Unknown media storage: {app_settings.MEDIA_STORAGE}!")
+
+
+storage = get_storage()
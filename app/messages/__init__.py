@@ -5,8 +5,9 @@ Messages package.
 from app.messages import (
     crud,
     models,
+    pipeline,
     router,
     schemas,
 )
 
-__all__ = ["crud", "models", "router", "schemas"]
+__all__ = ["crud", "models", "pipeline", "router", "schemas"]
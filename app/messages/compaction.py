@@ -0,0 +1,268 @@
+"""The messages compaction module.
+
+Roll the old messages into buckets with:
+
+    >>> python -m app.messages.compaction
+"""
+
+import asyncio
+import bson
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+)
+from odmantic import (
+    AIOEngine,
+)
+from odmantic.session import (
+    AIOSession,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+import zlib
+
+from app.config import (
+    settings,
+)
+from app.messages import (
+    models as messages_models,
+)
+from app.utils import (
+    engine as engine_utils,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def pack_messages(
+    conversation_id: ObjectId, documents: List[Dict[str, Any]], compress: bool
+) -> Dict[str, Any]:
+    """
+    Pack consecutive message documents into a bucket document.
+
+    Note:
+        The bucket id is the id of its first message, so packing the same
+        messages twice yields the same bucket.
+
+    Args:
+        conversation_id (bson.ObjectId) : The conversation of the messages.
+        documents (List[Dict[str, Any]]) : The messages, oldest first.
+        compress (bool) : Whether to compress the bucket data with zlib.
+
+    Returns:
+        Dict[str, Any]: The bucket document.
+    """
+    data = bson.encode({"messages": documents})
+    return {
+        "_id": documents[0]["_id"],
+        "conversation_id": conversation_id,
+        "start_date": documents[0]["creation_date"],
+        "end_date": documents[-1]["creation_date"],
+        "count": len(documents),
+        "compressed": compress,
+        "data": zlib.compress(data) if compress else data,
+    }
+
+
+def unpack_bucket(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Unpack the message documents of a bucket document.
+
+    Args:
+        document (Dict[str, Any]) : A bucket document.
+
+    Returns:
+        List[Dict[str, Any]]: The messages, oldest first.
+    """
+    data = bytes(document["data"])
+    if document.get("compressed"):
+        data = zlib.decompress(data)
+    return bson.decode(data)["messages"]
+
+
+async def read_cold_messages(
+    session: engine_utils.AnySession,
+    conversation_id: ObjectId,
+    position: Optional[Any],
+    before: bool,
+    count: int,
+) -> List[Dict[str, Any]]:
+    """
+    Read the bucketed messages of a conversation next to a cursor position,
+    unpacking one bucket at a time until enough messages are found.
+
+    Args:
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        conversation_id (bson.ObjectId) : A conversation id.
+        position (Tuple[datetime, bson.ObjectId]) : The cursor date and id, if any.
+        before (bool) : Read the messages before the position, else after.
+        count (int) : The max number of messages to read.
+
+    Returns:
+        List[Dict[str, Any]]: The message documents, in the reading order.
+    """
+    query: Dict[str, Any] = {"conversation_id": conversation_id}
+    if position:
+        if before:
+            query["start_date"] = {"$lte": position[0]}
+        else:
+            query["end_date"] = {"$gte": position[0]}
+    buckets = (
+        engine_utils.get_collection(session, messages_models.MessageBucket)
+        .find(query, session=engine_utils.get_driver_session(session))
+        .sort("start_date", -1 if before else 1)
+    )
+    messages: List[Dict[str, Any]] = []
+    async for bucket in buckets:
+        documents = unpack_bucket(bucket)
+        if before:
+            documents.reverse()
+        for document in documents:
+            key = (document["creation_date"], document["_id"])
+            if position and (key >= position if before else key <= position):
+                continue
+            messages.append(document)
+            if len(messages) == count:
+                return messages
+    return messages
+
+
+async def move_to_bucket(
+    engine: AIOEngine, bucket: Dict[str, Any], message_ids: List[ObjectId]
+) -> None:
+    """
+    Write a bucket and delete the messages it holds in a single
+    transaction, so that readers never see the messages twice, nor lose
+    them.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        bucket (Dict[str, Any]) : A bucket document.
+        message_ids (List[bson.ObjectId]) : The ids of its messages.
+    """
+    messages = engine.get_collection(messages_models.Message)
+    buckets = engine.get_collection(messages_models.MessageBucket)
+
+    async def write_bucket(session: AIOSession) -> None:
+        driver_session = engine_utils.get_driver_session(session)
+        await buckets.replace_one(
+            {"_id": bucket["_id"]}, bucket, upsert=True, session=driver_session
+        )
+        await messages.delete_many(
+            {"_id": {"$in": message_ids}}, session=driver_session
+        )
+
+    await engine_utils.run_in_transaction(engine, write_bucket)
+
+
+async def compact_conversation(
+    engine: AIOEngine,
+    conversation_id: ObjectId,
+    cutoff: datetime,
+    bucket_size: int,
+    compress: bool,
+) -> int:
+    """
+    Move the oldest read messages of a conversation into buckets.
+
+    Only the oldest run of read messages created before the cutoff is
+    compacted, in full buckets, so that the buckets always hold the start
+    of the history and the message collection the rest of it. A bucket is
+    written and its messages deleted in one transaction, under a
+    deterministic id, so that an interrupted run can be resumed.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        conversation_id (bson.ObjectId) : A conversation id.
+        cutoff (datetime.datetime) : Only messages created before are compacted.
+        bucket_size (int) : The number of messages per bucket.
+        compress (bool) : Whether to compress the buckets data with zlib.
+
+    Returns:
+        int: The number of compacted messages.
+    """
+    messages = engine.get_collection(messages_models.Message)
+    compacted = 0
+    documents: List[Dict[str, Any]] = []
+    async for document in messages.find(
+        {"conversation_id": conversation_id}
+    ).sort([("creation_date", 1), ("_id", 1)]):
+        if (
+            document["creation_date"] >= cutoff
+            or document["status"] != messages_models.MessageStatus.READ.value
+        ):
+            break
+        documents.append(document)
+        if len(documents) == bucket_size:
+            await move_to_bucket(
+                engine,
+                pack_messages(conversation_id, documents, compress),
+                [document["_id"] for document in documents],
+            )
+            compacted += len(documents)
+            documents = []
+    return compacted
+
+
+async def compact_messages(
+    engine: AIOEngine,
+    older_than: timedelta,
+    bucket_size: int,
+    compress: bool,
+) -> int:
+    """
+    Move the old read messages of every conversation into buckets.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        older_than (datetime.timedelta) : The age of the messages to compact.
+        bucket_size (int) : The number of messages per bucket.
+        compress (bool) : Whether to compress the buckets data with zlib.
+
+    Returns:
+        int: The number of compacted messages.
+    """
+    cutoff = datetime.utcnow() - older_than
+    conversations = engine.get_collection(messages_models.Conversation)
+    compacted = 0
+    async for conversation in conversations.find({}, {"_id": 1}):
+        compacted += await compact_conversation(
+            engine, conversation["_id"], cutoff, bucket_size, compress
+        )
+    logger.info("Compacted %s messages.", compacted)
+    return compacted
+
+
+async def run_compaction() -> None:
+    """
+    Connect to the configured database and compact the old messages.
+    """
+    app_settings = settings()
+    client = AsyncIOMotorClient(app_settings.db_url)
+    engine = AIOEngine(client=client, database=app_settings.database_name)
+    try:
+        await engine.configure_database([messages_models.MessageBucket])
+        await compact_messages(
+            engine,
+            timedelta(days=app_settings.MESSAGE_COLD_AFTER_DAYS),
+            app_settings.MESSAGE_BUCKET_SIZE,
+            app_settings.MESSAGE_BUCKET_COMPRESSION,
+        )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_compaction())
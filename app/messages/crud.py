@@ -7,43 +7,68 @@ from datetime import (
     datetime,
 )
 import logging
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
-import os
-from pinatapy import (
-    PinataPy,
-)
 from pydantic import (
     EmailStr,
 )
-from tempfile import (
-    NamedTemporaryFile,
+from pymongo import (
+    ReturnDocument,
+    UpdateOne,
+)
+from pymongo.errors import (
+    DuplicateKeyError,
 )
 from typing import (
     Any,
+    AsyncIterator,
     Dict,
+    List,
     Optional,
+    Tuple,
     Union,
 )
 
 from app.auth import (
     crud as auth_crud,
 )
-from app.config import (
-    settings,
+from app.media import (
+    crud as media_crud,
+    storage as media_storage,
 )
 from app.messages import (
+    compaction,
     models as messages_models,
     schemas as messages_schemas,
 )
 from app.users import (
     models as users_models,
+    schemas as users_schemas,
+)
+from app.utils import (
+    engine,
+    pagination,
+    uploads,
 )
 
 logger = logging.getLogger(__name__)
 
-pinata = PinataPy(settings().PINATA_API_KEY, settings().PINATA_API_SECRET)
+INBOX_PREVIEW_LENGTH = 100
+
+# relevance ordered results can only be paged by offset, which gets slower
+# the deeper it goes.
+SEARCH_MAX_OFFSET = 1000
+
+# the user fields needed by the users schema, leaving the password out.
+USER_DISPLAY_PROJECTION = {
+    field: 1
+    for field in users_schemas.UserObjectSchema.__fields__
+    if field != "id"
+}
 
 
 async def send_new_message(
@@ -55,6 +80,14 @@ async def send_new_message(
     """
     A method to create a message.
 
+    Note:
+        The conversation, the message and the inbox entries are written in
+        one transaction, committed before returning. It runs again on
+        transient errors, e.g. a write conflict with a concurrent send in
+        the same conversation, and when a concurrent send created the
+        conversation first. Media are stored beforehand, and released if
+        the message can't be written.
+
     Args:
         sender_id (str) : A user id for a given message sender.
         request (app.messages.schemas.MessageCreate) : A request schema object.
@@ -67,6 +100,7 @@ async def send_new_message(
     receiver = await auth_crud.find_existed_user(
         email=request.receiver, session=session
     )
+    variants: Dict[str, str] = {}
     if request.message_type == "media":
         if not request.media["preview"]:  # type: ignore
             return {
@@ -75,21 +109,20 @@ async def send_new_message(
             }
 
         try:
-            temp = NamedTemporaryFile(delete=False)
-            with temp as temp_file:
-                temp_file.write(file)  # type: ignore
-            result = pinata.pin_file_to_ipfs(temp.name)
-            image_url = f"https://ipfs.io/ipfs/{result['IpfsHash']}/{temp.name.split('/')[-1]}"  # noqa: E231
-            # create a new message
-            new_message = messages_models.Message(
-                content="", message_type="media", media=image_url, status=1
-            )
-
-        except Exception:
-            ...
-
-        finally:
-            os.remove(temp.name)
+            variants = await media_crud.store_image(file, session)  # type: ignore
+        except uploads.UploadError as err:
+            return {"status_code": err.status_code, "message": str(err)}
+        except media_storage.StorageError:
+            return {"status_code": 400, "message": "Something went wrong!"}
+        image_url = variants["full"]
+        # create a new message
+        new_message = messages_models.Message(
+            content="",
+            message_type="media",
+            media=image_url,
+            media_variants=variants,
+            status=1,
+        )
     else:
         if not request.content:
             return {
@@ -114,33 +147,34 @@ async def send_new_message(
             media="",
             status=1,
         )
-    await session.save(new_message)
-    # append the new message into the conversation list; check if conversation exists, first.
-    conversation = await session.find_one(
-        messages_models.Conversation,
-        messages_models.Conversation.sender == ObjectId(sender_id),
-        messages_models.Conversation.receiver == ObjectId(receiver.id),
-    )
-    if not conversation:
-        conversation = messages_models.Conversation(
-            sender=sender_id, receiver=receiver.id, messages=[new_message.id]
-        )
-    else:
-        messages = conversation.messages
-        messages.extend(
-            [
-                new_message.id,
-            ]
+
+    async def write_message(transaction: AIOSession) -> None:
+        # get or create the conversation first, so the message can refer
+        # to it.
+        conversation_id, seq = await upsert_conversation(
+            sender_id, receiver.id, new_message.creation_date, transaction  # type: ignore
         )
-        conversation.update(
+        new_message.update(
             {
+                "conversation_id": conversation_id,
                 "sender": ObjectId(sender_id),
-                "receiver": ObjectId(receiver.id),
-                "messages": messages,
-                "modified_date": datetime.utcnow(),
+                "seq": seq,
             }
         )
-    await session.save(conversation)
+        await engine.get_collection(
+            transaction, messages_models.Message
+        ).insert_one(
+            new_message.doc(), session=engine.get_driver_session(transaction)
+        )
+        await update_inbox_entries(new_message, receiver.id, transaction)
+
+    try:
+        await engine.run_in_transaction(
+            session, write_message, retry_on=(DuplicateKeyError,)
+        )
+    except Exception:
+        await media_crud.release_images(variants.values(), session)
+        raise
     if request.message_type == "media":
         return image_url
     return {
@@ -149,116 +183,763 @@ async def send_new_message(
     }
 
 
+def get_conversation_upsert(
+    sender_id: Union[str, ObjectId],
+    receiver_id: Union[str, ObjectId],
+    activity_date: datetime,
+    count: int = 1,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Build the filter and the update getting or creating the conversation of
+    two users, bumping its modified date and reserving sequence numbers.
+
+    Args:
+        sender_id (str | bson.ObjectId) : A user id for the message sender.
+        receiver_id (str | bson.ObjectId) : A user id for the message receiver.
+        activity_date (datetime.datetime) : The date of the new message.
+        count (int) : The number of new messages to number.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any]]: The filter and the update.
+    """
+    participants = sorted(
+        (ObjectId(sender_id), ObjectId(receiver_id)), key=str
+    )
+    return (
+        {"pair_id": messages_models.get_pair_id(sender_id, receiver_id)},
+        {
+            "$max": {"modified_date": activity_date},
+            "$inc": {"seq": count},
+            "$setOnInsert": {
+                "participants": participants,
+                "creation_date": activity_date,
+            },
+        },
+    )
+
+
+async def upsert_conversation(
+    sender_id: Union[str, ObjectId],
+    receiver_id: Union[str, ObjectId],
+    activity_date: datetime,
+    session: engine.AnySession,
+    count: int = 1,
+) -> Tuple[ObjectId, int]:
+    """
+    A method to get or create the conversation of two users, bump its
+    modified date and reserve sequence numbers, in a single atomic update.
+
+    Args:
+        sender_id (str | bson.ObjectId) : A user id for the message sender.
+        receiver_id (str | bson.ObjectId) : A user id for the message receiver.
+        activity_date (datetime.datetime) : The date of the new message.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        count (int) : The number of new messages to number.
+
+    Returns:
+        Tuple[bson.ObjectId, int]: The conversation id and its last sequence
+        number, the new messages being numbered up to it.
+    """
+    collection = engine.get_collection(session, messages_models.Conversation)
+    query, update = get_conversation_upsert(
+        sender_id, receiver_id, activity_date, count
+    )
+    arguments: Dict[str, Any] = {
+        "filter": query,
+        "update": update,
+        "projection": {"_id": 1, "seq": 1},
+        "upsert": True,
+        "return_document": ReturnDocument.AFTER,
+        "session": engine.get_driver_session(session),
+    }
+    try:
+        conversation = await collection.find_one_and_update(**arguments)
+    except DuplicateKeyError:
+        # a concurrent send inserted the conversation first. A transaction
+        # is aborted by the error, it must be run again as a whole.
+        if engine.in_transaction(session):
+            raise
+        conversation = await collection.find_one_and_update(**arguments)
+    return conversation["_id"], conversation["seq"]
+
+
+def get_inbox_updates(
+    message: messages_models.Message,
+    receiver_id: ObjectId,
+    sender_unread: int = 0,
+    receiver_unread: int = 1,
+) -> List[UpdateOne]:
+    """
+    Build the upserts setting a message as the last one of the inbox
+    entries of both its users.
+
+    Args:
+        message (app.messages.models.Message) : The last message.
+        receiver_id (bson.ObjectId) : The id of the message receiver.
+        sender_unread (int) : The messages to add to the sender unread count.
+        receiver_unread (int) : The messages to add to the receiver unread count.
+
+    Returns:
+        List[pymongo.UpdateOne]: The inbox bulk write operations.
+    """
+    last_message = {
+        "conversation_id": message.conversation_id,
+        "preview": message.content[:INBOX_PREVIEW_LENGTH],
+        "message_type": message.message_type,
+        "last_activity": message.creation_date,
+    }
+    return [
+        UpdateOne(
+            {"owner": message.sender, "partner": receiver_id},
+            {"$set": last_message, "$inc": {"unread_count": sender_unread}},
+            upsert=True,
+        ),
+        UpdateOne(
+            {"owner": receiver_id, "partner": message.sender},
+            {"$set": last_message, "$inc": {"unread_count": receiver_unread}},
+            upsert=True,
+        ),
+    ]
+
+
+async def update_inbox_entries(
+    message: messages_models.Message,
+    receiver_id: ObjectId,
+    session: engine.AnySession,
+) -> None:
+    """
+    A method to bump the inbox entries of both users of a new message, in
+    a single bulk write.
+
+    Args:
+        message (app.messages.models.Message) : The new message.
+        receiver_id (bson.ObjectId) : The id of the message receiver.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+    """
+    await engine.get_collection(
+        session, messages_models.InboxEntry
+    ).bulk_write(
+        get_inbox_updates(message, receiver_id),
+        ordered=False,
+        session=engine.get_driver_session(session),
+    )
+
+
+async def get_inbox(
+    owner_id: str,
+    session: engine.AnySession,
+    before: Optional[str] = None,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """
+    A method to get a page of the inbox of a user, latest activity first.
+
+    Args:
+        owner_id (str) : A user id for the inbox owner.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        before (str) : A cursor to get the entries active before.
+        limit (int) : The max number of entries to return.
+
+    Returns:
+        Dict[str, Any]: A Response schema dict.
+    """
+    queries: List[Any] = [
+        messages_models.InboxEntry.owner == ObjectId(owner_id)
+    ]
+    if before:
+        try:
+            position = pagination.decode_cursor(before)
+        except ValueError as err:
+            return {"status_code": 400, "message": str(err)}
+        queries.append(
+            pagination.get_cursor_query(
+                "last_activity", *position, before=True
+            )
+        )
+    page = await session.find(
+        messages_models.InboxEntry,
+        *queries,
+        sort=(
+            messages_models.InboxEntry.last_activity.desc(),
+            messages_models.InboxEntry.id.desc(),
+        ),
+        limit=limit + 1,
+    )
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = pagination.encode_cursor(
+            page[-1].last_activity, page[-1].id  # type: ignore
+        )
+    entries = []
+    for entry in page:
+        entry_dict = entry.dict()
+        for field in ("id", "owner", "partner", "conversation_id"):
+            entry_dict[field] = str(entry_dict[field])
+        entries.append(entry_dict)
+    return {"status_code": 200, "result": entries, "next_cursor": next_cursor}
+
+
 async def get_sender_receiver_messages(
-    sender_id: str, receiver: EmailStr, session: AIOSession
+    sender_id: str,
+    receiver: EmailStr,
+    session: AIOSession,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
 ) -> Dict[str, Any]:
     """
-    A method to create a message.
+    A method to get a page of the messages exchanged by two users.
+
+    Note:
+        Without a cursor, the latest messages are returned. The next cursor
+        pages further in the same direction, i.e. it is passed as `before`
+        again unless the page was requested with `after`.
 
     Args:
         sender_id (str) : A user id for a given message sender.
         receiver (pydantic.EmailStr) : A given receiver email address.
         session (odmantic.session.AIOSession) : odmantic session object.
+        before (str) : A cursor to get the messages sent before.
+        after (str) : A cursor to get the messages sent after.
+        limit (int) : The max number of messages to return.
 
     Returns:
         Dict[str, Any]: A Response schema dict.
     """
+    if before and after:
+        return {
+            "status_code": 400,
+            "message": "You can't page both before and after a message!",
+        }
+    cursor = before or after
+    try:
+        position = pagination.decode_cursor(cursor) if cursor else None
+    except ValueError as err:
+        return {"status_code": 400, "message": str(err)}
     receiver = await auth_crud.find_existed_user(
         email=receiver, session=session
     )
-    conversation_sent = await session.find_one(
+    conversation = await session.find_one(
         messages_models.Conversation,
-        messages_models.Conversation.sender == sender_id,
-        messages_models.Conversation.receiver == receiver.id,
+        messages_models.Conversation.pair_id
+        == messages_models.get_pair_id(sender_id, receiver.id),
     )
-    messages_sent = []
-    messages_received = []
-    if conversation_sent:
-        messages_sent_ids = conversation_sent.messages
-        messages_sent_objects = await session.find(
-            messages_models.Message,
-            messages_models.Message.id.in_(messages_sent_ids),
+    if not conversation:
+        return {"status_code": 200, "result": [], "next_cursor": None}
+    queries: List[Any] = [
+        messages_models.Message.conversation_id == conversation.id
+    ]
+    if position:
+        queries.append(
+            pagination.get_cursor_query(
+                "creation_date", *position, before=not after
+            )
         )
-        for message in messages_sent_objects:
-            message_dict = message.dict()
-            message_dict["type"] = "sent"
-            message_dict["id"] = str(message_dict["id"])
-            messages_sent.append(message_dict)
-    conversation_received = await session.find_one(
+    if after:
+        sort = (
+            messages_models.Message.creation_date.asc(),
+            messages_models.Message.id.asc(),
+        )
+    else:
+        sort = (
+            messages_models.Message.creation_date.desc(),
+            messages_models.Message.id.desc(),
+        )
+    # the oldest messages may be packed in buckets, which hold the start of
+    # the history: paging forward reads them first, paging back reads them
+    # last. Hot messages are a range scan on the
+    # conversation_creation_date_id index, fetching one extra message to
+    # know whether there is a next page.
+    page: List[messages_models.Message] = []
+    if after:
+        page.extend(
+            messages_models.Message.parse_doc(document)
+            for document in await compaction.read_cold_messages(
+                session, conversation.id, position, False, limit + 1
+            )
+        )
+    if len(page) <= limit:
+        page.extend(
+            await session.find(
+                messages_models.Message,
+                *queries,
+                sort=sort,
+                limit=limit + 1 - len(page),
+            )
+        )
+    if not after and len(page) <= limit:
+        page.extend(
+            messages_models.Message.parse_doc(document)
+            for document in await compaction.read_cold_messages(
+                session, conversation.id, position, True, limit + 1 - len(page)
+            )
+        )
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = pagination.encode_cursor(
+            page[-1].creation_date, page[-1].id  # type: ignore
+        )
+    if not after:
+        page.reverse()
+    messages = []
+    for message in page:
+        message_dict = message.dict()
+        message_dict["type"] = (
+            "sent" if message.sender == ObjectId(sender_id) else "received"
+        )
+        message_dict["id"] = str(message_dict["id"])
+        message_dict["conversation_id"] = str(message_dict["conversation_id"])
+        message_dict["sender"] = str(message_dict["sender"])
+        messages.append(message_dict)
+    results = {
+        "status_code": 200,
+        "result": messages,
+        "next_cursor": next_cursor,
+    }
+    return results
+
+
+async def export_messages(
+    sender_id: str,
+    receiver: EmailStr,
+    session: engine.AnySession,
+    batch_size: int = 500,
+) -> AsyncIterator[bytes]:
+    """
+    A method to stream the whole history of the messages exchanged by two
+    users as newline delimited json, oldest first.
+
+    Note:
+        Messages are read and sent `batch_size` at a time, cold buckets
+        first then hot messages through a single cursor, so memory use
+        doesn't grow with the history size.
+
+    Args:
+        sender_id (str) : A user id for a given message sender.
+        receiver (pydantic.EmailStr) : A given receiver email address.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        batch_size (int) : The number of messages per chunk.
+
+    Yields:
+        bytes: Chunks of json lines, one line per message.
+    """
+    receiver_user = await auth_crud.find_existed_user(
+        email=receiver, session=session
+    )
+    if not receiver_user:
+        return
+    conversation = await session.find_one(
         messages_models.Conversation,
-        messages_models.Conversation.sender == receiver.id,
-        messages_models.Conversation.receiver == sender_id,
+        messages_models.Conversation.pair_id
+        == messages_models.get_pair_id(sender_id, receiver_user.id),
+    )
+    if not conversation:
+        return
+    driver_session = engine.get_driver_session(session)
+    buckets = (
+        engine.get_collection(session, messages_models.MessageBucket)
+        .find({"conversation_id": conversation.id}, session=driver_session)
+        .sort("start_date", 1)
+        .batch_size(1)
+    )
+    hot_messages = (
+        engine.get_collection(session, messages_models.Message)
+        .find({"conversation_id": conversation.id}, session=driver_session)
+        .sort([("creation_date", 1), ("_id", 1)])
+        .batch_size(batch_size)
     )
-    if conversation_received:
-        messages_received_ids = conversation_received.messages
-        messages_sent_objects = await session.find(
-            messages_models.Message,
-            messages_models.Message.id.in_(messages_received_ids),
+    lines: List[bytes] = []
+    async for bucket in buckets:
+        for document in compaction.unpack_bucket(bucket):
+            lines.append(
+                messages_models.Message.parse_doc(document).json().encode()
+            )
+            if len(lines) == batch_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+    async for document in hot_messages:
+        lines.append(
+            messages_models.Message.parse_doc(document).json().encode()
+        )
+        if len(lines) == batch_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def sync_messages(
+    user_id: str,
+    session: engine.AnySession,
+    since: Optional[str] = None,
+    limit: int = 200,
+) -> Dict[str, Any]:
+    """
+    A method to get the messages sent and the read marks changed after a
+    client watermark across all the conversations of a user.
+
+    Note:
+        The cursor holds the last sequence number synced in each
+        conversation. Only the conversations whose sequence number moved
+        past it are read, their new messages in (conversation_id, seq)
+        order, along with their read marks. A conversation number only
+        becomes visible once its message is committed, and the cursor never
+        moves backwards.
+
+    Args:
+        user_id (str) : A user id.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        since (str) : The cursor returned by the previous sync, if any.
+        limit (int) : The max number of messages to return.
+
+    Returns:
+        Dict[str, Any]: A Response schema dict.
+    """
+    try:
+        synced = pagination.decode_seq_cursor(since) if since else {}
+    except ValueError as err:
+        return {"status_code": 400, "message": str(err)}
+    driver_session = engine.get_driver_session(session)
+    conversations = (
+        await engine.get_collection(session, messages_models.Conversation)
+        .find(
+            {"participants": ObjectId(user_id)},
+            {"seq": 1, "read_seqs": 1},
+            session=driver_session,
         )
-        for message in messages_sent_objects:
-            message_dict = message.dict()
-            message_dict["type"] = "received"
-            message_dict["id"] = str(message_dict["id"])
-            # Mark received message as read
-            message_dict["status"] = 0
-            messages_received.append(message_dict)
-            # pop the id to fix ValueError: Updating the primary key is not supported.
-            message_dict.pop("id")
-            message.update(message_dict)
-            await session.save(message)
-        messages_sent.extend(messages_received)
-    messages = sorted(
-        messages_sent, key=lambda message_dict: message_dict["creation_date"]
+        .sort("_id", 1)
+        .to_list(None)
     )
-    results = {"status_code": 200, "result": messages}
-    return results
+    changed = [
+        conversation
+        for conversation in conversations
+        if conversation.get("seq", 0) > synced.get(conversation["_id"], 0)
+    ]
+    page: List[Dict[str, Any]] = []
+    if changed:
+        page = (
+            await engine.get_collection(session, messages_models.Message)
+            .find(
+                {
+                    "$or": [
+                        {
+                            "conversation_id": conversation["_id"],
+                            "seq": {
+                                "$gt": synced.get(conversation["_id"], 0),
+                                "$lte": conversation["seq"],
+                            },
+                        }
+                        for conversation in changed
+                    ]
+                },
+                session=driver_session,
+            )
+            .sort([("conversation_id", 1), ("seq", 1)])
+            .limit(limit + 1)
+            .to_list(None)
+        )
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_synced = {
+        conversation["_id"]: synced.get(conversation["_id"], 0)
+        for conversation in conversations
+    }
+    read_receipts: List[Dict[str, Any]] = []
+    for conversation in changed:
+        if has_more and conversation["_id"] > page[-1]["conversation_id"]:
+            break
+        if has_more and conversation["_id"] == page[-1]["conversation_id"]:
+            # the page ends within this conversation, resume after it.
+            next_synced[conversation["_id"]] = page[-1]["seq"]
+        else:
+            next_synced[conversation["_id"]] = conversation["seq"]
+        read_receipts.extend(
+            {
+                "conversation_id": str(conversation["_id"]),
+                "reader": reader,
+                "seq": seq,
+            }
+            for reader, seq in conversation.get("read_seqs", {}).items()
+        )
+    messages = []
+    for document in page:
+        message_dict = messages_models.Message.parse_doc(document).dict()
+        message_dict["type"] = (
+            "sent"
+            if message_dict["sender"] == ObjectId(user_id)
+            else "received"
+        )
+        for field in ("id", "conversation_id", "sender"):
+            message_dict[field] = str(message_dict[field])
+        messages.append(message_dict)
+    return {
+        "status_code": 200,
+        "result": messages,
+        "read_receipts": read_receipts,
+        "next_cursor": pagination.encode_seq_cursor(next_synced),
+        "has_more": has_more,
+    }
 
 
-async def get_all_users_messages(
-    sender_id: str, session: AIOSession
+async def search_messages(
+    user_id: str,
+    terms: str,
+    session: engine.AnySession,
+    cursor: Optional[str] = None,
+    limit: int = 20,
 ) -> Dict[str, Any]:
     """
-    A method to get all users sent messages to the authenticated user.
+    A method to search the content of the messages of all the conversations
+    of a user, the most relevant first.
+
+    Note:
+        The search uses the `content_text_index` text index, which only
+        covers the hot messages: messages compacted into cold buckets are
+        not searchable and never returned.
 
     Args:
-        sender_id (str) : A user id for a given message sender.
-        session (odmantic.session.AIOSession) : odmantic session object.
+        user_id (str) : A user id.
+        terms (str) : The search terms, in the mongodb text search syntax.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+        cursor (str) : The cursor returned by the previous page, if any.
+        limit (int) : The max number of messages to return.
 
     Returns:
         Dict[str, Any]: A Response schema dict.
     """
-    conversations_sent = await session.find(
-        messages_models.Conversation,
-        messages_models.Conversation.sender == sender_id,
+    try:
+        offset = pagination.decode_offset_cursor(cursor) if cursor else 0
+    except ValueError as err:
+        return {"status_code": 400, "message": str(err)}
+    if offset >= SEARCH_MAX_OFFSET:
+        return {"status_code": 400, "message": "Search is too deep!"}
+    driver_session = engine.get_driver_session(session)
+    conversation_ids = await engine.get_collection(
+        session, messages_models.Conversation
+    ).distinct(
+        "_id", {"participants": ObjectId(user_id)}, session=driver_session
     )
-    conversations_received = await session.find(
-        messages_models.Conversation,
-        messages_models.Conversation.receiver == sender_id,
+    score = {"$meta": "textScore"}
+    page = (
+        await engine.get_collection(session, messages_models.Message)
+        .find(
+            {
+                "$text": {"$search": terms},
+                "conversation_id": {"$in": conversation_ids},
+            },
+            {"score": score},
+            session=driver_session,
+        )
+        .sort([("score", score), ("_id", -1)])
+        .skip(offset)
+        .limit(limit + 1)
+        .to_list(None)
     )
-    users_sent = []
-    users_received = []
-    if conversations_sent:
-        conversations_sent_ids = [
-            str(conversation.receiver) for conversation in conversations_sent
-        ]
-        for conversation in conversations_sent:
-            receiver = await session.find_one(
-                users_models.User,
-                users_models.User.id == conversation.receiver,
+    next_cursor = None
+    if len(page) > limit and offset + limit < SEARCH_MAX_OFFSET:
+        next_cursor = pagination.encode_offset_cursor(offset + limit)
+    messages = []
+    for document in page[:limit]:
+        relevance = document.pop("score")
+        message_dict = messages_models.Message.parse_doc(document).dict()
+        message_dict["type"] = (
+            "sent"
+            if message_dict["sender"] == ObjectId(user_id)
+            else "received"
+        )
+        for field in ("id", "conversation_id", "sender"):
+            message_dict[field] = str(message_dict[field])
+        message_dict["score"] = relevance
+        messages.append(message_dict)
+    return {"status_code": 200, "result": messages, "next_cursor": next_cursor}
+
+
+def get_unread_high_water_mark(
+    messages: List[Dict[str, Any]]
+) -> Optional[Tuple[ObjectId, ObjectId, int]]:
+    """
+    Find the newest unread received message of a chronological page.
+
+    Args:
+        messages (List[Dict[str, Any]]) : A page of message dicts.
+
+    Returns:
+        Optional[Tuple[bson.ObjectId, bson.ObjectId, int]]: The conversation
+        id, the sender id and the sequence number of the newest unread
+        received message.
+    """
+    for message in reversed(messages):
+        if (
+            message["type"] == "received"
+            and message["status"] == messages_models.MessageStatus.NOT_READ
+            and message.get("seq") is not None
+        ):
+            return (
+                ObjectId(message["conversation_id"]),
+                ObjectId(message["sender"]),
+                message["seq"],
             )
-            user = receiver.dict()
-            user["id"] = str(user["id"])
-            users_sent.append(user)
-    if conversations_received:
-        for conversation in conversations_received:
-            sender = await session.find_one(
-                users_models.User, users_models.User.id == conversation.sender
+    return None
+
+
+async def mark_messages_as_read(
+    conversation_id: ObjectId,
+    sender_id: ObjectId,
+    reader_id: ObjectId,
+    until: int,
+    session: Union[AIOEngine, AIOSession],
+) -> int:
+    """
+    A method to mark the messages of a conversation sent by a user as read,
+    up to a sequence number, in a single update, and decrement the reader
+    unread count.
+
+    Note:
+        The read takes the next sequence number of the conversation, along
+        with the reader read mark, so that it is picked up by the next sync
+        of both participants. The three writes are committed in a single
+        transaction, so the unread count never drifts from the messages.
+
+    Args:
+        conversation_id (bson.ObjectId) : A conversation id.
+        sender_id (bson.ObjectId) : The id of the user who sent the messages.
+        reader_id (bson.ObjectId) : The id of the user who read the messages.
+        until (int) : The sequence number of the newest message to mark.
+        session (odmantic.AIOEngine | odmantic.session.AIOSession) : odmantic engine or session object.
+
+    Returns:
+        int: The number of messages marked as read.
+    """
+
+    async def write_read(transaction: AIOSession) -> int:
+        driver_session = engine.get_driver_session(transaction)
+        result = await engine.get_collection(
+            transaction, messages_models.Message
+        ).update_many(
+            {
+                "conversation_id": conversation_id,
+                "seq": {"$lte": until},
+                "sender": sender_id,
+                "status": messages_models.MessageStatus.NOT_READ.value,
+            },
+            {
+                "$set": {
+                    "status": messages_models.MessageStatus.READ.value,
+                    "modified_date": datetime.utcnow(),
+                }
+            },
+            session=driver_session,
+        )
+        if result.modified_count:
+            await engine.get_collection(
+                transaction, messages_models.InboxEntry
+            ).update_one(
+                {"owner": reader_id, "partner": sender_id},
+                {"$inc": {"unread_count": -result.modified_count}},
+                session=driver_session,
+            )
+            await engine.get_collection(
+                transaction, messages_models.Conversation
+            ).update_one(
+                {"_id": conversation_id},
+                {
+                    "$inc": {"seq": 1},
+                    "$max": {f"read_seqs.{reader_id}": until},
+                },
+                session=driver_session,
             )
-            user = sender.dict()
-            user["id"] = str(user["id"])
-            if user["id"] not in conversations_sent_ids:
-                users_received.append(user)
-    users_sent.extend(users_received)
-    users = sorted(users_sent, key=lambda user: user["first_name"])
+        return result.modified_count
+
+    return await engine.run_in_transaction(session, write_read)
+
+
+async def mark_conversation_as_read(
+    reader_id: str, message_id: str, session: Union[AIOEngine, AIOSession]
+) -> Dict[str, Any]:
+    """
+    A method to mark the received messages as read up to a given message.
+
+    Args:
+        reader_id (str) : A user id for the receiver of the messages.
+        message_id (str) : The id of the newest message to mark as read.
+        session (odmantic.AIOEngine | odmantic.session.AIOSession) : odmantic engine or session object.
+
+    Returns:
+        Dict[str, Any]: A Response schema dict.
+    """
+    if not ObjectId.is_valid(message_id):
+        return {"status_code": 400, "message": "Invalid message id!"}
+    message = await session.find_one(
+        messages_models.Message,
+        messages_models.Message.id == ObjectId(message_id),
+    )
+    conversation = (
+        message
+        and message.sender != ObjectId(reader_id)
+        and await session.find_one(
+            messages_models.Conversation,
+            messages_models.Conversation.id == message.conversation_id,
+            {"participants": ObjectId(reader_id)},
+        )
+    )
+    if not conversation:
+        return {"status_code": 404, "message": "Message not found!"}
+    await mark_messages_as_read(
+        conversation.id,
+        message.sender,  # type: ignore
+        ObjectId(reader_id),
+        message.seq,  # type: ignore
+        session,
+    )
+    return {
+        "status_code": 200,
+        "message": "Your messages have been marked as read!",
+    }
+
+
+async def get_all_users_messages(
+    sender_id: str, session: engine.AnySession
+) -> Dict[str, Any]:
+    """
+    A method to get all users sent messages to the authenticated user, in
+    two queries whatever the number of conversations.
+
+    Args:
+        sender_id (str) : A user id for a given message sender.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
+
+    Returns:
+        Dict[str, Any]: A Response schema dict.
+    """
+    driver_session = engine.get_driver_session(session)
+    # the server de-duplicates the participants of all the conversations.
+    participants = await engine.get_collection(
+        session, messages_models.Conversation
+    ).distinct(
+        "participants",
+        {"participants": ObjectId(sender_id)},
+        session=driver_session,
+    )
+    partner_ids = [
+        participant
+        for participant in participants
+        if participant != ObjectId(sender_id)
+    ]
+    users = []
+    if partner_ids:
+        cursor = (
+            engine.get_collection(session, users_models.User)
+            .find(
+                {"_id": {"$in": partner_ids}},
+                USER_DISPLAY_PROJECTION,
+                session=driver_session,
+            )
+            .sort("first_name", 1)
+        )
+        async for user in cursor:
+            user["id"] = str(user.pop("_id"))
+            users.append(user)
     results = {"status_code": 200, "result": users}
     return results
@@ -0,0 +1,294 @@
+"""The messages migrations module.
+
+Run the pending migrations with:
+
+    >>> python -m app.messages.migrations
+"""
+
+import asyncio
+import logging
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+)
+from odmantic import (
+    AIOEngine,
+    Model,
+)
+from pymongo import (
+    ReturnDocument,
+    UpdateOne,
+)
+from typing import (
+    List,
+    Type,
+)
+
+from app.config import (
+    settings,
+)
+from app.messages import (
+    crud as messages_crud,
+    models as messages_models,
+)
+
+logger = logging.getLogger(__name__)
+
+LEGACY_CONVERSATION_INDEXES = ("sender_1", "receiver_1")
+
+
+async def backfill_conversation_ids(
+    engine: AIOEngine, batch_size: int = 500
+) -> int:
+    """
+    Move the legacy `Conversation.messages` id arrays onto the messages.
+
+    Every message listed in a conversation array gets its `conversation_id`
+    set, then the array is unset. The migration is resumable: a conversation
+    loses its array only once all of its messages are tagged, so an
+    interrupted run picks up where it stopped.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of messages tagged per update.
+
+    Returns:
+        int: The number of migrated conversations.
+    """
+    conversations = engine.get_collection(messages_models.Conversation)
+    messages = engine.get_collection(messages_models.Message)
+    migrated = 0
+    async for conversation in conversations.find(
+        {"messages": {"$exists": True}}, {"messages": 1}
+    ):
+        message_ids = conversation.get("messages") or []
+        for start in range(0, len(message_ids), batch_size):
+            batch = message_ids[start:][:batch_size]
+            await messages.update_many(
+                {"_id": {"$in": batch}},
+                {"$set": {"conversation_id": conversation["_id"]}},
+            )
+        await conversations.update_one(
+            {"_id": conversation["_id"]}, {"$unset": {"messages": ""}}
+        )
+        migrated += 1
+    logger.info("Backfilled %s conversations.", migrated)
+    return migrated
+
+
+async def merge_pair_conversations(
+    engine: AIOEngine, batch_size: int = 500
+) -> int:
+    """
+    Merge the legacy per-direction conversations into one conversation per
+    pair of users.
+
+    Each legacy (sender, receiver) conversation is upserted into the
+    canonical conversation of its pair, its messages are moved over and
+    tagged with their sender, then it is deleted, its messages being
+    numbered afterwards by `number_messages`. The migration is resumable:
+    every step is idempotent and a legacy conversation is only deleted once
+    its messages are moved.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of legacy conversations read per batch.
+
+    Returns:
+        int: The number of merged legacy conversations.
+    """
+    conversations = engine.get_collection(messages_models.Conversation)
+    messages = engine.get_collection(messages_models.Message)
+    for index_name in LEGACY_CONVERSATION_INDEXES:
+        if index_name in await conversations.index_information():
+            await conversations.drop_index(index_name)
+    merged = 0
+    async for legacy in conversations.find(
+        {"pair_id": {"$exists": False}}
+    ).batch_size(batch_size):
+        canonical = await conversations.find_one_and_update(
+            {
+                "pair_id": messages_models.get_pair_id(
+                    legacy["sender"], legacy["receiver"]
+                )
+            },
+            {
+                "$setOnInsert": {
+                    "participants": sorted(
+                        (legacy["sender"], legacy["receiver"]), key=str
+                    )
+                },
+                "$min": {
+                    "creation_date": legacy.get("creation_date")
+                    or legacy["_id"].generation_time
+                },
+                "$max": {
+                    "modified_date": legacy.get("modified_date")
+                    or legacy["_id"].generation_time
+                },
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await messages.update_many(
+            {"conversation_id": legacy["_id"]},
+            {
+                "$set": {
+                    "conversation_id": canonical["_id"],
+                    "sender": legacy["sender"],
+                }
+            },
+        )
+        await conversations.delete_one({"_id": legacy["_id"]})
+        merged += 1
+    logger.info("Merged %s legacy conversations.", merged)
+    return merged
+
+
+async def number_messages(engine: AIOEngine, batch_size: int = 500) -> int:
+    """
+    Give the messages without a sequence number the next numbers of their
+    conversation, oldest first, so that they are picked up by the sync.
+
+    Each batch reserves its range with one atomic increment of the
+    conversation sequence number, then sets the numbers of the messages
+    still missing one. The migration is resumable: an interrupted batch
+    only leaves a gap in the numbers.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of messages numbered per update.
+
+    Returns:
+        int: The number of numbered messages.
+    """
+    conversations = engine.get_collection(messages_models.Conversation)
+    messages = engine.get_collection(messages_models.Message)
+    numbered = 0
+    async for conversation in conversations.find(
+        {"pair_id": {"$exists": True}}, {"_id": 1}
+    ).batch_size(batch_size):
+        while True:
+            batch = await (
+                messages.find(
+                    {"conversation_id": conversation["_id"], "seq": None},
+                    {"_id": 1},
+                )
+                .sort([("creation_date", 1), ("_id", 1)])
+                .limit(batch_size)
+                .to_list(None)
+            )
+            if not batch:
+                break
+            reserved = await conversations.find_one_and_update(
+                {"_id": conversation["_id"]},
+                {"$inc": {"seq": len(batch)}},
+                projection={"seq": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            first_seq = reserved["seq"] - len(batch) + 1
+            await messages.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": message["_id"], "seq": None},
+                        {"$set": {"seq": seq}},
+                    )
+                    for seq, message in enumerate(batch, start=first_seq)
+                ],
+                ordered=False,
+            )
+            numbered += len(batch)
+    logger.info("Numbered %s messages.", numbered)
+    return numbered
+
+
+async def rebuild_inbox(engine: AIOEngine, batch_size: int = 500) -> int:
+    """
+    Build the inbox entries of both participants of every conversation from
+    its messages.
+
+    Entries are recomputed from scratch, so the migration can be re-run
+    and resumed safely.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+        batch_size (int) : The number of conversations read per batch.
+
+    Returns:
+        int: The number of conversations whose entries were rebuilt.
+    """
+    conversations = engine.get_collection(messages_models.Conversation)
+    messages = engine.get_collection(messages_models.Message)
+    inbox = engine.get_collection(messages_models.InboxEntry)
+    preview_length = messages_crud.INBOX_PREVIEW_LENGTH
+    rebuilt = 0
+    async for conversation in conversations.find(
+        {"pair_id": {"$exists": True}}
+    ).batch_size(batch_size):
+        last_message = await messages.find_one(
+            {"conversation_id": conversation["_id"]},
+            sort=[("creation_date", -1), ("_id", -1)],
+        )
+        if not last_message:
+            continue
+        operations = []
+        for owner in conversation["participants"]:
+            partner = next(
+                participant
+                for participant in conversation["participants"]
+                if participant != owner
+            )
+            unread_count = await messages.count_documents(
+                {
+                    "conversation_id": conversation["_id"],
+                    "sender": partner,
+                    "status": messages_models.MessageStatus.NOT_READ.value,
+                }
+            )
+            operations.append(
+                UpdateOne(
+                    {"owner": owner, "partner": partner},
+                    {
+                        "$set": {
+                            "conversation_id": conversation["_id"],
+                            "preview": last_message["content"][
+                                :preview_length
+                            ],
+                            "message_type": last_message["message_type"],
+                            "last_activity": last_message["creation_date"],
+                            "unread_count": unread_count,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+        await inbox.bulk_write(operations, ordered=False)
+        rebuilt += 1
+    logger.info("Rebuilt the inbox of %s conversations.", rebuilt)
+    return rebuilt
+
+
+async def run_migrations() -> None:
+    """
+    Connect to the configured database and run the messages migrations.
+    """
+    app_settings = settings()
+    client = AsyncIOMotorClient(app_settings.db_url)
+    engine = AIOEngine(client=client, database=app_settings.database_name)
+    try:
+        await backfill_conversation_ids(engine)
+        await merge_pair_conversations(engine)
+        models: List[Type[Model]] = [
+            messages_models.Message,
+            messages_models.Conversation,
+            messages_models.InboxEntry,
+        ]
+        await engine.configure_database(models)
+        await number_messages(engine)
+        await rebuild_inbox(engine)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_migrations())
@@ -9,11 +9,19 @@ from datetime import (
 from enum import Enum
 from odmantic import (
     Field,
+    Index,
     Model,
 )
+from odmantic.query import (
+    desc,
+)
+import pymongo
 from typing import (
+    Dict,
+    Iterator,
     List,
     Optional,
+    Union,
 )
 
 
@@ -49,24 +57,193 @@ class Message(Model):
         Model (odmantic.Model): Odmantic base model.
     """
 
+    conversation_id: Optional[ObjectId] = Field(default=None)
+    sender: Optional[ObjectId] = Field(default=None)
+    seq: Optional[int] = Field(default=None)
     content: str
-    message_type: str = Field(index=True, default=MessageType.TEXT.value)
-    status: int = Field(index=True, default=MessageStatus.NOT_READ.value)
-    media: Optional[str] = Field(index=True)
+    message_type: str = Field(default=MessageType.TEXT.value)
+    status: int = Field(default=MessageStatus.NOT_READ.value)
+    media: Optional[str]
+    media_variants: Optional[Dict[str, str]] = Field(default=None)
     creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
     modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
+    class Config:
+        """
+        The Message Config class.
+        """
+
+        @staticmethod
+        def indexes() -> Iterator[Union[Index, pymongo.IndexModel]]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: compound indexes on the conversation_id, creation_date
+                    and id fields and on the conversation_id and seq fields,
+                    and a text index on the content field.
+            """
+            yield Index(
+                Message.conversation_id,
+                Message.creation_date,
+                Message.id,
+                name="conversation_creation_date_id_index",
+            )
+            yield Index(
+                Message.conversation_id,
+                Message.seq,
+                name="conversation_seq_index",
+            )
+            yield pymongo.IndexModel(
+                [("content", pymongo.TEXT)], name="content_text_index"
+            )
+
+
+class MessageBucket(Model):
+    """
+    The MessageBucket model, a consecutive run of old messages of a
+    conversation packed in a single document.
+
+    Args:
+        Model (odmantic.Model): Odmantic base model.
+    """
+
+    conversation_id: ObjectId
+    start_date: datetime
+    end_date: datetime
+    count: int
+    compressed: bool = False
+    data: bytes
+
+    class Config:
+        """
+        The MessageBucket Config class.
+        """
+
+        collection = "message_buckets"
+
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: a compound index on the conversation_id and start_date fields.
+            """
+            yield Index(
+                MessageBucket.conversation_id,
+                MessageBucket.start_date,
+                name="conversation_start_date_index",
+            )
+
 
 class Conversation(Model):
     """
-    The Conversation model
+    The Conversation model, one per unordered pair of users.
+
+    Note:
+        `seq` is the number of the last change of the conversation: every
+        message sent takes the next number, and so does every read of its
+        messages, recorded in `read_seqs` as the number of the last message
+        read by each participant.
 
     Args:
         Model (odmantic.Model): Odmantic base model.
     """
 
-    sender: ObjectId = Field(index=True)
-    receiver: ObjectId = Field(index=True)
-    messages: List[ObjectId] = []
+    pair_id: str
+    participants: List[ObjectId]
+    seq: int = 0
+    read_seqs: Dict[str, int] = {}
     creation_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
     modified_date: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        """
+        The Conversation Config class.
+        """
+
+        @staticmethod
+        def indexes() -> Iterator[Union[Index, pymongo.IndexModel]]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: a unique index on the pair id field, sparse as long as
+                    legacy conversations are not merged, and a compound
+                    index on the participants and modified date fields.
+            """
+            yield pymongo.IndexModel(
+                [("pair_id", pymongo.ASCENDING)],
+                unique=True,
+                sparse=True,
+                name="pair_id_index",
+            )
+            yield Index(
+                Conversation.participants,
+                desc(Conversation.modified_date),
+                name="participants_modified_date_index",
+            )
+
+
+class InboxEntry(Model):
+    """
+    The InboxEntry model, the chat list entry of a user for one partner.
+
+    Args:
+        Model (odmantic.Model): Odmantic base model.
+    """
+
+    owner: ObjectId
+    partner: ObjectId
+    conversation_id: ObjectId
+    preview: str = ""
+    message_type: str = Field(default=MessageType.TEXT.value)
+    unread_count: int = 0
+    last_activity: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        """
+        The InboxEntry Config class.
+        """
+
+        collection = "inbox"
+
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            """
+            Indexes definition.
+
+            Yields:
+                Index: a unique compound index on the owner and partner fields
+                    and a compound index on the owner, last activity and id
+                    fields.
+            """
+            yield Index(
+                InboxEntry.owner,
+                InboxEntry.partner,
+                unique=True,
+                name="owner_partner_index",
+            )
+            yield Index(
+                InboxEntry.owner,
+                desc(InboxEntry.last_activity),
+                desc(InboxEntry.id),
+                name="owner_last_activity_index",
+            )
+
+
+def get_pair_id(
+    first_id: Union[str, ObjectId], second_id: Union[str, ObjectId]
+) -> str:
+    """
+    Get the deterministic id of the conversation between two users.
+
+    Args:
+        first_id (str | bson.ObjectId) : A user id.
+        second_id (str | bson.ObjectId) : Another user id.
+
+    Returns:
+        str: The sorted user ids joined by a colon.
+    """
+    return ":".join(sorted((str(first_id), str(second_id))))
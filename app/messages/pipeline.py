@@ -0,0 +1,342 @@
+"""The messages pipeline module."""
+
+import asyncio
+from bson import (
+    ObjectId,
+)
+from collections import (
+    deque,
+)
+import logging
+from odmantic import (
+    AIOEngine,
+)
+from odmantic.session import (
+    AIOSession,
+)
+from pymongo.errors import (
+    DuplicateKeyError,
+)
+import time
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from app.config import (
+    settings,
+)
+from app.messages import (
+    crud as messages_crud,
+    models as messages_models,
+)
+from app.utils import (
+    engine as engine_utils,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PendingMessage(NamedTuple):
+    """
+    A message waiting to be persisted, along with its receiver id.
+    """
+
+    message: messages_models.Message
+    receiver_id: ObjectId
+
+
+class MessagePipeline:
+    """
+    A per worker write-behind queue persisting chat messages in batches.
+
+    Messages are buffered in a bounded queue and flushed at most every
+    `flush_interval` seconds or `batch_size` messages: one atomic upsert
+    per conversation, reserving the sequence numbers of its messages, one
+    `insert_many` of the messages and one bulk write of the inbox entries,
+    in a single transaction so that a sync never sees a reserved number
+    before its message. Senders wait once the queue is full.
+
+    A failed flush is retried with an exponential backoff. A batch still
+    failing is moved to a bounded dead letter queue, replayed before the
+    next batch, so that messages survive a database outage.
+    """
+
+    def __init__(
+        self,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        max_attempts: int = 3,
+        retry_backoff: float = 0.1,
+    ) -> None:
+        """
+        A constructor that sets the pipeline bounds.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            max_queue (int) : The max number of messages waiting to be persisted.
+            batch_size (int) : The max number of messages persisted per batch.
+            flush_interval (float) : Seconds to wait for a batch to fill up.
+            max_attempts (int) : Max attempts to persist a batch before dead-lettering it.
+            retry_backoff (float) : Seconds to wait before the first retry, doubled after.
+        """
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._engine: Optional[AIOEngine] = None
+        self._queue: Optional["asyncio.Queue[PendingMessage]"] = None
+        self._worker: Optional["asyncio.Task[None]"] = None
+        # the oldest dead letters are dropped once the queue is full.
+        self._dead_letters: Deque[PendingMessage] = deque(maxlen=max_queue)
+        self._counters = {
+            "enqueued": 0,
+            "persisted": 0,
+            "failed": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "batches": 0,
+            "blocked": 0,
+        }
+        self._last_batch_size = 0
+        self._flush_ms_max = 0.0
+
+    async def start(self, engine: AIOEngine) -> None:
+        """
+        Start the worker persisting the queued messages.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            engine (odmantic.AIOEngine) : The engine to persist messages with.
+        """
+        self._engine = engine
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Flush the queued messages, replay the dead letters once more and
+        stop the worker.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        if self._queue is None or self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._queue = self._worker = None
+        await self._replay_dead_letters()
+        if self._dead_letters:
+            logger.error(
+                "Lost %s messages that could not be persisted.",
+                len(self._dead_letters),
+            )
+
+    async def put(
+        self,
+        sender_id: Union[str, ObjectId],
+        receiver_id: Union[str, ObjectId],
+        content: str,
+        message_type: str = messages_models.MessageType.TEXT.value,
+    ) -> messages_models.Message:
+        """
+        Queue a text message, waiting while the queue is full.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            sender_id (str | bson.ObjectId) : A user id for the message sender.
+            receiver_id (str | bson.ObjectId) : A user id for the message receiver.
+            content (str) : The message content.
+            message_type (str) : The message type.
+
+        Raises:
+            RuntimeError: If the pipeline isn't started.
+
+        Returns:
+            app.messages.models.Message: The queued message.
+        """
+        if self._queue is None:
+            raise RuntimeError("The message pipeline isn't started!")
+        message = messages_models.Message(
+            content=content,
+            message_type=message_type,
+            media="",
+            status=messages_models.MessageStatus.NOT_READ.value,
+            sender=ObjectId(sender_id),
+        )
+        if self._queue.full():
+            self._counters["blocked"] += 1
+        await self._queue.put(PendingMessage(message, ObjectId(receiver_id)))
+        self._counters["enqueued"] += 1
+        return message
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+            started = time.perf_counter()
+            try:
+                await self._replay_dead_letters()
+                if await self._flush_with_retry(batch):
+                    self._counters["persisted"] += len(batch)
+                else:
+                    self._dead_letter(batch)
+            finally:
+                self._counters["batches"] += 1
+                self._last_batch_size = len(batch)
+                self._flush_ms_max = max(
+                    self._flush_ms_max, (time.perf_counter() - started) * 1000
+                )
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush_with_retry(self, batch: List[PendingMessage]) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self._flush(batch)
+                return True
+            except Exception as err:  # pylint: disable=W0703
+                self._counters["failed"] += 1
+                logger.error(
+                    "Failed to persist %s messages, attempt %s: %r",
+                    len(batch),
+                    attempt,
+                    err,
+                )
+            if attempt < self.max_attempts:
+                self._counters["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+        return False
+
+    def _dead_letter(self, batch: List[PendingMessage]) -> None:
+        dropped = max(0, len(self._dead_letters) + len(batch) - self.max_queue)
+        if dropped:
+            self._counters["dropped"] += dropped
+            logger.error("Dropped %s dead letter messages.", dropped)
+        self._dead_letters.extend(batch)
+        self._counters["dead_lettered"] += len(batch)
+
+    async def _replay_dead_letters(self) -> None:
+        while self._dead_letters:
+            batch = list(self._dead_letters)[: self.batch_size]
+            try:
+                await self._flush(batch)
+            except Exception as err:  # pylint: disable=W0703
+                self._counters["failed"] += 1
+                logger.error(
+                    "Failed to replay %s messages: %r", len(batch), err
+                )
+                return
+            for _ in batch:
+                self._dead_letters.popleft()
+            self._counters["persisted"] += len(batch)
+            self._counters["replayed"] += len(batch)
+
+    async def _flush(self, batch: List[PendingMessage]) -> None:
+        assert self._engine is not None
+        pairs: Dict[str, List[PendingMessage]] = {}
+        for pending in batch:
+            pair_id = messages_models.get_pair_id(
+                pending.message.sender, pending.receiver_id  # type: ignore
+            )
+            pairs.setdefault(pair_id, []).append(pending)
+
+        async def write_batch(session: AIOSession) -> None:
+            inbox_updates = []
+            # a session runs one query at a time, the pairs are upserted in
+            # turn, each reserving a range of sequence numbers.
+            for pendings in pairs.values():
+                conversation_id, last_seq = (
+                    await messages_crud.upsert_conversation(
+                        pendings[-1].message.sender,  # type: ignore
+                        pendings[-1].receiver_id,
+                        pendings[-1].message.creation_date,  # type: ignore
+                        session,
+                        count=len(pendings),
+                    )
+                )
+                first_seq = last_seq - len(pendings) + 1
+                for seq, pending in enumerate(pendings, start=first_seq):
+                    pending.message.update(
+                        {"conversation_id": conversation_id, "seq": seq}
+                    )
+                last = pendings[-1]
+                sent = sum(
+                    pending.message.sender == last.message.sender
+                    for pending in pendings
+                )
+                inbox_updates.extend(
+                    messages_crud.get_inbox_updates(
+                        last.message,
+                        last.receiver_id,
+                        sender_unread=len(pendings) - sent,
+                        receiver_unread=sent,
+                    )
+                )
+            driver_session = engine_utils.get_driver_session(session)
+            await engine_utils.get_collection(
+                session, messages_models.Message
+            ).insert_many(
+                [pending.message.doc() for pending in batch],
+                ordered=False,
+                session=driver_session,
+            )
+            await engine_utils.get_collection(
+                session, messages_models.InboxEntry
+            ).bulk_write(inbox_updates, ordered=False, session=driver_session)
+
+        await engine_utils.run_in_transaction(
+            self._engine, write_batch, retry_on=(DuplicateKeyError,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the pipeline counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, Any]: The queue size and the persistence counters.
+        """
+        return {
+            "max_queue": self.max_queue,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "dead_letters": len(self._dead_letters),
+            "last_batch_size": self._last_batch_size,
+            "flush_ms_max": round(self._flush_ms_max, 3),
+            **self._counters,
+        }
+
+
+pipeline = MessagePipeline(
+    max_queue=settings().MESSAGE_QUEUE_SIZE,
+    batch_size=settings().MESSAGE_BATCH_SIZE,
+    flush_interval=settings().MESSAGE_FLUSH_INTERVAL_MS / 1000,
+)
@@ -1,10 +1,21 @@
 """The messages router module"""
 
+from bson import (
+    ObjectId,
+)
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
+    Query,
     responses,
 )
+from fastapi.requests import (
+    Request,
+)
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
@@ -14,12 +25,16 @@ from pydantic import (
 from typing import (
     Any,
     Dict,
+    Optional,
     Union,
 )
 
 from app.auth import (
     schemas as auth_schemas,
 )
+from app.config import (
+    settings,
+)
 from app.messages import (
     crud as messages_crud,
     schemas as messages_schemas,
@@ -28,14 +43,11 @@ from app.users import (
     schemas as users_schemas,
 )
 from app.utils import (
+    cache,
     dependencies,
     jwt,
 )
 
-# deta = Deta(settings().DETA_PROJECT_KEY)
-
-# sent_images = deta.Drive("sent-images")
-
 router = APIRouter(prefix="/api/v1")
 
 
@@ -57,10 +69,8 @@ router = APIRouter(prefix="/api/v1")
 )
 async def send_message(
     request: messages_schemas.MessageCreate,
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Union[Dict[str, Any], str]:
     """
     Deliver a new message given an authenticated user.
@@ -84,42 +94,188 @@ async def send_message(
     },
 )
 async def get_conversation(
+    request: Request,
+    background_tasks: BackgroundTasks,
     receiver: EmailStr,
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_secondary_session),
 ) -> Dict[str, Any]:
     """
-    Return all messages grouped by senders for a given receiver.
+    Return a page of the messages exchanged with a given receiver, oldest
+    first, along with the cursor of the next page.
     """
     results = await messages_crud.get_sender_receiver_messages(
-        current_user.id, receiver, session
+        current_user.id, receiver, session, before, after, limit
+    )
+    high_water_mark = messages_crud.get_unread_high_water_mark(
+        results.get("result", [])
     )
+    if high_water_mark:
+        # mark the page as read once the response is sent, on the primary.
+        conversation_id, sender_id, until = high_water_mark
+        background_tasks.add_task(
+            messages_crud.mark_messages_as_read,
+            conversation_id,
+            sender_id,
+            ObjectId(current_user.id),
+            until,
+            request.app.state.engine,
+        )
     return results
 
 
-@router.get("/chat/images/user/{user_id}/{uuid_val}")
-async def get_sent_user_chat_images(
-    user_id: str, uuid_val: str
+@router.get(
+    "/message/export",
+    response_class=responses.StreamingResponse,
+    status_code=200,
+    name="messages:export",
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "Stream every message exchanged with a given"
+            " receiver as newline delimited json, oldest first.",
+        },
+    },
+)
+async def export_conversation(
+    receiver: EmailStr,
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
 ) -> responses.StreamingResponse:
     """
-    The get_sent_user_chat_images endpoint.
+    Export the whole conversation with a given receiver.
+    """
+    return responses.StreamingResponse(
+        messages_crud.export_messages(
+            current_user.id,
+            receiver,
+            session,
+            settings().MESSAGE_EXPORT_BATCH_SIZE,
+        ),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="messages.ndjson"'
+        },
+    )
 
-    Args:
-        user_id (id) : The id of the sender of the image.
-        uuid_val (str): A unique uuid generated upon upload.
 
-    Returns:
-        responses: return a response object for a given url(image).
+@router.get(
+    "/message/inbox",
+    response_model=messages_schemas.InboxResults,
+    status_code=200,
+    name="messages:get-inbox",
+    responses={
+        200: {
+            "model": messages_schemas.InboxResults,
+            "description": "Return a page of the chat list of the"
+            " authenticated user, latest activity first.",
+        },
+    },
+)
+async def get_inbox(
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> Dict[str, Any]:
     """
-    try:
-        # img = sent_images.get(f"/chat/images/user/{user_id}/{uuid_val}")
-        return responses.StreamingResponse(
-            [].iter_chunks(), media_type="image/png"  # type: ignore
-        )
-    except Exception:  # pylint: disable=W0703
-        return {"status_code": 400, "message": "Something went wrong!"}
+    Return a page of the inbox with the last message preview and the unread
+    count of every conversation.
+    """
+    results = await messages_crud.get_inbox(
+        current_user.id, session, before, limit
+    )
+    return results
+
+
+@router.get(
+    "/message/sync",
+    response_model=messages_schemas.SyncResults,
+    status_code=200,
+    name="messages:sync",
+    responses={
+        200: {
+            "model": messages_schemas.SyncResults,
+            "description": "Return the messages sent and the read marks"
+            " changed after a watermark across all the conversations.",
+        },
+    },
+)
+async def sync(
+    since: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> Dict[str, Any]:
+    """
+    Return the messages sent and the read marks changed since the
+    `next_cursor` of the previous sync, to catch up after reconnecting.
+    """
+    results = await messages_crud.sync_messages(
+        current_user.id, session, since, limit
+    )
+    return results
+
+
+@router.get(
+    "/message/search",
+    response_model=messages_schemas.GetAllMessageResults,
+    status_code=200,
+    name="messages:search",
+    responses={
+        200: {
+            "model": messages_schemas.GetAllMessageResults,
+            "description": "Return the messages matching the search terms,"
+            " the most relevant first. Messages compacted into cold buckets"
+            " are not searchable.",
+        },
+    },
+)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> Dict[str, Any]:
+    """
+    Search the messages of all the conversations of the current user,
+    except the ones compacted into cold buckets.
+    """
+    results = await messages_crud.search_messages(
+        current_user.id, q, session, cursor, limit
+    )
+    return results
+
+
+@router.put(
+    "/message/read",
+    response_model=auth_schemas.ResponseSchema,
+    status_code=200,
+    name="messages:mark-read",
+    responses={
+        200: {
+            "model": auth_schemas.ResponseSchema,
+            "description": "Messages have been marked as read.",
+        },
+    },
+)
+async def mark_read(
+    request: messages_schemas.MessageRead,
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
+) -> Dict[str, Any]:
+    """
+    Mark the received messages of a conversation as read up to a given
+    message, in a single update.
+    """
+    results = await messages_crud.mark_conversation_as_read(
+        current_user.id, request.message_id, session
+    )
+    return results
 
 
 @router.get(
@@ -136,10 +292,8 @@ async def get_sent_user_chat_images(
     },
 )
 async def get_conversation_users(
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
 ) -> Dict[str, Any]:
     """
     Return all users sent messages to this authenticated user.
@@ -26,6 +26,14 @@ class MessageCreate(BaseModel):
     media: Optional[str] = Field(..., example="")
 
 
+class MessageRead(BaseModel):
+    """
+    A Pydantic class that defines the schema to mark messages as read.
+    """
+
+    message_id: str = Field(..., example="63a0c1e5f1d2a3b4c5d6e7f8")
+
+
 class GetAllMessageResult(BaseModel):
     """
     A Pydantic class that defines the message schema to fetch messages info.
@@ -33,7 +41,6 @@ class GetAllMessageResult(BaseModel):
 
     sender: str = Field(..., example="KV1QiLCJhbGciOiJIUzI1NiJ")
     receiver: str = Field(..., example="KdasdfsaV1QiLCJhbGcizI1w")
-    messages: List[str] = Field(..., example="['Hello there!', ]")
     creation_date: datetime = Field(..., example=datetime.utcnow())
     modified_date: datetime = Field(..., example=datetime.utcnow())
 
@@ -44,4 +51,62 @@ class GetAllMessageResults(BaseModel):
     """
 
     status_code: int = Field(..., example=200)
-    result: List[Dict[str, Any]]
+    message: Optional[str] = Field(None, example="Invalid cursor!")
+    result: List[Dict[str, Any]] = []
+    next_cursor: Optional[str] = Field(
+        None, example="WyIyMDI0LTAxLTAxVDAwOjAwOjAwIiwgIjY1YTAwMDAwIl0="
+    )
+
+
+class InboxEntrySchema(BaseModel):
+    """
+    A Pydantic class that defines the inbox entry schema.
+    """
+
+    id: str = Field(..., example="63a0c1e5f1d2a3b4c5d6e7f8")
+    partner: str = Field(..., example="6386fc625c60cfd607e97b44")
+    conversation_id: str = Field(..., example="63a0c1e5f1d2a3b4c5d6e7f9")
+    preview: str = Field(..., example="Hello World!")
+    message_type: str = Field(..., example="text")
+    unread_count: int = Field(..., example=2)
+    last_activity: datetime = Field(..., example=datetime.utcnow())
+
+
+class InboxResults(BaseModel):
+    """
+    A Pydantic class that defines the schema to fetch an inbox page.
+    """
+
+    status_code: int = Field(..., example=200)
+    message: Optional[str] = Field(None, example="Invalid cursor!")
+    result: List[InboxEntrySchema] = []
+    next_cursor: Optional[str] = Field(
+        None, example="WyIyMDI0LTAxLTAxVDAwOjAwOjAwIiwgIjY1YTAwMDAwIl0="
+    )
+
+
+class ReadReceipt(BaseModel):
+    """
+    A Pydantic class that defines the schema of the read mark of a
+    conversation participant.
+    """
+
+    conversation_id: str = Field(..., example="63a0c1e5f1d2a3b4c5d6e7f8")
+    reader: str = Field(..., example="63a0c1e5f1d2a3b4c5d6e7f9")
+    seq: int = Field(..., example=42)
+
+
+class SyncResults(BaseModel):
+    """
+    A Pydantic class that defines the schema to sync messages after a
+    watermark.
+    """
+
+    status_code: int = Field(..., example=200)
+    message: Optional[str] = Field(None, example="Invalid cursor!")
+    result: List[Dict[str, Any]] = []
+    read_receipts: List[ReadReceipt] = []
+    next_cursor: Optional[str] = Field(
+        None, example="eyI2M2EwYzFlNWYxZDJhM2I0YzVkNmU3ZjgiOiA0Mn0="
+    )
+    has_more: bool = Field(False, example=False)
@@ -12,9 +12,15 @@ from odmantic.session import (
 from pydantic import (
     EmailStr,
 )
+from pymongo import (
+    ReturnDocument,
+)
 from typing import (
     Any,
     Dict,
+    List,
+    Optional,
+    Union,
 )
 
 from app.auth import (
@@ -29,7 +35,9 @@ from app.users import (
     schemas as users_schemas,
 )
 from app.utils import (
+    cache,
     crypt,
+    engine,
 )
 
 
@@ -37,36 +45,31 @@ async def remove_token(
     user_id: ObjectId, token: str, session: AIOSession
 ) -> None:
     """
-    A method for removing a token from a token list.
+    A method for revoking a token.
 
     Args:
         user_id (bson.ObjectId) : A user id.
         token (str) : A token value.
         session (odmantic.session.AIOSession) : odmantic session object.
     """
-    token_obj = await session.find_one(
-        auth_models.AccessToken, auth_models.AccessToken.user == user_id
+    await session.remove(
+        auth_models.AccessToken,
+        auth_models.AccessToken.user == user_id,
+        auth_models.AccessToken.token_hash == crypt.hash_token(token),
+        just_one=True,
     )
-    tokens = token_obj.tokens
-    if token in tokens:
-        tokens.remove(token)
-        token_obj.update(
-            {
-                "user": user_id,
-                "tokens": tokens,
-                "modified_date": datetime.utcnow(),
-            }
-        )
-        await session.save(token_obj)
+    cache.token_cache.invalidate_token(token)
 
 
-async def get_users(user_id: ObjectId, session: AIOSession) -> Dict[str, Any]:
+async def get_users(
+    user_id: ObjectId, session: engine.AnySession
+) -> Dict[str, Any]:
     """
     A method for fetching all users registered in the app.
 
     Args:
         user_id (bson.ObjectId) : A user id.
-        session (odmantic.session.AIOSession) : odmantic session object.
+        session (app.utils.engine.AnySession) : odmantic engine or session object.
     """
     users = await session.find(
         users_models.User, users_models.User.id != user_id
@@ -88,41 +91,64 @@ async def get_users(user_id: ObjectId, session: AIOSession) -> Dict[str, Any]:
 
 
 async def update_profile_picture(
-    email: EmailStr, file_name: str, session: AIOSession
-) -> None:
+    user_id: Union[str, ObjectId],
+    file_name: str,
+    session: AIOSession,
+    variants: Optional[Dict[str, str]] = None,
+) -> List[str]:
     """
-    A method for fetching all users registered in the app.
+    A method for updating the profile picture of a user.
 
     Args:
-        email (pydantic.EmailStr) : A user email address.
-        file_name (str) : A relative image file path stored on a Deta drive.
+        user_id (str | bson.ObjectId) : The authenticated user id.
+        file_name (str) : The picture url.
         session (odmantic.session.AIOSession) : odmantic session object.
+        variants (Dict[str, str]) : The picture size variants urls by name.
+
+    Returns:
+        List[str]: The urls of the replaced picture, read in the same
+        update so that concurrent uploads never release the same one.
     """
-    user = await session.find_one(
-        users_models.User, users_models.User.email == email
+    previous = await engine.get_collection(
+        session, users_models.User
+    ).find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {
+            "$set": {
+                "profile_picture": file_name,
+                "profile_picture_variants": variants or {},
+            }
+        },
+        projection={"profile_picture": 1, "profile_picture_variants": 1},
+        return_document=ReturnDocument.BEFORE,
+        session=engine.get_driver_session(session),
     )
-    user.profile_picture = file_name
-    await session.save(user)
+    cache.token_cache.invalidate_user(user_id)
+    if not previous:
+        return []
+    urls = list((previous.get("profile_picture_variants") or {}).values())
+    return urls or [previous.get("profile_picture")]
 
 
 async def update_user_password(
-    request: users_schemas.ResetPassword, email: EmailStr, session: AIOSession
+    request: users_schemas.ResetPassword,
+    user: users_models.User,
+    session: AIOSession,
 ) -> Dict[str, Any]:
     """
     A method for resetting authenticated user's password.
 
     Args:
         request (users_schemas.ResetPassword) : A request schema object for reset password.
-        email (pydantic.EmailStr) : A user email address.
+        user (users_models.User) : The authenticated user object.
         session (odmantic.session.AIOSession) : odmantic session object.
     """
-    user = await auth_crud.find_existed_user(email, session)
-    if not crypt.verify_password(request.old_password, user.password):
+    if not await crypt.hasher.verify(request.old_password, user.password):
         results = {
             "status_code": 400,
             "message": "Your old password is not correct!",
         }
-    elif crypt.verify_password(request.new_password, user.password):
+    elif await crypt.hasher.verify(request.new_password, user.password):
         results = {
             "status_code": 400,
             "message": "Your new password can't be your old one!",
@@ -135,11 +161,12 @@ async def update_user_password(
     else:
         user.update(
             {
-                "password": crypt.get_password_hash(request.new_password),
+                "password": await crypt.hasher.hash(request.new_password),
                 "modified_date": datetime.utcnow(),
             }
         )
         await session.save(user)
+        cache.token_cache.invalidate_user(user.id)
         results = {
             "status_code": 200,
             "message": "Your password has been reseted successfully!",
@@ -149,7 +176,7 @@ async def update_user_password(
 
 async def update_user_info(
     personal_info: users_schemas.PersonalInfo,
-    current_user: users_schemas.UserObjectSchema,
+    current_user: users_models.User,
     session: AIOSession,
 ) -> None:
     """
@@ -157,7 +184,7 @@ async def update_user_info(
 
     Args:
         personal_info (users_schemas.PersonalInfo) : User personal info schema object.
-        current_user (users_schemas.UserObjectSchema) : User schema object.
+        current_user (users_models.User) : The authenticated user object.
         session (odmantic.session.AIOSession) : odmantic session object.
     """
     current_user.update(
@@ -170,3 +197,4 @@ async def update_user_info(
         }
     )
     await session.save(current_user)
+    cache.token_cache.invalidate_user(current_user.id)
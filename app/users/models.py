@@ -13,6 +13,8 @@ from pydantic import (
     EmailStr,
 )
 from typing import (
+    Dict,
+    Iterator,
     Optional,
 )
 
@@ -108,9 +110,10 @@ class User(Model):
     interests: GenderInterests = Field(...)
     display_gender: DisplayGender = Field(...)
     passion: str = Field(...)
-    email: EmailStr = Field(index=True)
-    password: str = Field(index=True)
+    email: EmailStr
+    password: str = Field(...)
     profile_picture: str = Field(...)
+    profile_picture_variants: Dict[str, str] = Field(default_factory=dict)
     phone_number: Optional[str]
     chat_status: Optional[ChatStatus] = Field(default=ChatStatus.ONLINE.value)
     user_status: Optional[UserStatus] = Field(default=UserStatus.ACTIVE.value)
@@ -124,14 +127,15 @@ class User(Model):
         """
 
         @staticmethod
-        def indexes() -> Index:
+        def indexes() -> Iterator[Index]:
             """
             Indexes definition.
 
             Yields:
-                Index: return a compound index on the email and password fields,
+                Index: a unique index on the email field, named apart from
+                    the legacy non unique `email_1` one it replaces.
             """
-            yield Index(User.email, User.password, name="email_password_index")
+            yield Index(User.email, unique=True, name="email_unique_index")
 
 
 __all__ = [
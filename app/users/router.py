@@ -9,43 +9,39 @@ from fastapi import (
 from fastapi.encoders import (
     jsonable_encoder,
 )
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
-import os
-from pinatapy import (
-    PinataPy,
-)
-from tempfile import (
-    NamedTemporaryFile,
-)
 from typing import (
     Any,
     Dict,
 )
 
-from app.config import (
-    settings,
+from app.media import (
+    crud as media_crud,
+    storage as media_storage,
 )
 from app.users import (
     crud as users_crud,
+    models as users_models,
     schemas as users_schemas,
 )
 from app.utils import (
+    cache,
     dependencies,
     jwt,
+    uploads,
 )
 
 router = APIRouter(prefix="/api/v1")
 
-pinata = PinataPy(settings().PINATA_API_KEY, settings().PINATA_API_SECRET)
-
 
 @router.get("/user/profile", response_model=users_schemas.UserSchema)
 async def get_user_profile(
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
+    current_user: users_models.User = Depends(jwt.get_current_user_document),
 ) -> Dict[str, Any]:
     """
     Get user profile info given a token provided in a request header.
@@ -63,10 +59,8 @@ async def get_user_profile(
 
 @router.get("/user/all", response_model=users_schemas.UsersSchema)
 async def get_all_users(
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_secondary_session),
 ) -> Dict[str, Any]:
     """
     Fetch all users available in the app and not in the matches list.
@@ -77,10 +71,8 @@ async def get_all_users(
 @router.get("/user/logout")
 async def logout(
     token: str = Depends(jwt.get_token_user),
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     Log out a user from the app by removing the access token from the list.
@@ -92,49 +84,42 @@ async def logout(
 @router.put("/user/profile-image")
 async def upload_profile_image(
     file: UploadFile = File(...),
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: cache.UserIdentity = Depends(jwt.get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     Upload an image to Pinata Cloud.
     """
     try:
-        file_bytes = file.file.read()
-        temp = NamedTemporaryFile(delete=False)
-        with temp as temp_file:
-            temp_file.write(file_bytes)
-        result = pinata.pin_file_to_ipfs(temp.name)
-        image_url = f"https://ipfs.io/ipfs/{result['IpfsHash']}/{temp.name.split('/')[-1]}"  # noqa: E231
-        await users_crud.update_profile_picture(
-            email=current_user.email, file_name=image_url, session=session
-        )
-        return {
-            "status_code": 200,
-            "message": "Profile picture has been uploaded successfully!",
-        }
-
-    except Exception:
+        variants = await media_crud.store_image(file, session)
+    except uploads.UploadError as err:
+        return {"status_code": err.status_code, "message": str(err)}
+    except media_storage.StorageError:
         return {"status_code": 400, "message": "Something went wrong!"}
-
-    finally:
-        os.remove(temp.name)
+    previous_urls = await users_crud.update_profile_picture(
+        user_id=current_user.id,
+        file_name=variants["full"],
+        session=session,
+        variants=variants,
+    )
+    await media_crud.release_images(filter(None, previous_urls), session)
+    return {
+        "status_code": 200,
+        "message": "Profile picture has been uploaded successfully!",
+    }
 
 
 @router.put("/user/reset-password")
 async def reset_user_password(
     request: users_schemas.ResetPassword,
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: users_models.User = Depends(jwt.get_current_user_document),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     An endpoint for resetting users passwords.
     """
     result = await users_crud.update_user_password(
-        request, current_user.email, session
+        request, current_user, session
     )
     return result
 
@@ -142,10 +127,8 @@ async def reset_user_password(
 @router.put("/user/profile")
 async def update_personal_information(
     personal_info: users_schemas.PersonalInfo,
-    current_user: users_schemas.UserObjectSchema = Depends(
-        jwt.get_current_active_user
-    ),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
+    current_user: users_models.User = Depends(jwt.get_current_user_document),
+    session: AIOSession = Depends(dependencies.get_db_session),
 ) -> Dict[str, Any]:
     """
     An endpoint for updating users personel info.
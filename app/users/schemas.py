@@ -29,7 +29,17 @@ class UserObjectSchema(BaseModel):
     display_gender: int = Field(..., example=1)
     passion: str = Field(..., example="swimming,cardio")
     email: EmailStr = Field(..., example="user@test.com")
-    profile_picture: str = Field(..., example="A relative URL to Deta Drive.")
+    profile_picture: str = Field(
+        ..., example="https://ipfs.io/ipfs/QmFull/5a6b"
+    )
+    profile_picture_variants: Dict[str, str] = Field(
+        default={},
+        example={
+            "thumbnail": "https://ipfs.io/ipfs/QmThumbnail/1f2e",
+            "medium": "https://ipfs.io/ipfs/QmMedium/3c4d",
+            "full": "https://ipfs.io/ipfs/QmFull/5a6b",
+        },
+    )
     chat_status: Optional[str] = Field(default="online")
     user_status: Optional[int] = Field(default=1)
     user_role: Optional[str] = Field(default="regular")
@@ -62,7 +72,7 @@ class UserSchema(BaseModel):
             display_gender=1,
             passion="swimming,cardio",
             email="user@test.com",
-            profile_picture="A relative URL to Deta Drive.",
+            profile_picture="https://ipfs.io/ipfs/QmFull/5a6b",
         ),
     )
     token: Optional[Dict[str, str]] = Field(
@@ -100,7 +110,7 @@ class UsersSchema(BaseModel):
                 display_gender=1,
                 passion="swimming,cardio",
                 email="user@test.com",
-                profile_picture="A relative URL to Deta Drive.",
+                profile_picture="https://ipfs.io/ipfs/QmFull/5a6b",
             ),
         ],
     )
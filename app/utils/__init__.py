@@ -3,15 +3,27 @@ utils package.
 """
 
 from app.utils import (
+    cache,
     crypt,
     dependencies,
     engine,
+    indexes,
     jwt,
+    pagination,
+    pinata,
+    responses,
+    uploads,
 )
 
 __all__ = [
+    "cache",
     "crypt",
     "dependencies",
     "engine",
+    "indexes",
     "jwt",
+    "pagination",
+    "pinata",
+    "responses",
+    "uploads",
 ]
@@ -0,0 +1,232 @@
+"""The utils cache module."""
+
+from collections import (
+    OrderedDict,
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from app.config import (
+    settings,
+)
+from app.utils import (
+    crypt,
+)
+
+KT = TypeVar("KT", bound=Hashable)
+VT = TypeVar("VT")
+
+
+class TTLCache(Generic[KT, VT]):
+    """
+    A bounded in-process cache that evicts the least recently used entry
+    once full and drops entries once their time to live has elapsed.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+        A constructor that sets the cache bounds.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            maxsize (int) : The maximum number of entries to keep.
+            ttl (float) : The default time to live of an entry in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[KT, Tuple[float, VT]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: KT) -> Optional[VT]:
+        """
+        Return a live entry and mark it as recently used.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (Hashable) : The entry key.
+
+        Returns:
+            Optional[VT]: The cached value, None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: KT, value: VT, ttl: Optional[float] = None) -> None:
+        """
+        Store an entry, evicting the least recently used ones when full.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (Hashable) : The entry key.
+            value (VT) : The value to cache.
+            ttl (float) : An optional time to live overriding the default one.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self.pop(oldest)
+
+    def pop(self, key: KT) -> Optional[VT]:
+        """
+        Remove an entry.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            key (Hashable) : The entry key.
+
+        Returns:
+            Optional[VT]: The removed value, if any.
+        """
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        self._entries.clear()
+
+
+class UserIdentity(NamedTuple):
+    """
+    The fields of a user that authorize a request. Profile fields aren't
+    kept, so that a stale copy can never be written back.
+    """
+
+    id: Any
+    email: str
+    user_status: Any
+    user_role: Any
+
+
+class CachedIdentity(NamedTuple):
+    """
+    A resolved token: the owner id and its identity, or None once revoked.
+    """
+
+    owner: str
+    user: Optional[UserIdentity]
+
+
+class TokenCache(TTLCache[str, CachedIdentity]):
+    """
+    A cache of verified access tokens keyed by a hash of the token.
+
+    Note:
+        Entries live at most `TOKEN_CACHE_TTL` seconds, which bounds how long
+        another worker keeps accepting a token revoked elsewhere.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+        A constructor that also keeps an index of token hashes per user.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            maxsize (int) : The maximum number of tokens to keep.
+            ttl (float) : The time to live of a token entry in seconds.
+        """
+        super().__init__(maxsize, ttl)
+        self._owners: Dict[str, Set[str]] = {}
+
+    def get_token(self, token: str) -> Optional[CachedIdentity]:
+        """
+        Look up a resolved token.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            token (str) : A token value.
+
+        Returns:
+            Optional[CachedIdentity]: The cached identity, None on a miss.
+        """
+        return self.get(crypt.hash_token(token))
+
+    def set_token(
+        self,
+        token: str,
+        owner: Any,
+        user: Optional[UserIdentity],
+        expires_at: Optional[float] = None,
+    ) -> None:
+        """
+        Cache a resolved token, never past the token expiry.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            token (str) : A token value.
+            owner (Any) : The id of the user owning the token.
+            user (UserIdentity) : The resolved identity, None for a revoked token.
+            expires_at (float) : The token `exp` claim as a unix timestamp.
+        """
+        ttl = None if expires_at is None else expires_at - time.time()
+        key = crypt.hash_token(token)
+        self.set(key, CachedIdentity(owner=str(owner), user=user), ttl)
+        if key in self._entries:
+            self._owners.setdefault(str(owner), set()).add(key)
+
+    def pop(self, key: str) -> Optional[CachedIdentity]:
+        identity = super().pop(key)
+        if identity is not None:
+            keys = self._owners.get(identity.owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[identity.owner]
+        return identity
+
+    def clear(self) -> None:
+        super().clear()
+        self._owners.clear()
+
+    def invalidate_token(self, token: str) -> None:
+        """
+        Drop a single token, e.g. upon logging out.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            token (str) : A token value.
+        """
+        self.pop(crypt.hash_token(token))
+
+    def invalidate_user(self, user_id: Any) -> None:
+        """
+        Drop every token of a user, e.g. after a password or profile update.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            user_id (Any) : A user id.
+        """
+        for key in list(self._owners.get(str(user_id), ())):
+            self.pop(key)
+
+
+token_cache = TokenCache(
+    maxsize=settings().TOKEN_CACHE_SIZE, ttl=settings().TOKEN_CACHE_TTL
+)
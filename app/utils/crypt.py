@@ -1,11 +1,29 @@
 """The utils crypt module."""
 
+import asyncio
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+import hashlib
 from passlib.context import (
     CryptContext,
 )
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    TypeVar,
+)
+
+from app.config import (
+    settings,
+)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+T = TypeVar("T")
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -28,3 +46,145 @@ def get_password_hash(password: str) -> str:
         str: The hashed password.
     """
     return pwd_context.hash(password)
+
+
+def hash_token(token: str) -> str:
+    """
+    Generate a SHA-256 digest of a token to be used as a lookup key.
+    Args:
+        token (str): The token to hash.
+    Returns:
+        str: The hex digest of the token.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class PasswordHasherBusyError(Exception):
+    """
+    Raised when the password hashing queue is saturated.
+    """
+
+
+class PasswordHasher:
+    """
+    An async facade that runs bcrypt in a bounded thread pool so that
+    password work never blocks the event loop.
+
+    Note:
+        The running counter is updated from the worker threads, hence the
+        lock. The other counters are only touched on the event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        """
+        A constructor that sets the pool size and the queue bound.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            max_workers (int) : The number of hashes computed concurrently.
+            max_queue (int) : The number of calls allowed to wait for a worker.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hasher"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _run(self, func: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def _submit(self, func: Callable[..., T], *args: Any) -> T:
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise PasswordHasherBusyError("Password hashing queue is full!")
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self._run, func, *args
+            )
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against a hash off the event loop.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            plain_password (str) : The password to verify.
+            hashed_password (str) : The hashed password to verify against.
+
+        Raises:
+            PasswordHasherBusyError: If the queue is saturated.
+
+        Returns:
+            bool: True if the password matches the hash, False otherwise.
+        """
+        return await self._submit(
+            verify_password, plain_password, hashed_password
+        )
+
+    async def hash(self, password: str) -> str:
+        """
+        Generate a hash for a password off the event loop.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            password (str) : The password to hash.
+
+        Raises:
+            PasswordHasherBusyError: If the queue is saturated.
+
+        Returns:
+            str: The hashed password.
+        """
+        return await self._submit(get_password_hash, password)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the pool usage counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, int]: The pool size, queue depth and call counters.
+        """
+        with self._lock:
+            running = self._running
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": max(self._in_flight - running, 0),
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hasher = PasswordHasher(
+    max_workers=settings().PASSWORD_HASH_WORKERS,
+    max_queue=settings().PASSWORD_HASH_MAX_QUEUE,
+)
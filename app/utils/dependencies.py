@@ -1,5 +1,11 @@
 """The utils dependencies module."""
 
+from motor.motor_asyncio import (
+    AsyncIOMotorClientSession,
+)
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
@@ -7,46 +13,178 @@ from starlette.requests import (
     Request,
 )
 from typing import (
+    Any,
     AsyncGenerator,
+    AsyncIterator,
+    Generator,
+    List,
+    Optional,
+    Sequence,
 )
 
 
-async def get_db_transactional_session(
+class LazyCursor:
+    """
+    A cursor that starts its lazy session once it gets awaited or iterated.
+    """
+
+    def __init__(self, session: "LazySession", *args: Any, **kwargs: Any):
+        """
+        A constructor that keeps the find arguments until the cursor is used.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            session (LazySession) : The lazy session to run the query in.
+            args (Any) : `AIOSession.find` positional arguments.
+            kwargs (Any) : `AIOSession.find` keyword arguments.
+        """
+        self.session = session
+        self.args = args
+        self.kwargs = kwargs
+
+    async def _fetch(self) -> List[Any]:
+        await self.session.ensure_started()
+        return await AIOSession.find(self.session, *self.args, **self.kwargs)
+
+    def __await__(self) -> Generator[Any, None, List[Any]]:
+        return self._fetch().__await__()
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        await self.session.ensure_started()
+        async for instance in AIOSession.find(
+            self.session, *self.args, **self.kwargs
+        ):
+            yield instance
+
+
+class LazySession(AIOSession):
+    """
+    An odmantic session that only starts a server session on first use.
+    """
+
+    async def ensure_started(self) -> None:
+        """
+        Start the session unless it is already started.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        if not self.is_started:
+            await self.start()
+
+    def get_driver_session(self) -> Optional[AsyncIOMotorClientSession]:  # type: ignore
+        """
+        Return the motor session, None as long as it hasn't been started
+        so that raw queries run without a session.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Optional[AsyncIOMotorClientSession]: The motor session, if any.
+        """
+        return self.session
+
+    def find(self, *args: Any, **kwargs: Any) -> LazyCursor:  # type: ignore
+        return LazyCursor(self, *args, **kwargs)
+
+    async def find_one(self, *args: Any, **kwargs: Any) -> Any:
+        await self.ensure_started()
+        return await super().find_one(*args, **kwargs)
+
+    async def count(self, *args: Any, **kwargs: Any) -> int:
+        await self.ensure_started()
+        return await super().count(*args, **kwargs)
+
+    async def save(self, instance: Any) -> Any:
+        await self.ensure_started()
+        return await super().save(instance)
+
+    async def save_all(self, instances: Sequence[Any]) -> List[Any]:
+        await self.ensure_started()
+        return await super().save_all(instances)
+
+    async def delete(self, instance: Any) -> None:
+        await self.ensure_started()
+        return await super().delete(instance)
+
+    async def remove(self, *args: Any, **kwargs: Any) -> int:
+        await self.ensure_started()
+        return await super().remove(*args, **kwargs)
+
+
+async def get_db_session(
+    request: Request,
+) -> AsyncGenerator[LazySession, None]:
+    """
+    Create and get a lazy engine session, started on its first query.
+
+    Args:
+        request (starlette.requests.Request): current request.
+    Yields :
+        LazySession: a database session.
+    """
+    session = LazySession(request.app.state.engine)
+    try:
+        yield session
+    finally:
+        if session.is_started:
+            await session.end()
+
+
+async def get_db_readonly_session(
+    request: Request,
+) -> AsyncGenerator[AIOEngine, None]:
+    """
+    Get the engine itself for routes that only read, so that queries run
+    without any session.
+
+    Args:
+        request (starlette.requests.Request): current request.
+    Yields :
+        odmantic.AIOEngine: the database engine.
+    """
+    yield request.app.state.engine
+
+
+async def get_db_secondary_session(
     request: Request,
-) -> AsyncGenerator[AIOSession, None]:
+) -> AsyncGenerator[LazySession, None]:
     """
-    Create and get an engine session.
+    Create and get a lazy session on the read engine, whose reads follow
+    `MONGODB_READ_PREFERENCE` (`secondaryPreferred` by default). Sessions
+    are causally consistent, so reads within a request observe its writes.
 
     Args:
         request (starlette.requests.Request): current request.
     Yields :
-        odmantic.session.AIOSession: a database session.
+        LazySession: a database session.
     """
+    session = LazySession(request.app.state.read_engine)
     try:
-        session: AIOSession = request.app.state.engine.session()
-        await session.start()
         yield session
     finally:
-        await session.end()
+        if session.is_started:
+            await session.end()
 
 
-async def get_db_autocommit_session() -> AsyncGenerator[AIOSession, None]:
+async def get_db_autocommit_session() -> AsyncGenerator[LazySession, None]:
     """
-    Create and get database session.
+    Create and get a lazy database session.
 
     Args:
         request (starlette.requests.Request): current request.
     Yields :
-        odmantic.session.AIOSession: a database session.
+        LazySession: a database session.
     """
 
     from app.main import (  # pylint: disable=C0415
         tinder_app,
     )
 
+    session = LazySession(tinder_app.state.engine)
     try:
-        session: AIOSession = tinder_app.state.engine.session()
-        await session.start()
         yield session
     finally:
-        await session.end()
+        if session.is_started:
+            await session.end()
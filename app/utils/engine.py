@@ -5,34 +5,366 @@ from fastapi import (
 )
 from motor.motor_asyncio import (
     AsyncIOMotorClient,
+    AsyncIOMotorClientSession,
+    AsyncIOMotorCollection,
 )
 from odmantic import (
     AIOEngine,
+    Model,
+)
+from odmantic.session import (
+    AIOSession,
+    AIOSessionBase,
+)
+from pymongo import (
+    monitoring,
+    read_preferences,
+)
+from pymongo.errors import (
+    PyMongoError,
+)
+import threading
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
 )
 
 from app.config import (
     settings,
 )
 
+AnySession = Union[AIOEngine, AIOSessionBase]
+
+T = TypeVar("T")
+
+TRANSIENT_TRANSACTION_ERROR = "TransientTransactionError"
+UNKNOWN_COMMIT_RESULT = "UnknownTransactionCommitResult"
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    A connection pool listener that keeps checkout counters and wait times
+    per server, so pools can be sized against real load.
+
+    Note:
+        Pool events are published from the driver threads, hence the lock.
+    """
+
+    def __init__(self) -> None:
+        """
+        A constructor to initialize the per server counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, float]] = {}
+
+    def _pool(self, address: Tuple[str, Optional[int]]) -> Dict[str, float]:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self._pools:
+            self._pools[key] = {
+                "open": 0,
+                "in_use": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "wait_ms_total": 0.0,
+                "wait_ms_max": 0.0,
+            }
+        return self._pools[key]
+
+    def _record_wait(self, pool: Dict[str, float], event: Any) -> None:
+        wait_ms = getattr(event, "duration", 0.0) * 1000
+        pool["wait_ms_total"] += wait_ms
+        pool["wait_ms_max"] = max(pool["wait_ms_max"], wait_ms)
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        return None
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        return None
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(
+        self, event: monitoring.ConnectionCreatedEvent
+    ) -> None:
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        return None
+
+    def connection_closed(
+        self, event: monitoring.ConnectionClosedEvent
+    ) -> None:
+        with self._lock:
+            self._pool(event.address)["open"] -= 1
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ) -> None:
+        return None
+
+    def connection_checked_out(
+        self, event: monitoring.ConnectionCheckedOutEvent
+    ) -> None:
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["in_use"] += 1
+            pool["checkouts"] += 1
+            self._record_wait(pool, event)
+
+    def connection_check_out_failed(
+        self, event: monitoring.ConnectionCheckOutFailedEvent
+    ) -> None:
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkout_failures"] += 1
+            self._record_wait(pool, event)
+
+    def connection_checked_in(
+        self, event: monitoring.ConnectionCheckedInEvent
+    ) -> None:
+        with self._lock:
+            self._pool(event.address)["in_use"] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return the pool counters along with the average checkout wait.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The counters keyed by server address.
+        """
+        with self._lock:
+            results = {}
+            for address, pool in self._pools.items():
+                attempts = pool["checkouts"] + pool["checkout_failures"]
+                results[address] = {
+                    **pool,
+                    "wait_ms_avg": (
+                        pool["wait_ms_total"] / attempts if attempts else 0.0
+                    ),
+                }
+            return results
+
+
+pool_monitor = PoolMonitor()
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def get_read_preference(
+    name: str, max_staleness: int
+) -> read_preferences._ServerMode:
+    """
+    Build a read preference from its name.
+
+    Args:
+        name (str) : A read preference mode name, e.g. `secondaryPreferred`.
+        max_staleness (int) : Max replication lag of a secondary in seconds, -1 for no max.
+
+    Returns:
+        pymongo.read_preferences._ServerMode: The read preference.
+    """
+    if name == "primary":
+        return read_preferences.Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
 
 async def init_engine_app(app: FastAPI) -> None:
     """
     Creates database and connections to the database.
 
-    This function creates a mongodb client instance,
-    and an odmantic engine and stores them in the
-    application's state property.
+    This function creates a mongodb client instance, an odmantic engine
+    and a read engine routing its reads according to
+    `MONGODB_READ_PREFERENCE`, and stores them in the application's state
+    property.
 
     Args:
         app (fastapi.FastAPI): fastAPI application.
     """
     app_settings = settings()
 
-    client = AsyncIOMotorClient(
-        app_settings.db_url, maxPoolSize=30, minPoolSize=30
+    client_options: Dict[str, Any] = {
+        "maxPoolSize": app_settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": app_settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": app_settings.MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": app_settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [pool_monitor],
+    }
+    if app_settings.MONGODB_COMPRESSORS:
+        client_options["compressors"] = app_settings.MONGODB_COMPRESSORS
+    client = AsyncIOMotorClient(app_settings.db_url, **client_options)
+    engine = AIOEngine(client=client, database=app_settings.database_name)
+    read_engine = AIOEngine(client=client, database=app_settings.database_name)
+    read_engine.database = client.get_database(
+        app_settings.database_name,
+        read_preference=get_read_preference(
+            app_settings.MONGODB_READ_PREFERENCE,
+            app_settings.MONGODB_MAX_STALENESS_SECONDS,
+        ),
+    )
+    from app.utils import (  # pylint: disable=C0415
+        indexes,
     )
-    database = client.get_default_database()
-    assert database.name == app_settings.MONGODB_DATABASE
-    engine = AIOEngine(client=client, database="tinder")
+
+    app.state.index_report = await indexes.configure_indexes(engine)
     app.state.client = client
     app.state.engine = engine
+    app.state.read_engine = read_engine
+
+
+def get_collection(
+    session: AnySession, model: Type[Model]
+) -> AsyncIOMotorCollection:
+    """
+    Get the motor collection of a model to run raw queries on it.
+
+    Args:
+        session (AIOEngine | AIOSessionBase) : An odmantic engine or session.
+        model (Type[odmantic.Model]) : An odmantic model class.
+
+    Returns:
+        AsyncIOMotorCollection: The collection associated to the model.
+    """
+    engine = session if isinstance(session, AIOEngine) else session.engine
+    return engine.get_collection(model)
+
+
+def get_driver_session(
+    session: AnySession,
+) -> Optional[AsyncIOMotorClientSession]:
+    """
+    Get the motor session to pass along raw queries.
+
+    Args:
+        session (AIOEngine | AIOSessionBase) : An odmantic engine or session.
+
+    Returns:
+        Optional[AsyncIOMotorClientSession]: The motor session, None for an engine.
+    """
+    if isinstance(session, AIOEngine):
+        return None
+    return session.get_driver_session()  # type: ignore
+
+
+def in_transaction(session: AnySession) -> bool:
+    """
+    Check whether queries of a session run in a transaction.
+
+    Args:
+        session (AIOEngine | AIOSessionBase) : An odmantic engine or session.
+
+    Returns:
+        bool: True if a transaction is in progress.
+    """
+    driver_session = get_driver_session(session)
+    return bool(driver_session and driver_session.in_transaction)
+
+
+def _has_error_label(err: BaseException, label: str) -> bool:
+    return isinstance(err, PyMongoError) and err.has_error_label(label)
+
+
+async def _commit_transaction(
+    driver_session: AsyncIOMotorClientSession, max_attempts: int
+) -> None:
+    for attempt in range(1, max_attempts + 1):
+        try:
+            await driver_session.commit_transaction()
+            return
+        except PyMongoError as err:
+            # committing again is safe, the server knows the transaction.
+            if attempt < max_attempts and err.has_error_label(
+                UNKNOWN_COMMIT_RESULT
+            ):
+                continue
+            raise
+
+
+async def run_in_transaction(
+    session: Union[AIOEngine, AIOSession],
+    callback: Callable[[AIOSession], Awaitable[T]],
+    retry_on: Tuple[Type[BaseException], ...] = (),
+    max_attempts: Optional[int] = None,
+) -> T:
+    """
+    Run a callback in a transaction committed before returning, following
+    the driver `with_transaction` semantics with a bounded number of
+    attempts.
+
+    Note:
+        The whole callback runs again when the transaction fails with a
+        `TransientTransactionError`, e.g. a write conflict with a
+        concurrent transaction, or with one of `retry_on`. The commit
+        alone is retried on an `UnknownTransactionCommitResult`. The
+        callback must therefore only have side effects within the
+        transaction.
+
+    Args:
+        session (AIOEngine | AIOSession) : An odmantic engine, or a session to run the transaction in.
+        callback (Callable[[AIOSession], Awaitable[T]]) : The queries to run, given the session.
+        retry_on (Tuple[Type[BaseException], ...]) : Other errors to run the callback again on.
+        max_attempts (int) : Max attempts, `MONGODB_TRANSACTION_MAX_ATTEMPTS` by default.
+
+    Raises:
+        pymongo.errors.PyMongoError: If the transaction failed on the last attempt.
+
+    Returns:
+        T: The callback result.
+    """
+    max_attempts = max_attempts or settings().MONGODB_TRANSACTION_MAX_ATTEMPTS
+    if isinstance(session, AIOEngine):
+        async with session.session() as engine_session:
+            return await run_in_transaction(
+                engine_session, callback, retry_on, max_attempts
+            )
+    if not session.is_started:
+        await session.start()
+    driver_session = session.get_driver_session()
+    attempt = 0
+    while True:
+        attempt += 1
+        retry = attempt < max_attempts
+        driver_session.start_transaction()
+        try:
+            result = await callback(session)
+        except BaseException as err:
+            if driver_session.in_transaction:
+                await driver_session.abort_transaction()
+            if retry and (
+                _has_error_label(err, TRANSIENT_TRANSACTION_ERROR)
+                or isinstance(err, retry_on)
+            ):
+                continue
+            raise
+        try:
+            await _commit_transaction(driver_session, max_attempts)
+        except PyMongoError as err:
+            if retry and err.has_error_label(TRANSIENT_TRANSACTION_ERROR):
+                continue
+            raise
+        return result
@@ -0,0 +1,391 @@
+"""The utils indexes module."""
+
+import logging
+from odmantic import (
+    AIOEngine,
+    Model,
+)
+from odmantic.index import (
+    ODMBaseIndex,
+)
+import pymongo
+from typing import (
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from app.config import (
+    settings,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# indexes replaced by a declared one, dropped at startup whatever
+# `MONGODB_DROP_OBSOLETE_INDEXES` says, keyed by collection name: the
+# non unique `email_1` blocks the unique email index on the same key.
+RETIRED_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "user": ("email_1",),
+}
+
+
+# the key a text index is stored under by the server, whatever fields it
+# covers, e.g. in `index_information()`.
+TEXT_INDEX_KEY = "_fts"
+
+
+class HotQuery(NamedTuple):
+    """
+    A query issued on a hot path, described by its equality and sort keys,
+    a text search being keyed on `TEXT_INDEX_KEY`.
+    """
+
+    name: str
+    model: Type[Model]
+    equality: Tuple[str, ...]
+    sort: Tuple[str, ...] = ()
+
+
+def get_models() -> List[Type[Model]]:
+    """
+    Get the models whose indexes are managed at startup.
+
+    Returns:
+        List[Type[odmantic.Model]]: The models.
+    """
+    from app.auth import (  # pylint: disable=C0415
+        models as auth_models,
+    )
+    from app.matches import (  # pylint: disable=C0415
+        models as matches_models,
+    )
+    from app.media import (  # pylint: disable=C0415
+        models as media_models,
+    )
+    from app.messages import (  # pylint: disable=C0415
+        models as messages_models,
+    )
+    from app.users import (  # pylint: disable=C0415
+        models as users_models,
+    )
+
+    return [
+        users_models.User,
+        auth_models.AccessToken,
+        matches_models.Match,
+        messages_models.Message,
+        messages_models.Conversation,
+        messages_models.InboxEntry,
+        messages_models.MessageBucket,
+        media_models.MediaObject,
+        media_models.GatewayMedia,
+    ]
+
+
+def get_hot_queries() -> List[HotQuery]:
+    """
+    Get the queries issued by the CRUD modules on hot paths.
+
+    Returns:
+        List[HotQuery]: The queries that must be served by an index.
+    """
+    from app.auth import (  # pylint: disable=C0415
+        models as auth_models,
+    )
+    from app.matches import (  # pylint: disable=C0415
+        models as matches_models,
+    )
+    from app.media import (  # pylint: disable=C0415
+        models as media_models,
+    )
+    from app.messages import (  # pylint: disable=C0415
+        models as messages_models,
+    )
+    from app.users import (  # pylint: disable=C0415
+        models as users_models,
+    )
+
+    user = users_models.User
+    token = auth_models.AccessToken
+    match = matches_models.Match
+    message = messages_models.Message
+    conversation = messages_models.Conversation
+    inbox = messages_models.InboxEntry
+    bucket = messages_models.MessageBucket
+    media = media_models.MediaObject
+    gateway_media = media_models.GatewayMedia
+    return [
+        HotQuery("auth.crud.find_existed_user", user, ("email",)),
+        HotQuery("auth.crud.find_existed_user_id", user, ("_id",)),
+        HotQuery("auth.crud.find_existed_identity", token, ("token_hash",)),
+        HotQuery(
+            "auth.crud.remove_stale_tokens",
+            token,
+            ("user",),
+            ("creation_date",),
+        ),
+        HotQuery("users.crud.remove_token", token, ("token_hash", "user")),
+        HotQuery("matches.crud.add_new_match", match, ("user",)),
+        HotQuery("matches.crud.get_user_matches", user, ("_id",)),
+        HotQuery("messages.crud.send_new_message", conversation, ("pair_id",)),
+        HotQuery(
+            "messages.crud.get_sender_receiver_messages",
+            message,
+            ("conversation_id",),
+            ("creation_date", "_id"),
+        ),
+        HotQuery(
+            "messages.compaction.read_cold_messages",
+            bucket,
+            ("conversation_id",),
+            ("start_date",),
+        ),
+        HotQuery(
+            "messages.crud.sync_messages",
+            message,
+            ("conversation_id",),
+            ("seq",),
+        ),
+        HotQuery("messages.crud.search_messages", message, (TEXT_INDEX_KEY,)),
+        HotQuery(
+            "messages.crud.mark_messages_as_read",
+            message,
+            ("conversation_id",),
+        ),
+        HotQuery(
+            "messages.crud.get_all_users_messages",
+            conversation,
+            ("participants",),
+        ),
+        HotQuery("messages.crud.get_all_users_messages", user, ("_id",)),
+        HotQuery(
+            "messages.crud.update_inbox_entries", inbox, ("owner", "partner")
+        ),
+        HotQuery(
+            "messages.crud.get_inbox",
+            inbox,
+            ("owner",),
+            ("last_activity", "_id"),
+        ),
+        HotQuery("media.crud.acquire_media", media, ("sha256",)),
+        HotQuery("media.crud.release_media", media, ("url",)),
+        HotQuery("media.router.get_media", media, ("sha256",)),
+        HotQuery("media.router.get_ipfs_media", media, ("sha256",)),
+        HotQuery(
+            "media.router.get_ipfs_media",
+            gateway_media,
+            ("cid", "filename"),
+        ),
+    ]
+
+
+def get_declared_indexes(model: Type[Model]) -> List[pymongo.IndexModel]:
+    """
+    Get the indexes declared on a model, including the implicit `_id` one.
+
+    Args:
+        model (Type[odmantic.Model]) : An odmantic model class.
+
+    Returns:
+        List[pymongo.IndexModel]: The declared indexes.
+    """
+    declared = [pymongo.IndexModel([("_id", pymongo.ASCENDING)], name="_id_")]
+    for index in model.__indexes__():
+        declared.append(
+            index.get_pymongo_index()
+            if isinstance(index, ODMBaseIndex)
+            else index
+        )
+    return declared
+
+
+def get_index_keys(index: pymongo.IndexModel) -> List[str]:
+    """
+    Get the keys of an index the way the server stores them: the fields of
+    a text index, as declared, are replaced by the `_fts` key, and the
+    `_ftsx` key following it in `index_information()` is left out.
+
+    Args:
+        index (pymongo.IndexModel) : An index declared or read from the server.
+
+    Returns:
+        List[str]: The index keys.
+    """
+    keys: List[str] = []
+    for key, direction in index.document["key"].items():
+        if direction == pymongo.TEXT:
+            key = TEXT_INDEX_KEY
+        if key == "_ftsx" or (keys and keys[-1] == key == TEXT_INDEX_KEY):
+            continue
+        keys.append(key)
+    return keys
+
+
+def find_covering_index(
+    query: HotQuery, indexes: Sequence[pymongo.IndexModel]
+) -> Optional[str]:
+    """
+    Find the index whose leading keys serve most of the query filter and
+    its sort.
+
+    Args:
+        query (HotQuery) : A hot path query.
+        indexes (Sequence[pymongo.IndexModel]) : The indexes of the collection.
+
+    Returns:
+        Optional[str]: The covering index name, None if there is none.
+    """
+    best: Optional[str] = None
+    best_prefix = 0
+    for index in indexes:
+        keys = get_index_keys(index)
+        prefix = 0
+        while prefix < len(keys) and keys[prefix] in query.equality:
+            prefix += 1
+        sort_keys = tuple(keys[prefix:][: len(query.sort)])
+        if query.sort and (
+            prefix != len(query.equality) or sort_keys != query.sort
+        ):
+            continue
+        if prefix > best_prefix:
+            best, best_prefix = str(index.document["name"]), prefix
+    return best
+
+
+def get_index_models(
+    index_information: Dict[str, Dict[str, Any]]
+) -> List[pymongo.IndexModel]:
+    """
+    Build index models out of a collection `index_information`.
+
+    Args:
+        index_information (Dict[str, Dict[str, Any]]) : The existing indexes by name.
+
+    Returns:
+        List[pymongo.IndexModel]: The existing indexes.
+    """
+    return [
+        pymongo.IndexModel(info["key"], name=name)
+        for name, info in index_information.items()
+    ]
+
+
+def build_coverage_report(
+    indexes: Optional[Dict[str, List[pymongo.IndexModel]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Check every hot query against the indexes of its collection, the
+    declared ones unless the existing ones are given.
+
+    Args:
+        indexes (Dict[str, List[pymongo.IndexModel]]) : The existing indexes by collection.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per query with its covering index.
+    """
+    report = []
+    for query in get_hot_queries():
+        index_name = find_covering_index(
+            query,
+            (
+                indexes.get(query.model.__collection__, [])
+                if indexes is not None
+                else get_declared_indexes(query.model)
+            ),
+        )
+        report.append(
+            {
+                "query": query.name,
+                "collection": query.model.__collection__,
+                "keys": list(query.equality + query.sort),
+                "index": index_name,
+            }
+        )
+    return report
+
+
+async def configure_indexes(engine: AIOEngine) -> List[Dict[str, Any]]:
+    """
+    Create the declared indexes, drop or report the obsolete ones and log
+    which hot queries are covered.
+
+    Note:
+        Retired indexes are dropped before the declared ones are created.
+        Other obsolete indexes are only dropped when
+        `MONGODB_DROP_OBSOLETE_INDEXES` is enabled, otherwise they are
+        logged. The report is built from the indexes that exist once done,
+        so an index failing to build, e.g. a unique one over duplicates,
+        leaves its queries uncovered.
+
+    Args:
+        engine (odmantic.AIOEngine) : An odmantic engine.
+
+    Returns:
+        List[Dict[str, Any]]: The index coverage report.
+    """
+    indexes: Dict[str, List[pymongo.IndexModel]] = {}
+    for model in get_models():
+        collection = engine.get_collection(model)
+        existing = await collection.index_information()
+        for name in RETIRED_INDEXES.get(model.__collection__, ()):
+            if name in existing:
+                logger.warning(
+                    "Dropping retired index %s.%s", model.__collection__, name
+                )
+                await collection.drop_index(name)
+        try:
+            await engine.configure_database([model])
+        except pymongo.errors.PyMongoError as err:
+            logger.error(
+                "Failed to create the %s indexes: %r",
+                model.__collection__,
+                err,
+            )
+        declared = {
+            index.document["name"] for index in get_declared_indexes(model)
+        }
+        existing = await collection.index_information()
+        for name in declared - set(existing):
+            logger.error(
+                "Declared index %s.%s is missing!", model.__collection__, name
+            )
+        for name in set(existing) - declared:
+            if settings().MONGODB_DROP_OBSOLETE_INDEXES:
+                logger.warning(
+                    "Dropping obsolete index %s.%s",
+                    model.__collection__,
+                    name,
+                )
+                await collection.drop_index(name)
+            else:
+                logger.warning(
+                    "Obsolete index %s.%s, set MONGODB_DROP_OBSOLETE_INDEXES"
+                    " to drop it",
+                    model.__collection__,
+                    name,
+                )
+        indexes[model.__collection__] = get_index_models(existing)
+    report = build_coverage_report(indexes)
+    for entry in report:
+        if entry["index"]:
+            logger.info(
+                "%s on %s%s is covered by %s",
+                entry["query"],
+                entry["collection"],
+                entry["keys"],
+                entry["index"],
+            )
+        else:
+            logger.warning(
+                "%s on %s%s is NOT covered by any index!",
+                entry["query"],
+                entry["collection"],
+                entry["keys"],
+            )
+    return report
@@ -16,18 +16,25 @@ import jwt
 from jwt import (
     PyJWTError,
 )
+from odmantic import (
+    AIOEngine,
+)
 from odmantic.session import (
     AIOSession,
 )
 from pydantic import (
     ValidationError,
 )
+from starlette.requests import (
+    Request,
+)
 from typing import (
     Any,
     Dict,
     Optional,
     Union,
 )
+import uuid
 
 from app.auth import (
     crud as auth_crud,
@@ -36,10 +43,14 @@ from app.auth import (
 from app.config import (
     settings,
 )
+from app.users import (
+    models as users_models,
+)
 from app.users.schemas import (
     UserObjectSchema,
 )
 from app.utils import (
+    cache,
     dependencies,
 )
 
@@ -80,7 +91,9 @@ async def create_access_token(
             expire = datetime.utcnow() + expires_delta
         else:
             expire = datetime.utcnow() + timedelta(days=15)
-        payload.update({"exp": expire})
+        # a unique id keeps two tokens issued within the same second of
+        # `exp` from being identical.
+        payload.update({"exp": expire, "jti": uuid.uuid4().hex})
         encoded_jwt_token = jwt.encode(
             payload,
             JWT_SECRET_KEY,
@@ -95,21 +108,34 @@ async def create_access_token(
 
 
 async def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
-    session: AIOSession = Depends(dependencies.get_db_transactional_session),
-) -> Optional[Dict[str, Any]]:
+    session: AIOEngine = Depends(dependencies.get_db_readonly_session),
+) -> cache.UserIdentity:
     """
-    This function is used to get the current user.
+    This function is used to get the identity of the current user.
     Args:
+        request (starlette.requests.Request): current request.
         token (str, optional): The token of the user. Defaults to None.
         session (odmantic.session.AIOSession): A MongoDB transactional session.
+    Note:
+        The identity is memoized on `request.state.current_user` for the
+        rest of the request, and resolved tokens are kept in
+        `app.utils.cache.token_cache`, so a warm request is served without
+        touching the database. Only the id, email, status and role are
+        cached: routes reading or writing the profile load a fresh user
+        with `get_current_user_document`.
     Raises:
         credentials_exception: If the token is invalid.
         credentials_exception: If the token is expired.
         credentials_exception: If the token is not found.
     Returns:
-        dict: The user object.
+        app.utils.cache.UserIdentity: The user identity.
     """
+    current_user = getattr(request.state, "current_user", None)
+    if current_user is not None:
+        return current_user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Unauthorized User!",
@@ -122,33 +148,94 @@ async def get_current_user(
             JWT_SECRET_KEY,
             algorithms=[JWT_ALGORITHM],
         )
-        email = payload.get("sub")
-        access_token = await auth_crud.find_existed_token(
-            email, token, session
-        )
-        if not access_token or not email:
-            raise credentials_exception
-        token_data = auth_schemas.TokenData(email=email)
+        token_data = auth_schemas.TokenData(email=payload.get("sub"))
     except (PyJWTError, ValidationError):
         raise credentials_exception
-    user = await auth_crud.find_existed_user(token_data.email, session)  # type: ignore
-    if not user:
+    if not token_data.email:
+        raise credentials_exception
+
+    cached_identity = cache.token_cache.get_token(token)
+    if cached_identity is not None:
+        user = cached_identity.user
+    else:
+        identity = await auth_crud.find_existed_identity(
+            token_data.email, token, session
+        )
+        if not identity:
+            raise credentials_exception
+        found_user, is_active = identity
+        user = found_user if is_active else None
+        cache.token_cache.set_token(
+            token,
+            owner=found_user.id,
+            user=user,
+            expires_at=payload.get("exp"),
+        )
+    if user is None:
         raise credentials_exception
+    request.state.current_user = user
     return user
 
 
 def get_current_active_user(
-    current_user: UserObjectSchema = Depends(get_current_user),
-) -> Union[UserObjectSchema, HTTPException]:
+    current_user: cache.UserIdentity = Depends(get_current_user),
+) -> Union[cache.UserIdentity, HTTPException]:
     """
     This function is check if user is active or not.
     Args:
-        current_user (UserObjectSchema): The user object.
+        current_user (app.utils.cache.UserIdentity): The user identity.
     Raises:
         HTTPException: If the token is invalid.
     Returns:
-        dict: The current user object.
+        app.utils.cache.UserIdentity: The current user identity.
     """
     if current_user.user_status == 0:
         raise HTTPException(status_code=400, detail="Inactive user!")
     return current_user
+
+
+def get_current_admin_user(
+    current_user: cache.UserIdentity = Depends(get_current_active_user),
+) -> cache.UserIdentity:
+    """
+    This function checks that the current user is an admin.
+    Args:
+        current_user (app.utils.cache.UserIdentity): The user identity.
+    Raises:
+        HTTPException: If the user isn't an admin.
+    Returns:
+        app.utils.cache.UserIdentity: The current user identity.
+    """
+    if current_user.user_role != users_models.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden!"
+        )
+    return current_user
+
+
+async def get_current_user_document(
+    current_user: cache.UserIdentity = Depends(get_current_active_user),
+    session: AIOSession = Depends(dependencies.get_db_session),
+) -> users_models.User:
+    """
+    This function loads the current user from the database, for routes
+    that read the whole profile or write it back.
+    Args:
+        current_user (app.utils.cache.UserIdentity): The user identity.
+        session (odmantic.session.AIOSession): The request session, shared
+            with the route so that its writes see the same document.
+    Raises:
+        HTTPException: If the user no longer exists.
+    Returns:
+        users_models.User: The current user object.
+    """
+    user = await session.find_one(
+        users_models.User, users_models.User.id == current_user.id
+    )
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized User!",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
@@ -0,0 +1,152 @@
+"""The utils pagination module."""
+
+import base64
+from bson import (
+    ObjectId,
+)
+from bson.errors import (
+    InvalidId,
+)
+from datetime import (
+    datetime,
+)
+import json
+from typing import (
+    Any,
+    Dict,
+    Tuple,
+)
+
+
+def encode_cursor(date: datetime, object_id: ObjectId) -> str:
+    """
+    Build an opaque cursor pointing at a document of a date sorted list.
+
+    Args:
+        date (datetime.datetime) : The sort date of the document.
+        object_id (bson.ObjectId) : The document id, used as a tie breaker.
+
+    Returns:
+        str: A url safe cursor.
+    """
+    payload = json.dumps([date.isoformat(), str(object_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """
+    Read a cursor built by `encode_cursor`.
+
+    Args:
+        cursor (str) : A cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        Tuple[datetime.datetime, bson.ObjectId]: The date and id it points at.
+    """
+    try:
+        date, object_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(date), ObjectId(object_id)
+    except (TypeError, ValueError, InvalidId) as err:
+        raise ValueError("Invalid cursor!") from err
+
+
+def get_cursor_query(
+    date_field: str, date: datetime, object_id: ObjectId, before: bool
+) -> Dict[str, Any]:
+    """
+    Build the filter selecting the documents past a cursor, in the
+    (date_field, _id) order.
+
+    Args:
+        date_field (str) : The name of the sort date field.
+        date (datetime.datetime) : The cursor date.
+        object_id (bson.ObjectId) : The cursor id.
+        before (bool) : Select the documents before the cursor, else after.
+
+    Returns:
+        Dict[str, Any]: A mongodb filter.
+    """
+    operator = "$lt" if before else "$gt"
+    return {
+        "$or": [
+            {date_field: {operator: date}},
+            {date_field: date, "_id": {operator: object_id}},
+        ]
+    }
+
+
+def encode_offset_cursor(offset: int) -> str:
+    """
+    Build an opaque cursor for results that can only be paged by offset,
+    e.g. sorted by relevance.
+
+    Args:
+        offset (int) : The number of results already returned.
+
+    Returns:
+        str: A url safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(offset).encode()).decode()
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    """
+    Read a cursor built by `encode_offset_cursor`.
+
+    Args:
+        cursor (str) : A cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        int: The offset it points at.
+    """
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError) as err:
+        raise ValueError("Invalid cursor!") from err
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor!")
+    return offset
+
+
+def encode_seq_cursor(seqs: Dict[ObjectId, int]) -> str:
+    """
+    Build an opaque cursor holding the last sequence number seen in each
+    conversation.
+
+    Args:
+        seqs (Dict[bson.ObjectId, int]) : The sequence numbers by conversation id.
+
+    Returns:
+        str: A url safe cursor.
+    """
+    payload = json.dumps({str(key): seq for key, seq in seqs.items()})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_seq_cursor(cursor: str) -> Dict[ObjectId, int]:
+    """
+    Read a cursor built by `encode_seq_cursor`.
+
+    Args:
+        cursor (str) : A cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        Dict[bson.ObjectId, int]: The sequence numbers by conversation id.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor))
+        seqs = {ObjectId(key): seq for key, seq in payload.items()}
+    except (AttributeError, TypeError, ValueError, InvalidId) as err:
+        raise ValueError("Invalid cursor!") from err
+    if not all(isinstance(seq, int) and seq >= 0 for seq in seqs.values()):
+        raise ValueError("Invalid cursor!")
+    return seqs
@@ -0,0 +1,248 @@
+"""The utils pinata module."""
+
+import asyncio
+from fastapi import (
+    UploadFile,
+)
+import httpx
+import json
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Optional,
+    Union,
+)
+import uuid
+
+from app.config import (
+    settings,
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PinataError(Exception):
+    """
+    Raised when a file can't be pinned.
+    """
+
+
+class PinataClient:
+    """
+    An async Pinata client sharing one pooled HTTP connection per worker.
+
+    Uploads are streamed as multipart bodies straight from the incoming
+    bytes or `UploadFile`, without being written to disk, and at most
+    `max_concurrency` uploads run at once.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        api_secret: str,
+        gateway_url: str,
+        timeout: float,
+        max_concurrency: int,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        """
+        A constructor that sets the Pinata endpoints and the upload bounds.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            api_url (str) : The Pinata api url, e.g. a local fake server.
+            api_key (str) : A Pinata api key.
+            api_secret (str) : A Pinata api secret.
+            gateway_url (str) : The IPFS gateway url the pinned files are served from.
+            timeout (float) : Seconds to wait for a connection or a read.
+            max_concurrency (int) : The max number of uploads in flight.
+            transport (httpx.AsyncBaseTransport) : A custom transport, if any.
+        """
+        self.api_url = api_url.rstrip("/")
+        self.gateway_url = gateway_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._headers = {
+            "pinata_api_key": api_key or "",
+            "pinata_secret_api_key": api_secret or "",
+        }
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._counters = {"pinned": 0, "unpinned": 0, "failed": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                headers=self._headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """
+        Close the pooled connections.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_url(self, cid: str, filename: str) -> str:
+        """
+        Get the gateway url of a pinned file.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            cid (str) : The IPFS hash of the wrapping directory.
+            filename (str) : The file name inside the directory.
+
+        Returns:
+            str: The file url.
+        """
+        return f"{self.gateway_url}/{cid}/{filename}"
+
+    async def pin_file(
+        self,
+        source: Union[bytes, UploadFile, AsyncIterable[bytes]],
+        filename: Optional[str] = None,
+        content_type: str = "application/octet-stream",
+        size: Optional[int] = None,
+    ) -> str:
+        """
+        Pin a file, wrapped in a directory, and get the directory hash.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            source (bytes | fastapi.UploadFile | AsyncIterable[bytes]) : The file content.
+            filename (str) : The pinned file name, a random one by default.
+            content_type (str) : The file content type.
+            size (int) : The file size, if known, sent as the content length.
+
+        Raises:
+            PinataError: If the upload fails or times out.
+
+        Returns:
+            str: The IPFS hash of the wrapping directory.
+        """
+        filename = filename or uuid.uuid4().hex
+        boundary = uuid.uuid4().hex
+        head = _get_multipart_head(boundary, filename, content_type)
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        if isinstance(source, bytes):
+            size = len(source)
+        elif isinstance(source, UploadFile):
+            size = source.size
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        if size is not None:
+            headers["Content-Length"] = str(len(head) + size + len(tail))
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                response = await self._get_client().post(
+                    "/pinning/pinFileToIPFS",
+                    content=_iter_multipart(head, source, tail),
+                    headers=headers,
+                )
+                response.raise_for_status()
+                cid = response.json()["IpfsHash"]
+            except (httpx.HTTPError, KeyError, ValueError) as err:
+                self._counters["failed"] += 1
+                raise PinataError(
+                    f"Failed to pin {filename}: {err!r}"
+                ) from err
+            finally:
+                self._in_flight -= 1
+        self._counters["pinned"] += 1
+        return cid
+
+    async def unpin(self, cid: str) -> None:
+        """
+        Unpin a file.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            cid (str) : The IPFS hash of the pinned directory.
+
+        Raises:
+            PinataError: If the request fails or times out.
+        """
+        async with self._semaphore:
+            try:
+                response = await self._get_client().delete(
+                    f"/pinning/unpin/{cid}"
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as err:
+                raise PinataError(f"Failed to unpin {cid}: {err!r}") from err
+        self._counters["unpinned"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the upload counters.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            Dict[str, int]: The concurrency limit and the upload counters.
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            **self._counters,
+        }
+
+
+def _get_multipart_head(
+    boundary: str, filename: str, content_type: str
+) -> bytes:
+    options = json.dumps({"wrapWithDirectory": True})
+    return (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="pinataOptions"\r\n\r\n'
+        f"{options}\r\n"
+        f"--{boundary}\r\n"
+        "Content-Disposition: form-data; "
+        f'name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+
+
+async def _iter_multipart(
+    head: bytes,
+    source: Union[bytes, UploadFile, AsyncIterable[bytes]],
+    tail: bytes,
+) -> AsyncIterator[bytes]:
+    yield head
+    if isinstance(source, bytes):
+        yield source
+    elif isinstance(source, UploadFile):
+        await source.seek(0)
+        while chunk := await source.read(CHUNK_SIZE):
+            yield chunk
+    else:
+        async for chunk in source:
+            yield chunk
+    yield tail
+
+
+pinata = PinataClient(
+    api_url=settings().PINATA_API_URL,
+    api_key=settings().PINATA_API_KEY,
+    api_secret=settings().PINATA_API_SECRET,
+    gateway_url=settings().PINATA_GATEWAY_URL,
+    timeout=settings().PINATA_TIMEOUT_SECONDS,
+    max_concurrency=settings().PINATA_MAX_CONCURRENT_UPLOADS,
+)
@@ -0,0 +1,220 @@
+"""The utils responses module."""
+
+import anyio
+import os
+import re
+from starlette.requests import (
+    Request,
+)
+from starlette.responses import (
+    JSONResponse,
+    Response,
+)
+from starlette.types import (
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+from typing import (
+    Dict,
+    Optional,
+    Tuple,
+)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileSliceResponse(Response):
+    """
+    A response sending a byte range of a file. The file is handed over to
+    the server when it advertises the ASGI `http.response.pathsend`
+    extension, for a whole file, or `http.response.zerocopy`, and read in
+    chunks otherwise. Its background task runs once the response ends,
+    even if it fails.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        length: int,
+        status_code: int,
+        headers: Dict[str, str],
+        media_type: str,
+    ) -> None:
+        """
+        A constructor that sets the file slice and the response headers.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            path (str) : The file path.
+            start (int) : The offset of the first byte to send.
+            length (int) : The number of bytes to send.
+            status_code (int) : The response status code, 200 for the whole file or 206.
+            headers (Dict[str, str]) : The response headers.
+            media_type (str) : The file content type.
+        """
+        self.path = os.path.abspath(path)
+        self.start = start
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        start_message: Message = {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        }
+        try:
+            extensions = scope.get("extensions") or {}
+            if scope["method"].upper() == "HEAD":
+                await send(start_message)
+                await send({"type": "http.response.body", "body": b""})
+            elif (
+                "http.response.pathsend" in extensions
+                and self.status_code == 200
+            ):
+                await send(start_message)
+                await send(
+                    {"type": "http.response.pathsend", "path": self.path}
+                )
+            elif "http.response.zerocopy" in extensions:
+                await self._send_zerocopy(send, start_message)
+            else:
+                await self._send_file(send, start_message)
+        finally:
+            if self.background is not None:
+                with anyio.CancelScope(shield=True):
+                    await self.background()
+
+    async def _send_zerocopy(self, send: Send, start_message: Message) -> None:
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await send(start_message)
+            await send(
+                {
+                    "type": "http.response.zerocopy",
+                    "file": file.wrapped,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                }
+            )
+
+    async def _send_file(self, send: Send, start_message: Message) -> None:
+        # opened before the headers are sent, a missing file fails the
+        # response as a whole rather than truncating it.
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await send(start_message)
+            await file.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+        if remaining > 0 or not self.length:
+            # empty, or the file shrank after the headers were sent.
+            await send({"type": "http.response.body", "body": b""})
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=start-end` range header.
+
+    Args:
+        header (str) : The `Range` header value.
+        size (int) : The file size.
+
+    Raises:
+        ValueError: If the range can't be satisfied.
+
+    Returns:
+        Optional[Tuple[int, int]]: The first and last byte offsets, None if
+            the header isn't a single byte range, in which case the whole
+            file is sent.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # a suffix range, the last bytes of the file.
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable!")
+    return start, end
+
+
+async def get_file_response(
+    request: Request,
+    path: str,
+    media_type: str,
+    etag: str,
+    cache_control: str,
+) -> Response:
+    """
+    Serve a file with conditional and range requests support.
+
+    Args:
+        request (starlette.requests.Request) : The current request.
+        path (str) : The file path.
+        media_type (str) : The file content type.
+        etag (str) : A strong entity tag of the file content.
+        cache_control (str) : The `Cache-Control` header value.
+
+    Returns:
+        starlette.responses.Response: The file, a part of it, a 304, a 404
+            or a 416.
+    """
+    try:
+        size = (await anyio.to_thread.run_sync(os.stat, path)).st_size
+    except FileNotFoundError:
+        return JSONResponse(
+            status_code=404,
+            content={"status_code": 404, "message": "File not found!"},
+        )
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (
+        tag.strip() for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=304, headers=headers)
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "content-range": f"bytes */{size}"},
+            )
+    if byte_range is None:
+        return FileSliceResponse(path, 0, size, 200, headers, media_type)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return FileSliceResponse(
+        path, start, end - start + 1, 206, headers, media_type
+    )
@@ -0,0 +1,340 @@
+"""The utils uploads module."""
+
+import anyio
+from fastapi import (
+    UploadFile,
+)
+import hashlib
+import json
+import os
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+import tempfile
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Optional,
+)
+
+from app.config import (
+    settings,
+)
+
+CHUNK_SIZE = 64 * 1024
+
+# room for the multipart boundaries and headers around the file.
+MULTIPART_OVERHEAD = 16 * 1024
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload is rejected.
+    """
+
+    status_code = 400
+
+
+class UploadTooLargeError(UploadError):
+    """
+    Raised when an upload exceeds the size limit.
+    """
+
+    status_code = 413
+
+
+class UnsupportedMediaTypeError(UploadError):
+    """
+    Raised when an upload isn't a supported image.
+    """
+
+    status_code = 415
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Detect the type of an image from its first bytes.
+
+    Args:
+        head (bytes) : The first bytes of a file.
+
+    Returns:
+        Optional[str]: The image content type, None if it isn't supported.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def check_image(data: bytes, max_size: int) -> str:
+    """
+    Check the size and the type of an image already in memory.
+
+    Args:
+        data (bytes) : The image content.
+        max_size (int) : The max image size in bytes.
+
+    Raises:
+        UploadTooLargeError: If the image is too large.
+        UnsupportedMediaTypeError: If the image type isn't supported.
+
+    Returns:
+        str: The image content type.
+    """
+    if len(data) > max_size:
+        raise UploadTooLargeError("The file is too large!")
+    content_type = sniff_image_type(data[:CHUNK_SIZE])
+    if content_type is None:
+        raise UnsupportedMediaTypeError("Unsupported file type!")
+    return content_type
+
+
+class UploadStream:
+    """
+    Read an uploaded image in fixed size chunks, enforcing the size limit
+    and hashing the content as it is forwarded, so that memory use stays
+    constant whatever the file size.
+    """
+
+    def __init__(
+        self,
+        file: UploadFile,
+        max_size: int,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        """
+        A constructor that sets the file and its bounds.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            file (fastapi.UploadFile) : The uploaded file.
+            max_size (int) : The max file size in bytes.
+            chunk_size (int) : The number of bytes read at once.
+        """
+        self.file = file
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._head = b""
+
+    async def open(self) -> None:
+        """
+        Read the first chunk to check the file type before forwarding it.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Raises:
+            UploadTooLargeError: If the file size is known and too large.
+            UnsupportedMediaTypeError: If the file isn't a supported image.
+        """
+        if self.file.size is not None and self.file.size > self.max_size:
+            raise UploadTooLargeError("The file is too large!")
+        await self.file.seek(0)
+        self._head = await self.file.read(self.chunk_size)
+        self.content_type = sniff_image_type(self._head)
+        if self.content_type is None:
+            raise UnsupportedMediaTypeError("Unsupported file type!")
+
+    async def rewind(self) -> None:
+        """
+        Go back to the start of the file to stream it again.
+
+        Args:
+            self ( _obj_ ) : object reference.
+        """
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        await self.open()
+
+    @property
+    def sha256(self) -> str:
+        """
+        Get the digest of the bytes read so far.
+
+        Args:
+            self ( _obj_ ) : object reference.
+
+        Returns:
+            str: The hex sha256 digest.
+        """
+        return self._sha256.hexdigest()
+
+    def _consume(self, chunk: bytes) -> bytes:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadTooLargeError("The file is too large!")
+        self._sha256.update(chunk)
+        return chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self.content_type is None:
+            await self.open()
+        chunk = self._head
+        while chunk:
+            yield self._consume(chunk)
+            chunk = await self.file.read(self.chunk_size)
+
+
+async def spool_to_file(chunks: AsyncIterable[bytes]) -> str:
+    """
+    Write a stream to a temporary file, e.g. for a worker process to read
+    it, without holding it in memory.
+
+    Args:
+        chunks (AsyncIterable[bytes]) : The content.
+
+    Returns:
+        str: The temporary file path, to be removed by the caller.
+    """
+    descriptor, path = tempfile.mkstemp(prefix="upload-")
+    os.close(descriptor)
+    try:
+        async with await anyio.open_file(path, mode="wb") as file:
+            async for chunk in chunks:
+                await file.write(chunk)
+    except BaseException:
+        await anyio.Path(path).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def get_upload_path(file: UploadFile) -> Optional[str]:
+    """
+    Get a path other processes can read an upload from, when it is
+    already on disk, so that it isn't copied to another file.
+
+    Note:
+        Uploads larger than the multipart spool size are moved to an
+        unnamed temporary file, only reachable through `/proc` while it is
+        open, e.g. on Linux.
+
+    Args:
+        file (fastapi.UploadFile) : The uploaded file.
+
+    Returns:
+        Optional[str]: The file path, None if the upload is in memory or
+            has no path.
+    """
+    spooled = file.file
+    if isinstance(spooled, tempfile.SpooledTemporaryFile):
+        if not spooled._rolled:  # pylint: disable=W0212
+            return None
+        spooled.flush()
+    name = getattr(spooled, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    try:
+        path = f"/proc/{os.getpid()}/fd/{spooled.fileno()}"
+    except (OSError, ValueError):
+        return None
+    return path if os.path.exists(path) else None
+
+
+class MaxBodySizeMiddleware:
+    """
+    An ASGI middleware rejecting the requests whose body is larger than a
+    limit: a declared length is checked before the body is read, the
+    bytes received are counted as the body is read, so that a chunked
+    body can't be spooled past the limit either.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int) -> None:
+        """
+        A constructor that sets the wrapped app and the limit.
+
+        Args:
+            self ( _obj_ ) : object reference.
+            app (starlette.types.ASGIApp) : The wrapped app.
+            max_body_size (int) : The max body size in bytes.
+        """
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if (
+                name == b"content-length"
+                and value.isdigit()
+                and int(value) > self.max_body_size
+            ):
+                await self._reject(send)
+                return
+        received = 0
+        exceeded = started = False
+
+        async def receive_limited() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise UploadTooLargeError("The request is too large!")
+            return message
+
+        async def send_response(message: Message) -> None:
+            nonlocal started
+            # the app answers an unreadable body, the 413 is sent instead.
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_response)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        body = json.dumps(
+            {"status_code": 413, "message": "The request is too large!"}
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def get_max_body_size() -> int:
+    """
+    Get the max request body size, an upload along with its multipart
+    envelope.
+
+    Returns:
+        int: The max body size in bytes.
+    """
+    return settings().MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
@@ -1,8 +1,5 @@
 """The websockets router module."""
 
-from asyncio import (
-    ensure_future,
-)
 import base64
 from fastapi import (
     APIRouter,
@@ -28,6 +25,7 @@ from app.auth import (
 )
 from app.messages import (
     crud as messages_crud,
+    pipeline as messages_pipeline,
 )
 from app.utils import (
     dependencies,
@@ -120,24 +118,26 @@ async def websocket_chat_endpoint(
                         "RECIEVED: %s",
                         json.dumps(message_data, default=str),  # noqa: E501
                     )
-                    await manager.broadcast(
-                        json.dumps(message_data, default=str)
-                    )
                     receiver = await auth_crud.find_existed_user_id(
                         receiver_id, session
                     )
-                    request = RequestObject(
-                        receiver.email,  # type: ignore
-                        message_data["content"],
-                        message_data["type"],
-                        "",
-                    )
-                    ensure_future(
-                        messages_crud.send_new_message(
-                            sender_id, request, None, session  # type: ignore
+                    if (
+                        receiver
+                        and message_data.get("content")
+                        and receiver.id != sender.id  # type: ignore
+                    ):
+                        # waits while the persistence queue is full, which
+                        # stops reading frames from this client, so that a
+                        # message is only broadcast once queued.
+                        await messages_pipeline.pipeline.put(
+                            sender_id,
+                            receiver.id,
+                            message_data["content"],
+                            message_data["type"],
                         )
+                    await manager.broadcast(
+                        json.dumps(message_data, default=str)
                     )
-                    del request
             else:
                 logger.warning(
                     "Websocket state: %s, reconnecting...",
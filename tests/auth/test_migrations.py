@@ -0,0 +1,62 @@
+"""Tests of the auth migrations module."""
+
+import pytest
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+import jwt
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    List,
+)
+
+from app.auth import (
+    migrations,
+    models as auth_models,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    crypt,
+    jwt as jwt_utils,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_legacy_tokens_are_hashed_into_access_tokens(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    user = users[0]
+    valid = [
+        (
+            await jwt_utils.create_access_token(
+                data={"sub": user.email}, expires_delta=timedelta(days=1)
+            )
+        )["access_token"]
+        for _ in range(2)
+    ]
+    expired = jwt.encode(
+        {"sub": user.email, "exp": datetime.utcnow() - timedelta(days=1)},
+        jwt_utils.JWT_SECRET_KEY,
+        algorithm=jwt_utils.JWT_ALGORITHM,
+    )
+    legacy_tokens = db_engine.database[migrations.LEGACY_TOKENS_COLLECTION]
+    await legacy_tokens.insert_one(
+        {"user": user.id, "tokens": [expired, "not-a-token", *valid]}
+    )
+    assert await migrations.migrate_access_tokens(db_engine) == 2
+    # resumable: migrated documents are deleted.
+    assert await migrations.migrate_access_tokens(db_engine) == 0
+    assert await legacy_tokens.count_documents({}) == 0
+    tokens = await db_engine.find(auth_models.AccessToken)
+    assert sorted(token.token_hash for token in tokens) == sorted(
+        crypt.hash_token(token) for token in valid
+    )
+    assert all(token.user == user.id for token in tokens)
+    assert all(token.expires_at > datetime.utcnow() for token in tokens)
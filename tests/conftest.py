@@ -0,0 +1,81 @@
+"""Shared test configuration."""
+
+import os
+
+# settings are read once at import time, set them before the app loads.
+os.environ.setdefault("JWT_SECRET_KEY", "testing-secret-key-testing-secret")
+os.environ.setdefault("MEDIA_STORAGE", "local")
+
+import pytest
+
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+from odmantic import (
+    AIOEngine,
+)
+from pydantic import (
+    EmailStr,
+)
+from typing import (
+    List,
+)
+
+from app.users import (
+    models as users_models,
+)
+from tests import (
+    fakes,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """
+    Run the async tests on asyncio only, the loop the app is served on.
+    """
+    return "asyncio"
+
+
+@pytest.fixture
+def db_engine(monkeypatch: pytest.MonkeyPatch) -> AIOEngine:
+    """
+    An engine over an in-memory database whose sessions support the
+    transaction calls, without isolating them.
+    """
+    fakes.ignore_sessions(monkeypatch)
+    client = AsyncMongoMockClient()
+
+    async def start_session(**kwargs: object) -> fakes.FakeDriverSession:
+        return fakes.FakeDriverSession()
+
+    monkeypatch.setattr(client, "start_session", start_session)
+    return AIOEngine(client=client, database="tests")
+
+
+def new_user(email: str) -> users_models.User:
+    return users_models.User(
+        first_name="First",
+        last_name="Last",
+        birthday="2000-01-01",
+        gender=users_models.UserGender.MAN,
+        interests=users_models.GenderInterests.WOMAN,
+        display_gender=users_models.DisplayGender.YES,
+        passion="swimming",
+        email=EmailStr(email),
+        password="hashed",
+        profile_picture="",
+        phone_number=None,
+    )
+
+
+@pytest.fixture
+async def users(db_engine: AIOEngine) -> List[users_models.User]:
+    """
+    Two users saved in the in-memory database.
+    """
+    return list(
+        await db_engine.save_all(
+            [new_user("sender@test.com"), new_user("receiver@test.com")]
+        )
+    )
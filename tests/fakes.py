@@ -0,0 +1,142 @@
+"""Fakes of the external services used by the tests."""
+
+import pytest
+
+import functools
+import inspect
+from mongomock import (
+    collection as mongomock_collection,
+    database as mongomock_database,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+
+class FakeDriverSession:
+    """
+    A motor session recording the transaction calls, failing the next
+    commits with the given errors.
+    """
+
+    def __init__(self, commit_errors: Optional[List[Exception]] = None):
+        self.in_transaction = False
+        self.calls: List[str] = []
+        self.commit_errors = list(commit_errors or [])
+
+    def start_transaction(self) -> None:
+        assert not self.in_transaction, "Transaction already in progress"
+        self.in_transaction = True
+        self.calls.append("start")
+
+    async def commit_transaction(self) -> None:
+        self.calls.append("commit")
+        # like the driver, a commit attempt always ends the transaction.
+        self.in_transaction = False
+        if self.commit_errors:
+            raise self.commit_errors.pop(0)
+
+    async def abort_transaction(self) -> None:
+        self.calls.append("abort")
+        self.in_transaction = False
+
+    async def end_session(self) -> None:
+        return None
+
+    async def __aenter__(self) -> "FakeDriverSession":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.end_session()
+
+
+def _without_session(method: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(method)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        kwargs.pop("session", None)
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+def ignore_sessions(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Let mongomock accept the `session` argument of the driver calls, which
+    it otherwise refuses.
+
+    Args:
+        monkeypatch (pytest.MonkeyPatch) : The test monkeypatch fixture.
+    """
+    for cls in (mongomock_collection.Collection, mongomock_database.Database):
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not callable(method):
+                continue
+            parameters = inspect.signature(method).parameters
+            if "session" in parameters or "kwargs" in parameters:
+                monkeypatch.setattr(cls, name, _without_session(method))
+
+
+class TextSearchCursor:
+    """
+    A cursor over the results of a fake text search, already sorted by
+    relevance.
+    """
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self.documents = documents
+        self.start = 0
+        self.count = 0
+
+    def sort(self, *args: Any, **kwargs: Any) -> "TextSearchCursor":
+        return self
+
+    def skip(self, start: int) -> "TextSearchCursor":
+        self.start = start
+        return self
+
+    def limit(self, count: int) -> "TextSearchCursor":
+        self.count = count
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        start = self.start
+        end = start + self.count if self.count else None
+        return iter(self.documents[start:end])
+
+
+def search_text(monkeypatch: pytest.MonkeyPatch, field: str) -> None:
+    """
+    Let mongomock run `$text` queries over a field, which it otherwise
+    refuses: a document scores the number of search terms it contains,
+    the most relevant and then the newest first.
+
+    Args:
+        monkeypatch (pytest.MonkeyPatch) : The test monkeypatch fixture.
+        field (str) : The text indexed field.
+    """
+    find: Callable[..., Any] = mongomock_collection.Collection.find
+
+    def text_find(
+        self: Any, filter: Any = None, *args: Any, **kwargs: Any
+    ) -> Any:
+        if not filter or "$text" not in filter:
+            return find(self, filter, *args, **kwargs)
+        filter = dict(filter)
+        terms = filter.pop("$text")["$search"].lower().split()
+        documents = []
+        for document in find(self, filter):
+            words = str(document.get(field, "")).lower().split()
+            score = sum(term in words for term in terms)
+            if score:
+                documents.append({**document, "score": float(score)})
+        documents.sort(
+            key=lambda doc: (doc["score"], doc["_id"]), reverse=True
+        )
+        return TextSearchCursor(documents)
+
+    monkeypatch.setattr(mongomock_collection.Collection, "find", text_find)
@@ -0,0 +1,112 @@
+"""Tests of the media cache module."""
+
+import pytest
+
+import anyio
+import asyncio
+import httpx
+import os
+from typing import (
+    List,
+)
+
+from app.media import (
+    cache as media_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+CID = "QmYwAPJzv5CZsnAzt8auVZRn1sjkY3Nio7Wr5Xm7ib3hV9"
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1000
+
+
+def new_cache(
+    root: str, requests: List[httpx.Request], max_bytes: int = 4096
+) -> media_cache.GatewayCache:
+    """
+    A cache of a fake gateway serving an image, or text for `.txt` files,
+    after yielding to the other requests.
+    """
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0.01)
+        if request.url.path.endswith(".txt"):
+            return httpx.Response(200, content=b"not an image")
+        return httpx.Response(200, content=IMAGE)
+
+    return media_cache.GatewayCache(
+        root=root,
+        max_bytes=max_bytes,
+        max_file_bytes=len(IMAGE),
+        gateway_url="https://gateway.test/ipfs",
+        timeout=1,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+async def test_cached_files_are_counted_once(tmp_path: str) -> None:
+    requests: List[httpx.Request] = []
+    cache = new_cache(str(tmp_path), requests)
+    for filename in ("a", "b"):
+        path = cache.get_path(cache.get_key(CID, filename))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(IMAGE)
+    # both requests find the index unloaded, it is only loaded once.
+    results = await asyncio.gather(cache.get(CID, "a"), cache.get(CID, "b"))
+    assert [content_type for _, content_type in results] == ["image/png"] * 2
+    stats = cache.stats()
+    assert (stats["bytes"], stats["entries"], stats["hits"]) == (2016, 2, 2)
+    assert stats["pinned"] == 2
+    assert requests == []
+    await cache.release(CID, "a")
+    await cache.release(CID, "b")
+    assert cache.stats()["pinned"] == 0
+
+
+async def test_concurrent_misses_share_one_fetch(tmp_path: str) -> None:
+    requests: List[httpx.Request] = []
+    cache = new_cache(str(tmp_path), requests)
+    results = await asyncio.gather(*(cache.get(CID, "a") for _ in range(3)))
+    assert len(set(results)) == 1
+    path, _ = results[0]
+    assert await anyio.Path(path).read_bytes() == IMAGE
+    assert [str(request.url) for request in requests] == [
+        f"https://gateway.test/ipfs/{CID}/a"
+    ]
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["bytes"]) == (
+        1,
+        2,
+        len(IMAGE),
+    )
+    for _ in results:
+        await cache.release(CID, "a")
+    assert cache.stats()["pinned"] == 0
+
+
+async def test_pinned_media_are_not_evicted(tmp_path: str) -> None:
+    requests: List[httpx.Request] = []
+    cache = new_cache(str(tmp_path), requests, max_bytes=1500)
+    first, _ = await cache.get(CID, "a")
+    second, _ = await cache.get(CID, "b")
+    # both are being served, the bound is only enforced once released.
+    assert cache.stats()["bytes"] == 2016
+    assert os.path.exists(first) and os.path.exists(second)
+    await cache.release(CID, "a")
+    assert not os.path.exists(first) and os.path.exists(second)
+    stats = cache.stats()
+    assert (stats["bytes"], stats["evictions"]) == (len(IMAGE), 1)
+    await cache.release(CID, "b")
+    assert os.path.exists(second)
+
+
+async def test_non_images_are_rejected(tmp_path: str) -> None:
+    requests: List[httpx.Request] = []
+    cache = new_cache(str(tmp_path), requests)
+    with pytest.raises(media_cache.GatewayError):
+        await cache.get(CID, "a.txt")
+    stats = cache.stats()
+    assert (stats["errors"], stats["entries"], stats["pinned"]) == (1, 0, 0)
+    assert not os.path.exists(cache.get_path(cache.get_key(CID, "a.txt")))
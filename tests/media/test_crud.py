@@ -0,0 +1,234 @@
+"""Tests of the media crud module."""
+
+import pytest
+
+import anyio
+from datetime import (
+    datetime,
+    timedelta,
+)
+from fastapi import (
+    UploadFile,
+)
+from io import (
+    BytesIO,
+)
+from odmantic import (
+    AIOEngine,
+)
+import os
+import tempfile
+from typing import (
+    Dict,
+    List,
+    Union,
+)
+
+from app.media import (
+    crud as media_crud,
+    images,
+    models as media_models,
+    storage as media_storage,
+)
+from app.utils import (
+    uploads,
+)
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"pixels"
+
+
+@pytest.fixture
+def local_storage(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> media_storage.LocalStorage:
+    local_storage = media_storage.LocalStorage(
+        str(tmp_path), "http://testserver/media"
+    )
+    monkeypatch.setattr(media_storage, "storage", local_storage)
+    return local_storage
+
+
+@pytest.fixture
+def renders(monkeypatch: pytest.MonkeyPatch) -> List[bytes]:
+    """
+    Render fake WebP variants in process, recording the rendered images.
+    """
+    rendered: List[bytes] = []
+
+    async def render(data: Union[bytes, str]) -> Dict[str, bytes]:
+        if isinstance(data, str):
+            with open(data, "rb") as file:
+                data = file.read()
+        rendered.append(data)
+        return {
+            name: b"RIFF\x00\x00\x00\x00WEBP" + name.encode() + data
+            for name in images.VARIANT_SIZES
+        }
+
+    monkeypatch.setattr(images.processor, "render", render)
+    return rendered
+
+
+async def get_ref_counts(db_engine: AIOEngine) -> Dict[str, int]:
+    return {
+        media.url: media.ref_count
+        for media in await db_engine.find(media_models.MediaObject)
+    }
+
+
+async def test_store_image_renders_an_upload_once(
+    db_engine: AIOEngine,
+    local_storage: media_storage.LocalStorage,
+    renders: List[bytes],
+) -> None:
+    first = await media_crud.store_image(IMAGE, db_engine)
+    second = await media_crud.store_image(IMAGE, db_engine)
+    assert first == second
+    assert renders == [IMAGE]
+    assert await get_ref_counts(db_engine) == {
+        url: 2 for url in first.values()
+    }
+
+
+async def test_store_image_spools_uploads_for_the_worker(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    local_storage: media_storage.LocalStorage,
+    renders: List[bytes],
+) -> None:
+    render = images.processor.render
+    paths: List[str] = []
+
+    async def render_path(data: Union[bytes, str]) -> Dict[str, bytes]:
+        assert isinstance(data, str) and os.path.exists(data)
+        paths.append(data)
+        return await render(data)
+
+    monkeypatch.setattr(images.processor, "render", render_path)
+    upload = UploadFile(BytesIO(IMAGE), size=len(IMAGE), filename="a.png")
+    urls = await media_crud.store_image(upload, db_engine)
+    assert renders == [IMAGE]
+    assert not os.path.exists(paths[0])
+    # the same content sent as bytes is recognized.
+    assert await media_crud.store_image(IMAGE, db_engine) == urls
+    assert len(renders) == 1
+
+
+async def test_store_image_reads_uploads_on_disk_in_place(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    local_storage: media_storage.LocalStorage,
+    renders: List[bytes],
+) -> None:
+    render = images.processor.render
+    paths: List[str] = []
+
+    async def render_path(data: Union[bytes, str]) -> Dict[str, bytes]:
+        assert isinstance(data, str)
+        paths.append(data)
+        return await render(data)
+
+    monkeypatch.setattr(images.processor, "render", render_path)
+    spooled = tempfile.SpooledTemporaryFile(max_size=1)
+    spooled.write(IMAGE)
+    upload = UploadFile(spooled, size=len(IMAGE))  # type: ignore
+    await media_crud.store_image(upload, db_engine)
+    assert renders == [IMAGE]
+    # the worker was handed the upload itself, not a copy.
+    assert paths == [uploads.get_upload_path(upload)]
+
+
+async def test_store_image_renders_again_once_a_variant_is_gone(
+    db_engine: AIOEngine,
+    local_storage: media_storage.LocalStorage,
+    renders: List[bytes],
+) -> None:
+    first = await media_crud.store_image(IMAGE, db_engine)
+    await media_crud.release_media(first["thumbnail"], db_engine)
+    second = await media_crud.store_image(IMAGE, db_engine)
+    assert first == second
+    assert renders == [IMAGE, IMAGE]
+    assert await get_ref_counts(db_engine) == {
+        first["thumbnail"]: 1,
+        first["medium"]: 2,
+        first["full"]: 2,
+    }
+
+
+async def test_release_media_deletes_on_last_reference(
+    db_engine: AIOEngine, local_storage: media_storage.LocalStorage
+) -> None:
+    url = await media_crud.store_media(IMAGE, db_engine)
+    assert url == await media_crud.store_media(IMAGE, db_engine)
+    (media,) = await db_engine.find(media_models.MediaObject)
+    path = local_storage.get_path(media.sha256)
+    await media_crud.release_media(url, db_engine)
+    assert await get_ref_counts(db_engine) == {url: 1}
+    assert os.path.exists(path)
+    await media_crud.release_media(url, db_engine)
+    assert await get_ref_counts(db_engine) == {}
+    assert not os.path.exists(path)
+    # releasing an unknown url is a no-op.
+    await media_crud.release_media(url, db_engine)
+
+
+async def test_store_media_waits_for_a_pending_deletion(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    local_storage: media_storage.LocalStorage,
+) -> None:
+    url = await media_crud.store_media(IMAGE, db_engine)
+    (media,) = await db_engine.find(media_models.MediaObject)
+    path = local_storage.get_path(media.sha256)
+    delete = local_storage.delete
+    deleting, deleted = anyio.Event(), anyio.Event()
+
+    async def slow_delete(location: str, key: str) -> None:
+        deleting.set()
+        await deleted.wait()
+        await delete(location, key)
+
+    monkeypatch.setattr(local_storage, "delete", slow_delete)
+    urls: List[str] = []
+
+    async def store() -> None:
+        urls.append(await media_crud.store_media(IMAGE, db_engine))
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(media_crud.release_media, url, db_engine)
+        await deleting.wait()
+        task_group.start_soon(store)
+        await anyio.sleep(media_crud.DELETE_POLL_SECONDS * 2)
+        # the upload isn't saved before the deletion ends.
+        assert urls == []
+        deleted.set()
+    assert urls == [url]
+    assert os.path.exists(path)
+    (media,) = await db_engine.find(media_models.MediaObject)
+    assert (media.ref_count, media.deleting) == (1, False)
+
+
+async def test_store_media_takes_over_stale_deletions(
+    db_engine: AIOEngine, local_storage: media_storage.LocalStorage
+) -> None:
+    url = await media_crud.store_media(IMAGE, db_engine)
+    # the worker deleting the media died before deleting its document.
+    stale_date = datetime.utcnow() - timedelta(
+        seconds=media_crud.DELETE_TIMEOUT_SECONDS + 1
+    )
+    await db_engine.get_collection(media_models.MediaObject).update_one(
+        {"url": url},
+        {
+            "$set": {
+                "ref_count": 0,
+                "deleting": True,
+                "modified_date": stale_date,
+            }
+        },
+    )
+    assert await media_crud.store_media(IMAGE, db_engine) == url
+    (media,) = await db_engine.find(media_models.MediaObject)
+    assert (media.ref_count, media.deleting) == (1, False)
+    assert os.path.exists(local_storage.get_path(media.sha256))
@@ -0,0 +1,109 @@
+"""Tests of the media images module."""
+
+import pytest
+
+from PIL import Image
+from concurrent.futures import (
+    Executor,
+    Future,
+)
+from concurrent.futures.process import (
+    BrokenProcessPool,
+)
+from io import (
+    BytesIO,
+)
+from typing import (
+    Any,
+    Callable,
+    List,
+)
+
+from app.media import (
+    images,
+)
+from app.utils import (
+    uploads,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeExecutor(Executor):
+    """
+    An executor running the calls in process, or failing them as a broken
+    process pool would.
+    """
+
+    def __init__(self, broken: bool) -> None:
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> "Future[Any]":
+        future: "Future[Any]" = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("A worker died!"))
+        else:
+            future.set_result(fn(*args, **kwargs))
+        return future
+
+    def shutdown(self, wait: bool = True, **kwargs: Any) -> None:
+        self.shut_down = True
+
+
+def new_png(width: int, height: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_render_variants_rejects_too_many_pixels(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # below twice the limit, Pillow itself would only warn.
+    monkeypatch.setattr(images, "MAX_IMAGE_PIXELS", 150)
+    with pytest.warns(Image.DecompressionBombWarning):
+        with pytest.raises(ValueError):
+            images.render_variants(new_png(20, 10), 80)
+    variants = images.render_variants(new_png(10, 10), 80)
+    assert set(variants) == set(images.VARIANT_SIZES)
+
+
+def new_processor(
+    monkeypatch: pytest.MonkeyPatch, executors: List[FakeExecutor]
+) -> images.ImageProcessor:
+    pending = list(executors)
+    monkeypatch.setattr(
+        images.ImageProcessor, "_create_executor", lambda self: pending.pop(0)
+    )
+    return images.ImageProcessor(max_workers=1, max_queue=1, quality=80)
+
+
+async def test_render_replaces_a_broken_pool(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    executors = [FakeExecutor(broken=True), FakeExecutor(broken=False)]
+    processor = new_processor(monkeypatch, executors)
+    variants = await processor.render(new_png(10, 10))
+    assert set(variants) == set(images.VARIANT_SIZES)
+    assert executors[0].shut_down
+    assert processor.stats()["restarts"] == 1
+
+
+async def test_render_rejects_an_image_breaking_the_pool_again(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    executors = [
+        FakeExecutor(broken=True),
+        FakeExecutor(broken=True),
+        FakeExecutor(broken=False),
+    ]
+    processor = new_processor(monkeypatch, executors)
+    with pytest.raises(uploads.UnsupportedMediaTypeError):
+        await processor.render(new_png(10, 10))
+    assert processor.stats()["restarts"] == 2
+    assert processor.stats()["in_flight"] == 0
+    # the pool left behind works.
+    assert await processor.render(new_png(10, 10))
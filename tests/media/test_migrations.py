@@ -0,0 +1,103 @@
+"""Tests of the media migrations module."""
+
+import pytest
+
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+)
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    List,
+)
+
+from app.media import (
+    migrations,
+    models as media_models,
+)
+from app.messages import (
+    compaction,
+    models as messages_models,
+)
+from app.users import (
+    models as users_models,
+)
+
+pytestmark = pytest.mark.anyio
+
+CID = "QmYwAPJzv5CZsnAzt8auVZRn1sjkY3Nio7Wr5Xm7ib3hV9"
+LEGACY_URL = f"https://ipfs.io/ipfs/{CID}/tmpa1b2c3"
+PROXY_URL = f"/api/v1/media/ipfs/{CID}/tmpa1b2c3"
+
+
+async def test_gateway_urls_are_proxied(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    await db_engine.get_collection(users_models.User).update_one(
+        {"_id": sender.id}, {"$set": {"profile_picture": LEGACY_URL}}
+    )
+    conversation_id = ObjectId()
+    await db_engine.get_collection(messages_models.Message).insert_many(
+        [
+            {"conversation_id": conversation_id, "media": LEGACY_URL},
+            {"conversation_id": conversation_id, "media": "https://a.test/b"},
+        ]
+    )
+    bucket = compaction.pack_messages(
+        conversation_id,
+        [
+            {
+                "_id": ObjectId(),
+                "creation_date": datetime.utcnow(),
+                "media": LEGACY_URL,
+            }
+        ],
+        True,
+    )
+    await db_engine.get_collection(messages_models.MessageBucket).insert_one(
+        bucket
+    )
+    assert await migrations.proxy_gateway_urls(db_engine, batch_size=1) == 3
+    # resumable: the proxied urls are left alone.
+    assert await migrations.proxy_gateway_urls(db_engine) == 0
+    user = await db_engine.find_one(
+        users_models.User, users_models.User.id == sender.id
+    )
+    assert user is not None and user.profile_picture == PROXY_URL
+    messages = (
+        await db_engine.get_collection(messages_models.Message)
+        .find()
+        .to_list(None)
+    )
+    assert sorted(message["media"] for message in messages) == [
+        PROXY_URL,
+        "https://a.test/b",
+    ]
+    stored = await db_engine.get_collection(
+        messages_models.MessageBucket
+    ).find_one({"_id": bucket["_id"]})
+    assert stored["compressed"]
+    assert compaction.unpack_bucket(stored)[0]["media"] == PROXY_URL
+    # the proxy is allowed to serve the file once.
+    links = await db_engine.find(media_models.GatewayMedia)
+    assert [(link.cid, link.filename) for link in links] == [
+        (CID, "tmpa1b2c3")
+    ]
+
+
+def test_only_pinned_file_urls_match() -> None:
+    pattern = migrations.get_gateway_pattern(
+        ["https://ipfs.io/ipfs", "https://gateway.test/ipfs/"]
+    )
+    assert pattern.match(f"https://gateway.test/ipfs/{CID}/a.png")
+    for url in (
+        f"https://ipfs.io/ipfs/{CID}",
+        f"https://ipfs.io/ipfs/{CID}/a/b",
+        f"https://ipfsXio/ipfs/{CID}/a",
+    ):
+        assert not pattern.match(url)
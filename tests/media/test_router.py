@@ -0,0 +1,149 @@
+"""Tests of the media router module."""
+
+import pytest
+
+from fastapi import (
+    FastAPI,
+)
+import httpx
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    AsyncIterator,
+    List,
+)
+
+from app.media import (
+    cache as media_cache,
+    models as media_models,
+    router as media_router,
+    storage as media_storage,
+)
+from app.utils import (
+    pinata,
+)
+
+pytestmark = pytest.mark.anyio
+
+CID = "QmYwAPJzv5CZsnAzt8auVZRn1sjkY3Nio7Wr5Xm7ib3hV9"
+OTHER_CID = "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"
+SHA256 = "ab" + "0" * 62
+IMAGE = b"\x89PNG\r\n\x1a\n" + b"pixels"
+
+
+@pytest.fixture
+def gateway_requests(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> List[httpx.Request]:
+    """
+    Serve the gateway cache from a fake gateway, recording its requests.
+    """
+    requests: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=IMAGE)
+
+    monkeypatch.setattr(
+        media_cache,
+        "gateway_cache",
+        media_cache.GatewayCache(
+            root=str(tmp_path),
+            max_bytes=1024,
+            max_file_bytes=1024,
+            gateway_url="https://gateway.test/ipfs",
+            timeout=1,
+            transport=httpx.MockTransport(handler),
+        ),
+    )
+    return requests
+
+
+@pytest.fixture
+async def client(db_engine: AIOEngine) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of an app serving the media routes over the test database.
+    """
+    await db_engine.save(
+        media_models.MediaObject(
+            sha256=SHA256,
+            location=CID,
+            url=f"/api/v1/media/ipfs/{CID}/{SHA256}",
+            size=len(IMAGE),
+            content_type="image/png",
+            ref_count=1,
+        )
+    )
+    app = FastAPI()
+    app.include_router(media_router.router)
+    app.state.engine = db_engine
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        yield client
+
+
+def test_pinata_urls_are_proxied() -> None:
+    storage = media_storage.PinataStorage(
+        pinata.PinataClient(
+            api_key="key",
+            api_secret="secret",
+            api_url="https://api.test",
+            gateway_url="https://gateway.test/ipfs",
+            timeout=1,
+            max_concurrency=1,
+        ),
+        "/api/v1/media/",
+    )
+    assert storage.get_url(CID, SHA256) == f"/api/v1/media/ipfs/{CID}/{SHA256}"
+
+
+async def test_get_ipfs_media(
+    client: httpx.AsyncClient, gateway_requests: List[httpx.Request]
+) -> None:
+    for _ in range(2):
+        response = await client.get(f"/api/v1/media/ipfs/{CID}/{SHA256}")
+        assert response.status_code == 200
+        assert response.content == IMAGE
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["etag"] == f'"{SHA256}"'
+    # the second request is served from the cache.
+    assert [str(request.url) for request in gateway_requests] == [
+        f"https://gateway.test/ipfs/{CID}/{SHA256}"
+    ]
+    # served media are released.
+    assert media_cache.gateway_cache.stats()["pinned"] == 0
+
+
+async def test_get_ipfs_media_only_proxies_stored_media(
+    client: httpx.AsyncClient, gateway_requests: List[httpx.Request]
+) -> None:
+    for path in (
+        f"{OTHER_CID}/{SHA256}",
+        f"{CID}/{'cd' + '0' * 62}",
+        f"{CID}/{SHA256}.png",
+    ):
+        response = await client.get(f"/api/v1/media/ipfs/{path}")
+        assert response.status_code == 404
+    assert gateway_requests == []
+
+
+async def test_get_legacy_gateway_media(
+    client: httpx.AsyncClient,
+    db_engine: AIOEngine,
+    gateway_requests: List[httpx.Request],
+) -> None:
+    path = f"/api/v1/media/ipfs/{OTHER_CID}/tmpa1b2c3"
+    assert (await client.get(path)).status_code == 404
+    await db_engine.save(
+        media_models.GatewayMedia(cid=OTHER_CID, filename="tmpa1b2c3")
+    )
+    response = await client.get(path)
+    assert response.status_code == 200
+    assert response.content == IMAGE
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{OTHER_CID}/tmpa1b2c3"'
+    assert [str(request.url) for request in gateway_requests] == [
+        f"https://gateway.test/ipfs/{OTHER_CID}/tmpa1b2c3"
+    ]
@@ -0,0 +1,203 @@
+"""Tests of the messages compaction module."""
+
+import pytest
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    Any,
+    List,
+    Optional,
+)
+
+from app.messages import (
+    compaction,
+    crud as messages_crud,
+    models as messages_models,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    dependencies,
+    pagination,
+)
+from tests import (
+    fakes,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def messages(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> List[messages_models.Message]:
+    """
+    Ten messages of a conversation, the first seven read and old.
+    """
+    sender, receiver = users
+    conversation = await db_engine.save(
+        messages_models.Conversation(
+            pair_id=messages_models.get_pair_id(sender.id, receiver.id),
+            participants=[sender.id, receiver.id],
+        )
+    )
+    now = datetime.utcnow()
+    return list(
+        await db_engine.save_all(
+            [
+                messages_models.Message(
+                    conversation_id=conversation.id,
+                    sender=sender.id,
+                    seq=number + 1,
+                    content=str(number),
+                    status=(
+                        messages_models.MessageStatus.READ.value
+                        if number < 7
+                        else messages_models.MessageStatus.NOT_READ.value
+                    ),
+                    media=None,
+                    creation_date=now
+                    - timedelta(days=100 if number < 7 else 0)
+                    + timedelta(minutes=number),
+                )
+                for number in range(10)
+            ]
+        )
+    )
+
+
+def record_sessions(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine
+) -> List[fakes.FakeDriverSession]:
+    """
+    Record the driver sessions started by the engine.
+    """
+    start_session = db_engine.client.start_session
+    driver_sessions: List[fakes.FakeDriverSession] = []
+
+    async def recording(**kwargs: Any) -> fakes.FakeDriverSession:
+        driver_session = await start_session(**kwargs)
+        driver_sessions.append(driver_session)
+        return driver_session
+
+    monkeypatch.setattr(db_engine.client, "start_session", recording)
+    return driver_sessions
+
+
+async def compact(db_engine: AIOEngine) -> int:
+    return await compaction.compact_messages(
+        db_engine, timedelta(days=90), bucket_size=3, compress=True
+    )
+
+
+async def test_compacts_full_buckets_of_old_read_messages(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    messages: List[messages_models.Message],
+) -> None:
+    driver_sessions = record_sessions(monkeypatch, db_engine)
+    assert await compact(db_engine) == 6
+    # each bucket is written along with the deletion of its messages.
+    assert [session.calls for session in driver_sessions] == [
+        ["start", "commit"]
+    ] * 2
+    buckets = await db_engine.find(
+        messages_models.MessageBucket,
+        sort=messages_models.MessageBucket.start_date,
+    )
+    assert [bucket.count for bucket in buckets] == [3, 3]
+    assert [
+        document["content"]
+        for bucket in buckets
+        for document in compaction.unpack_bucket(bucket.doc())
+    ] == [str(number) for number in range(6)]
+    hot = await db_engine.find(messages_models.Message)
+    assert sorted(message.content for message in hot) == [
+        "6",
+        "7",
+        "8",
+        "9",
+    ]
+    # the leftover read message waits for a full bucket.
+    assert await compact(db_engine) == 0
+
+
+async def test_failed_deletes_abort_the_bucket(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    messages: List[messages_models.Message],
+) -> None:
+    driver_sessions = record_sessions(monkeypatch, db_engine)
+    collection = db_engine.get_collection(messages_models.Message)
+
+    async def failing(*args: Any, **kwargs: Any) -> None:
+        raise ValueError("failed")
+
+    monkeypatch.setattr(
+        type(collection), "delete_many", lambda self, *a, **k: failing()
+    )
+    with pytest.raises(ValueError):
+        await compact(db_engine)
+    assert [session.calls for session in driver_sessions] == [
+        ["start", "abort"]
+    ]
+
+
+async def read_pages(
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+    limit: int,
+    after: Optional[str] = None,
+) -> List[List[str]]:
+    """
+    Page through the conversation, back from the latest message or forward
+    from a cursor, returning the contents of each page.
+    """
+    sender, receiver = users
+    session = dependencies.LazySession(db_engine)
+    pages: List[List[str]] = []
+    before = None
+    try:
+        while True:
+            page = await messages_crud.get_sender_receiver_messages(
+                str(sender.id), receiver.email, session, before, after, limit
+            )
+            pages.append([message["content"] for message in page["result"]])
+            if not page["next_cursor"]:
+                return pages
+            if after:
+                after = page["next_cursor"]
+            else:
+                before = page["next_cursor"]
+    finally:
+        await session.end()
+
+
+async def test_pages_span_hot_messages_and_cold_buckets(
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+    messages: List[messages_models.Message],
+) -> None:
+    await compact(db_engine)
+    assert await read_pages(db_engine, users, limit=3) == [
+        ["7", "8", "9"],
+        ["4", "5", "6"],
+        ["1", "2", "3"],
+        ["0"],
+    ]
+    first = messages[0]
+    after = pagination.encode_cursor(
+        first.creation_date, first.id  # type: ignore
+    )
+    assert await read_pages(db_engine, users, limit=4, after=after) == [
+        ["1", "2", "3", "4"],
+        ["5", "6", "7", "8"],
+        ["9"],
+    ]
@@ -0,0 +1,492 @@
+"""Tests of the messages crud module."""
+
+import pytest
+
+import asyncio
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+)
+from odmantic import (
+    AIOEngine,
+)
+from pymongo.errors import (
+    DuplicateKeyError,
+    OperationFailure,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from app.media import (
+    crud as media_crud,
+)
+from app.messages import (
+    crud as messages_crud,
+    models as messages_models,
+    schemas as messages_schemas,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    dependencies,
+    engine as engine_utils,
+    pagination,
+)
+from app.websockets import (
+    router as websockets_router,
+)
+from tests import (
+    conftest,
+    fakes,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def fail_first_upserts(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine, errors: List[Any]
+) -> List[bool]:
+    """
+    Fail the next conversation upserts with the given errors, recording
+    whether each upsert ran in a transaction.
+    """
+    collection = db_engine.get_collection(messages_models.Conversation)
+    find_one_and_update = collection.find_one_and_update
+    in_transaction: List[bool] = []
+
+    async def failing(*args: Any, **kwargs: Any) -> Any:
+        driver_session = kwargs.get("session")
+        in_transaction.append(
+            driver_session is not None and driver_session.in_transaction
+        )
+        await asyncio.sleep(0)
+        if errors:
+            raise errors.pop(0)
+        return await find_one_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(
+        type(collection),
+        "find_one_and_update",
+        lambda self, *a, **k: failing(*a, **k),
+    )
+    return in_transaction
+
+
+def record_sessions(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine
+) -> List[fakes.FakeDriverSession]:
+    """
+    Record the driver sessions started by the engine.
+    """
+    start_session = db_engine.client.start_session
+    driver_sessions: List[fakes.FakeDriverSession] = []
+
+    async def recording(**kwargs: Any) -> fakes.FakeDriverSession:
+        driver_session = await start_session(**kwargs)
+        driver_sessions.append(driver_session)
+        return driver_session
+
+    monkeypatch.setattr(db_engine.client, "start_session", recording)
+    return driver_sessions
+
+
+async def send(
+    db_engine: AIOEngine, sender: users_models.User, receiver: str, text: str
+) -> Any:
+    session = dependencies.LazySession(db_engine)
+    try:
+        return await messages_crud.send_new_message(
+            sender.id,  # type: ignore
+            messages_schemas.MessageCreate(
+                receiver=receiver, content=text, message_type="text", media=""
+            ),
+            None,
+            session,
+        )
+    finally:
+        await session.end()
+
+
+async def test_concurrent_sends_retry_write_conflicts(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    write_conflict = OperationFailure(
+        "WriteConflict",
+        112,
+        {"errorLabels": [engine_utils.TRANSIENT_TRANSACTION_ERROR]},
+    )
+    upserts = fail_first_upserts(monkeypatch, db_engine, [write_conflict])
+    sender, receiver = users
+    results = await asyncio.gather(
+        send(db_engine, sender, receiver.email, "first"),
+        send(db_engine, receiver, sender.email, "second"),
+    )
+    assert [result["status_code"] for result in results] == [201, 201]
+    assert len(upserts) == 3 and all(upserts)
+    messages = await db_engine.find(messages_models.Message)
+    assert sorted(message.seq or 0 for message in messages) == [1, 2]
+    assert len({message.conversation_id for message in messages}) == 1
+    inbox = await db_engine.find(messages_models.InboxEntry)
+    assert sorted(entry.unread_count for entry in inbox) == [1, 1]
+
+
+async def test_duplicate_conversations_retry_the_transaction(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    driver_sessions = record_sessions(monkeypatch, db_engine)
+    upserts = fail_first_upserts(
+        monkeypatch, db_engine, [DuplicateKeyError("E11000", 11000)]
+    )
+    sender, receiver = users
+    result = await send(db_engine, sender, receiver.email, "hello")
+    assert result["status_code"] == 201
+    # never retried in place, in the transaction the error aborted.
+    assert upserts == [True, True]
+    assert driver_sessions[-1].calls == ["start", "abort", "start", "commit"]
+    assert await db_engine.count(messages_models.Message) == 1
+
+
+async def test_sync_pages_on_sequence_numbers(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    for text in ("first", "second"):
+        await send(db_engine, sender, receiver.email, text)
+    first = await messages_crud.sync_messages(
+        str(receiver.id), db_engine, None, limit=1
+    )
+    assert [message["seq"] for message in first["result"]] == [1]
+    assert first["has_more"]
+    second = await messages_crud.sync_messages(
+        str(receiver.id), db_engine, first["next_cursor"], limit=1
+    )
+    assert [message["seq"] for message in second["result"]] == [2]
+    assert not second["has_more"]
+    # caught up: an empty page keeps the cursor where it was.
+    third = await messages_crud.sync_messages(
+        str(receiver.id), db_engine, second["next_cursor"]
+    )
+    assert third["result"] == [] and third["read_receipts"] == []
+    assert third["next_cursor"] == second["next_cursor"]
+
+
+async def test_sync_returns_read_marks(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    await send(db_engine, sender, receiver.email, "hello")
+    synced = await messages_crud.sync_messages(str(sender.id), db_engine)
+    message_id = synced["result"][0]["id"]
+    result = await messages_crud.mark_conversation_as_read(
+        str(receiver.id), message_id, db_engine
+    )
+    assert result["status_code"] == 200
+    changes = await messages_crud.sync_messages(
+        str(sender.id), db_engine, synced["next_cursor"]
+    )
+    assert changes["result"] == []
+    assert changes["read_receipts"] == [
+        {
+            "conversation_id": synced["result"][0]["conversation_id"],
+            "reader": str(receiver.id),
+            "seq": 1,
+        }
+    ]
+    assert changes["next_cursor"] != synced["next_cursor"]
+
+
+async def test_sync_rejects_invalid_cursors(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    result = await messages_crud.sync_messages(
+        str(users[0].id), db_engine, "not-a-cursor"
+    )
+    assert result["status_code"] == 400
+
+
+async def test_search_ranks_the_messages_of_the_user(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    fakes.search_text(monkeypatch, "content")
+    sender, receiver = users
+    stranger = await db_engine.save(conftest.new_user("stranger@test.com"))
+    await send(db_engine, sender, receiver.email, "coffee tomorrow")
+    await send(db_engine, receiver, sender.email, "coffee or tea tomorrow")
+    await send(db_engine, sender, receiver.email, "see you")
+    # a conversation the user isn't part of is never searched.
+    await send(db_engine, stranger, receiver.email, "coffee tomorrow")
+    first = await messages_crud.search_messages(
+        str(sender.id), "coffee tomorrow", db_engine, limit=1
+    )
+    assert first["status_code"] == 200
+    assert [message["content"] for message in first["result"]] == [
+        "coffee or tea tomorrow"
+    ]
+    assert first["result"][0]["type"] == "received"
+    assert first["result"][0]["score"] == 2
+    second = await messages_crud.search_messages(
+        str(sender.id), "coffee tomorrow", db_engine, first["next_cursor"]
+    )
+    assert [message["content"] for message in second["result"]] == [
+        "coffee tomorrow"
+    ]
+    assert second["result"][0]["type"] == "sent"
+    assert second["next_cursor"] is None
+
+
+async def test_search_rejects_invalid_and_deep_cursors(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    user_id = str(users[0].id)
+    result = await messages_crud.search_messages(
+        user_id, "coffee", db_engine, "not-a-cursor"
+    )
+    assert result["status_code"] == 400
+    deep_cursor = pagination.encode_offset_cursor(
+        messages_crud.SEARCH_MAX_OFFSET
+    )
+    result = await messages_crud.search_messages(
+        user_id, "coffee", db_engine, deep_cursor
+    )
+    assert result == {"status_code": 400, "message": "Search is too deep!"}
+
+
+async def test_failed_sends_release_the_stored_image(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    variants = {"full": "/media/full", "thumbnail": "/media/thumbnail"}
+    released: List[str] = []
+
+    async def store_image(*args: Any) -> Dict[str, str]:
+        return variants
+
+    async def release_images(urls: Any, session: Any) -> None:
+        released.extend(urls)
+
+    monkeypatch.setattr(media_crud, "store_image", store_image)
+    monkeypatch.setattr(media_crud, "release_images", release_images)
+    fail_first_upserts(monkeypatch, db_engine, [OperationFailure("Boom", 2)])
+    sender, receiver = users
+    session = dependencies.LazySession(db_engine)
+    with pytest.raises(OperationFailure):
+        # the websocket sends media with a preview and the decoded image.
+        await messages_crud.send_new_message(
+            sender.id,  # type: ignore
+            websockets_router.RequestObject(
+                receiver.email, "", "media", {"preview": "data"}  # type: ignore
+            ),
+            b"image",  # type: ignore
+            session,
+        )
+    await session.end()
+    assert released == list(variants.values())
+    assert await db_engine.count(messages_models.Message) == 0
+
+
+async def test_read_marks_are_written_in_one_transaction(
+    monkeypatch: pytest.MonkeyPatch,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    sender, receiver = users
+    for text in ("first", "second", "third"):
+        await send(db_engine, sender, receiver.email, text)
+    await send(db_engine, receiver, sender.email, "reply")
+    synced = await messages_crud.sync_messages(str(receiver.id), db_engine)
+    second = synced["result"][1]
+    driver_sessions = record_sessions(monkeypatch, db_engine)
+    result = await messages_crud.mark_conversation_as_read(
+        str(receiver.id), second["id"], db_engine
+    )
+    assert result["status_code"] == 200
+    assert [session.calls for session in driver_sessions] == [
+        ["start", "commit"]
+    ]
+    messages = await db_engine.find(
+        messages_models.Message, sort=messages_models.Message.seq
+    )
+    # only the received messages up to the given one are read.
+    assert [message.status for message in messages] == [
+        messages_models.MessageStatus.READ,
+        messages_models.MessageStatus.READ,
+        messages_models.MessageStatus.NOT_READ,
+        messages_models.MessageStatus.NOT_READ,
+    ]
+    entry = await db_engine.find_one(
+        messages_models.InboxEntry,
+        messages_models.InboxEntry.owner == receiver.id,
+    )
+    assert entry is not None and entry.unread_count == 1
+    conversation = await db_engine.find_one(messages_models.Conversation)
+    assert conversation is not None
+    assert conversation.read_seqs == {str(receiver.id): second["seq"]}
+    # marking again changes nothing, nor takes a sequence number.
+    await messages_crud.mark_conversation_as_read(
+        str(receiver.id), second["id"], db_engine
+    )
+    again = await db_engine.find_one(messages_models.Conversation)
+    assert again is not None and again.seq == conversation.seq
+    entry = await db_engine.find_one(
+        messages_models.InboxEntry,
+        messages_models.InboxEntry.owner == receiver.id,
+    )
+    assert entry is not None and entry.unread_count == 1
+
+
+async def test_only_received_messages_can_be_marked_as_read(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    await send(db_engine, sender, receiver.email, "hello")
+    synced = await messages_crud.sync_messages(str(sender.id), db_engine)
+    message_id = synced["result"][0]["id"]
+    result = await messages_crud.mark_conversation_as_read(
+        str(sender.id), message_id, db_engine
+    )
+    assert result["status_code"] == 404
+    result = await messages_crud.mark_conversation_as_read(
+        str(receiver.id), "not-an-id", db_engine
+    )
+    assert result["status_code"] == 400
+    assert (
+        await db_engine.count(
+            messages_models.Message,
+            messages_models.Message.status
+            == messages_models.MessageStatus.READ.value,
+        )
+        == 0
+    )
+
+
+def test_high_water_mark_is_the_newest_unread_received_message() -> None:
+    conversation_id, partner = ObjectId(), ObjectId()
+    page = [
+        {
+            "type": message_type,
+            "status": status,
+            "seq": seq,
+            "conversation_id": str(conversation_id),
+            "sender": str(partner),
+        }
+        for message_type, status, seq in (
+            ("received", messages_models.MessageStatus.NOT_READ, 1),
+            ("received", messages_models.MessageStatus.NOT_READ, 2),
+            ("received", messages_models.MessageStatus.READ, 3),
+            ("sent", messages_models.MessageStatus.NOT_READ, 4),
+        )
+    ]
+    assert messages_crud.get_unread_high_water_mark(page) == (
+        conversation_id,
+        partner,
+        2,
+    )
+    assert messages_crud.get_unread_high_water_mark(page[2:]) is None
+
+
+async def test_conversation_pages_cover_every_message_once(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    for number in range(5):
+        await send(db_engine, sender, receiver.email, str(number))
+    # messages sent within the same instant are told apart by their id.
+    await db_engine.get_collection(messages_models.Message).update_many(
+        {}, {"$set": {"creation_date": datetime.utcnow()}}
+    )
+    session = dependencies.LazySession(db_engine)
+    pages: List[List[str]] = []
+    before = None
+    while True:
+        page = await messages_crud.get_sender_receiver_messages(
+            str(sender.id), receiver.email, session, before, limit=2
+        )
+        pages.append([message["content"] for message in page["result"]])
+        assert {message["type"] for message in page["result"]} == {"sent"}
+        before = page["next_cursor"]
+        if not before:
+            break
+    assert pages == [["3", "4"], ["1", "2"], ["0"]]
+    first = await db_engine.find_one(
+        messages_models.Message, messages_models.Message.content == "0"
+    )
+    assert first is not None
+    page = await messages_crud.get_sender_receiver_messages(
+        str(receiver.id),
+        sender.email,
+        session,
+        after=pagination.encode_cursor(
+            first.creation_date, first.id  # type: ignore
+        ),
+        limit=3,
+    )
+    assert [message["content"] for message in page["result"]] == [
+        "1",
+        "2",
+        "3",
+    ]
+    assert {message["type"] for message in page["result"]} == {"received"}
+    await session.end()
+
+
+async def test_conversation_pages_reject_invalid_cursors(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    session = dependencies.LazySession(db_engine)
+    cursor = pagination.encode_cursor(datetime.utcnow(), ObjectId())
+    for before, after in (("not-a-cursor", None), (cursor, cursor)):
+        page = await messages_crud.get_sender_receiver_messages(
+            str(sender.id), receiver.email, session, before, after
+        )
+        assert page["status_code"] == 400
+    # no conversation yet, an empty first page.
+    page = await messages_crud.get_sender_receiver_messages(
+        str(sender.id), receiver.email, session
+    )
+    assert (page["result"], page["next_cursor"]) == ([], None)
+    await session.end()
+
+
+async def test_inbox_lists_partners_by_latest_activity(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    third = await db_engine.save(conftest.new_user("third@test.com"))
+    await send(db_engine, sender, receiver.email, "hello")
+    await send(db_engine, third, receiver.email, "hi")
+    await send(db_engine, third, receiver.email, "are you there?")
+    await send(db_engine, receiver, sender.email, "x" * 200)
+    first = await messages_crud.get_inbox(str(receiver.id), db_engine, limit=1)
+    assert [entry["partner"] for entry in first["result"]] == [str(sender.id)]
+    entry = first["result"][0]
+    # the preview is cut, the entry counts what the owner hasn't read.
+    assert entry["preview"] == "x" * messages_crud.INBOX_PREVIEW_LENGTH
+    assert entry["unread_count"] == 1
+    second = await messages_crud.get_inbox(
+        str(receiver.id), db_engine, first["next_cursor"], limit=1
+    )
+    assert [
+        (entry["partner"], entry["preview"], entry["unread_count"])
+        for entry in second["result"]
+    ] == [(str(third.id), "are you there?", 2)]
+    assert second["next_cursor"] is None
+    sent = await messages_crud.get_inbox(str(third.id), db_engine)
+    assert [entry["unread_count"] for entry in sent["result"]] == [0]
+    invalid = await messages_crud.get_inbox(
+        str(receiver.id), db_engine, "not-a-cursor"
+    )
+    assert invalid["status_code"] == 400
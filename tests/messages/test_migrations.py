@@ -0,0 +1,62 @@
+"""Tests of the messages migrations module."""
+
+import pytest
+
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+from odmantic import (
+    AIOEngine,
+)
+
+from app.messages import (
+    crud as messages_crud,
+    migrations,
+    models as messages_models,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_number_messages_oldest_first(db_engine: AIOEngine) -> None:
+    participants = [ObjectId(), ObjectId()]
+    conversation = await db_engine.save(
+        messages_models.Conversation(
+            pair_id=messages_models.get_pair_id(*participants),
+            participants=participants,
+        )
+    )
+    now = datetime.utcnow()
+    await db_engine.get_collection(messages_models.Message).insert_many(
+        [
+            {
+                "conversation_id": conversation.id,
+                "content": str(age),
+                "creation_date": now - timedelta(minutes=age),
+            }
+            for age in (1, 3, 2)
+        ]
+    )
+    assert await migrations.number_messages(db_engine, batch_size=2) == 3
+    # resumable: numbered messages are left alone.
+    assert await migrations.number_messages(db_engine) == 0
+    messages = (
+        await db_engine.get_collection(messages_models.Message)
+        .find()
+        .sort("seq", 1)
+        .to_list(None)
+    )
+    assert [message["content"] for message in messages] == ["3", "2", "1"]
+    assert [message["seq"] for message in messages] == [1, 2, 3]
+    numbered = await db_engine.find_one(messages_models.Conversation)
+    assert numbered is not None and numbered.seq == 3
+    # the next message sent takes the next number.
+    sender_id, receiver_id = participants
+    _, seq = await messages_crud.upsert_conversation(
+        sender_id, receiver_id, now, db_engine
+    )
+    assert seq == 4
@@ -0,0 +1,133 @@
+"""Tests of the messages pipeline module."""
+
+import pytest
+
+import asyncio
+from bson import (
+    ObjectId,
+)
+from odmantic import (
+    AIOEngine,
+)
+from pymongo.errors import (
+    OperationFailure,
+)
+from typing import (
+    List,
+)
+
+from app.messages import (
+    models as messages_models,
+    pipeline,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_flush_numbers_messages_per_conversation(
+    db_engine: AIOEngine,
+) -> None:
+    message_pipeline = pipeline.MessagePipeline(
+        max_queue=10, batch_size=10, flush_interval=0.01
+    )
+    first, second, third = ObjectId(), ObjectId(), ObjectId()
+    await message_pipeline.start(db_engine)
+    try:
+        await message_pipeline.put(first, second, "hello")
+        await message_pipeline.put(second, first, "hi")
+        await message_pipeline.put(first, third, "hey")
+    finally:
+        await message_pipeline.stop()
+    assert message_pipeline.stats()["persisted"] == 3
+    messages = await db_engine.find(messages_models.Message)
+    seqs = {(message.content, message.seq) for message in messages}
+    assert seqs == {("hello", 1), ("hi", 2), ("hey", 1)}
+    conversations = await db_engine.find(messages_models.Conversation)
+    assert sorted(conversation.seq for conversation in conversations) == [
+        1,
+        2,
+    ]
+
+
+def fail_first_flushes(
+    monkeypatch: pytest.MonkeyPatch,
+    message_pipeline: pipeline.MessagePipeline,
+    failures: int,
+) -> List[int]:
+    """
+    Fail the next flushes of a pipeline, recording the size of every
+    flushed batch.
+    """
+    flush = message_pipeline._flush
+    sizes: List[int] = []
+
+    async def failing(batch: List[pipeline.PendingMessage]) -> None:
+        nonlocal failures
+        sizes.append(len(batch))
+        if failures:
+            failures -= 1
+            raise OperationFailure("not primary", 10107)
+        await flush(batch)
+
+    monkeypatch.setattr(message_pipeline, "_flush", failing)
+    return sizes
+
+
+async def test_failed_flushes_are_retried(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine
+) -> None:
+    message_pipeline = pipeline.MessagePipeline(
+        max_queue=10, batch_size=10, flush_interval=0.01, retry_backoff=0
+    )
+    sizes = fail_first_flushes(monkeypatch, message_pipeline, 2)
+    await message_pipeline.start(db_engine)
+    try:
+        await message_pipeline.put(ObjectId(), ObjectId(), "hello")
+    finally:
+        await message_pipeline.stop()
+    assert sizes == [1, 1, 1]
+    stats = message_pipeline.stats()
+    assert (stats["persisted"], stats["failed"], stats["retries"]) == (
+        1,
+        2,
+        2,
+    )
+    assert stats["dead_lettered"] == 0
+    assert await db_engine.count(messages_models.Message) == 1
+
+
+async def test_failing_batches_are_dead_lettered_and_replayed(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine
+) -> None:
+    message_pipeline = pipeline.MessagePipeline(
+        max_queue=10,
+        batch_size=10,
+        flush_interval=0.01,
+        max_attempts=2,
+        retry_backoff=0,
+    )
+    sizes = fail_first_flushes(monkeypatch, message_pipeline, 2)
+    first, second = ObjectId(), ObjectId()
+    await message_pipeline.start(db_engine)
+    try:
+        await message_pipeline.put(first, second, "lost")
+        await asyncio.sleep(0.05)
+        stats = message_pipeline.stats()
+        assert (stats["dead_lettered"], stats["dead_letters"]) == (1, 1)
+        assert await db_engine.count(messages_models.Message) == 0
+        # the dead letters are replayed before the next batch.
+        await message_pipeline.put(first, second, "found")
+    finally:
+        await message_pipeline.stop()
+    assert sizes == [1, 1, 1, 1]
+    stats = message_pipeline.stats()
+    assert (stats["persisted"], stats["replayed"], stats["dead_letters"]) == (
+        2,
+        1,
+        0,
+    )
+    messages = await db_engine.find(messages_models.Message)
+    assert {(message.content, message.seq) for message in messages} == {
+        ("lost", 1),
+        ("found", 2),
+    }
@@ -0,0 +1,151 @@
+"""Tests of the messages router module."""
+
+import pytest
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+from fastapi import (
+    FastAPI,
+)
+import httpx
+import json
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    AsyncIterator,
+    List,
+)
+
+from app.config import (
+    settings,
+)
+from app.messages import (
+    compaction,
+    crud as messages_crud,
+    models as messages_models,
+    router as messages_router,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    cache,
+    jwt,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of an app serving the messages routes to the first user.
+    """
+    sender = users[0]
+    app = FastAPI()
+    app.include_router(messages_router.router)
+    app.state.engine = db_engine
+    app.dependency_overrides[jwt.get_current_active_user] = (
+        lambda: cache.UserIdentity(
+            id=sender.id,
+            email=sender.email,
+            user_status=sender.user_status,
+            user_role=sender.user_role,
+        )
+    )
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        yield client
+
+
+async def test_export_streams_cold_then_hot_messages(
+    monkeypatch: pytest.MonkeyPatch,
+    client: httpx.AsyncClient,
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+) -> None:
+    monkeypatch.setattr(settings(), "MESSAGE_EXPORT_BATCH_SIZE", 2)
+    sender, receiver = users
+    conversation = await db_engine.save(
+        messages_models.Conversation(
+            pair_id=messages_models.get_pair_id(sender.id, receiver.id),
+            participants=[sender.id, receiver.id],
+        )
+    )
+    start = datetime.utcnow() - timedelta(days=1)
+    documents = [
+        messages_models.Message(
+            conversation_id=conversation.id,
+            sender=sender.id if number % 2 else receiver.id,
+            seq=number + 1,
+            content=str(number),
+            media=None,
+            creation_date=start + timedelta(minutes=number),
+        ).doc()
+        for number in range(5)
+    ]
+    await db_engine.get_collection(messages_models.MessageBucket).insert_one(
+        compaction.pack_messages(conversation.id, documents[:3], True)
+    )
+    await db_engine.get_collection(messages_models.Message).insert_many(
+        documents[3:]
+    )
+    response = await client.get(
+        "/api/v1/message/export", params={"receiver": receiver.email}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == (
+        'attachment; filename="messages.ndjson"'
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["content"] for line in lines] == ["0", "1", "2", "3", "4"]
+    assert [line["seq"] for line in lines] == [1, 2, 3, 4, 5]
+    assert lines[1]["sender"] == str(sender.id)
+
+
+async def test_export_of_unknown_conversations_is_empty(
+    client: httpx.AsyncClient,
+) -> None:
+    for receiver in ("receiver@test.com", "nobody@test.com"):
+        response = await client.get(
+            "/api/v1/message/export", params={"receiver": receiver}
+        )
+        assert response.status_code == 200
+        assert response.content == b""
+
+
+async def test_export_chunks_hold_a_batch_of_lines(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    sender, receiver = users
+    conversation = await db_engine.save(
+        messages_models.Conversation(
+            pair_id=messages_models.get_pair_id(sender.id, receiver.id),
+            participants=[sender.id, receiver.id],
+        )
+    )
+    await db_engine.save_all(
+        [
+            messages_models.Message(
+                conversation_id=conversation.id,
+                sender=sender.id,
+                content=str(number),
+                media=None,
+            )
+            for number in range(5)
+        ]
+    )
+    chunks = [
+        chunk
+        async for chunk in messages_crud.export_messages(
+            str(sender.id), receiver.email, db_engine, batch_size=2
+        )
+    ]
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
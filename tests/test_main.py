@@ -0,0 +1,92 @@
+"""Tests of the main module."""
+
+import pytest
+
+from bson import (
+    ObjectId,
+)
+from fastapi.testclient import (
+    TestClient,
+)
+from typing import (
+    Any,
+    Iterator,
+)
+
+from app.auth import (
+    crud as auth_crud,
+)
+from app.main import (
+    tinder_app,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    cache,
+    crypt,
+    dependencies,
+    jwt,
+)
+from tests import (
+    conftest,
+)
+
+
+def as_user(role: users_models.UserRole) -> None:
+    tinder_app.dependency_overrides[jwt.get_current_user] = (
+        lambda: cache.UserIdentity(
+            id=ObjectId(),
+            email="user@test.com",
+            user_status=users_models.UserStatus.ACTIVE,
+            user_role=role,
+        )
+    )
+
+
+@pytest.fixture
+def client() -> Iterator[TestClient]:
+    yield TestClient(tinder_app)
+    tinder_app.dependency_overrides.clear()
+
+
+def test_metrics_require_a_token(client: TestClient) -> None:
+    assert client.get("/api/metrics").status_code == 401
+
+
+def test_metrics_are_forbidden_to_regular_users(client: TestClient) -> None:
+    as_user(users_models.UserRole.REGULAR)
+    assert client.get("/api/metrics").status_code == 403
+
+
+def test_metrics_are_served_to_admins(client: TestClient) -> None:
+    as_user(users_models.UserRole.ADMIN)
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert "password_hasher" in response.json()
+
+
+def test_busy_password_hasher_answers_503(
+    monkeypatch: pytest.MonkeyPatch, client: TestClient
+) -> None:
+    # every worker and queue slot is taken.
+    busy_hasher = crypt.PasswordHasher(max_workers=1, max_queue=0)
+    busy_hasher._in_flight = 1
+    monkeypatch.setattr(crypt, "hasher", busy_hasher)
+
+    async def find_existed_user(email: str, session: Any) -> users_models.User:
+        return conftest.new_user(email)
+
+    monkeypatch.setattr(auth_crud, "find_existed_user", find_existed_user)
+    tinder_app.dependency_overrides[dependencies.get_db_session] = lambda: None
+    response = client.post(
+        "/api/v1/auth/login",
+        data={"username": "user@test.com", "password": "secret"},
+    )
+    busy_hasher.shutdown()
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {
+        "status_code": 503,
+        "message": "The server is busy, please try again later!",
+    }
@@ -0,0 +1,44 @@
+"""Tests of the users crud module."""
+
+import pytest
+
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    List,
+)
+
+from app.users import (
+    crud as users_crud,
+    models as users_models,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_update_profile_picture_returns_the_stored_urls(
+    db_engine: AIOEngine, users: List[users_models.User]
+) -> None:
+    user = users[0]
+    user.profile_picture = "http://testserver/media/old"
+    await db_engine.save(user)
+    session = db_engine.session()
+    await session.start()
+    try:
+        replaced = await users_crud.update_profile_picture(
+            user.id, "http://testserver/media/full", session, {"full": "new"}
+        )
+        assert replaced == ["http://testserver/media/old"]
+        # read from the database, whatever copy of the user the caller has.
+        replaced = await users_crud.update_profile_picture(
+            user.id, "http://testserver/media/next", session
+        )
+        assert replaced == ["new"]
+    finally:
+        await session.end()
+    stored = await db_engine.find_one(
+        users_models.User, users_models.User.id == user.id
+    )
+    assert stored is not None
+    assert stored.profile_picture == "http://testserver/media/next"
@@ -0,0 +1,167 @@
+"""Tests of the utils cache module."""
+
+import pytest
+
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    timedelta,
+)
+from fastapi import (
+    HTTPException,
+)
+from starlette.requests import (
+    Request,
+)
+import time
+from typing import (
+    Any,
+    List,
+    Optional,
+    Tuple,
+)
+
+from app.auth import (
+    crud as auth_crud,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    cache,
+    jwt,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    """
+    A monotonic clock the tests move forward by hand.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def new_identity() -> cache.UserIdentity:
+    return cache.UserIdentity(
+        id=ObjectId(),
+        email="user@test.com",
+        user_status=users_models.UserStatus.ACTIVE,
+        user_role=users_models.UserRole.REGULAR,
+    )
+
+
+def test_ttl_cache_evicts_the_least_recently_used(clock: List[float]) -> None:
+    ttl_cache: cache.TTLCache[str, int] = cache.TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    assert ttl_cache.get("a") == 1
+    ttl_cache.set("c", 3)
+    assert (ttl_cache.get("a"), ttl_cache.get("b"), ttl_cache.get("c")) == (
+        1,
+        None,
+        3,
+    )
+    # entries expire, a shorter time to live is kept but never a longer one.
+    ttl_cache.set("d", 4, ttl=1)
+    ttl_cache.set("e", 5, ttl=60)
+    clock[0] += 5
+    assert ttl_cache.get("d") is None and ttl_cache.get("e") == 5
+    clock[0] += 5
+    assert ttl_cache.get("e") is None and len(ttl_cache) == 0
+
+
+def test_tokens_are_cached_until_they_expire(clock: List[float]) -> None:
+    token_cache = cache.TokenCache(maxsize=10, ttl=60)
+    identity = new_identity()
+    token_cache.set_token("token", identity.id, identity)
+    cached = token_cache.get_token("token")
+    assert cached is not None and cached.user == identity
+    # an expired token isn't cached, a revoked one is cached as None.
+    token_cache.set_token("expired", identity.id, identity, time.time() - 1)
+    assert token_cache.get_token("expired") is None
+    token_cache.set_token("revoked", identity.id, None)
+    revoked = token_cache.get_token("revoked")
+    assert revoked is not None and revoked.user is None
+    clock[0] += 60
+    assert token_cache.get_token("token") is None
+
+
+def test_tokens_are_invalidated_one_by_one_or_per_user(
+    clock: List[float],
+) -> None:
+    token_cache = cache.TokenCache(maxsize=10, ttl=60)
+    identity, other = new_identity(), new_identity()
+    for token in ("first", "second"):
+        token_cache.set_token(token, identity.id, identity)
+    token_cache.set_token("other", other.id, other)
+    token_cache.invalidate_token("first")
+    assert token_cache.get_token("first") is None
+    assert token_cache.get_token("second") is not None
+    token_cache.invalidate_user(identity.id)
+    assert token_cache.get_token("second") is None
+    assert token_cache.get_token("other") is not None
+    # evicted tokens leave the index of their owner.
+    token_cache.clear()
+    token_cache.invalidate_user(other.id)
+    assert len(token_cache) == 0
+
+
+async def test_current_user_is_resolved_once_per_token(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        cache, "token_cache", cache.TokenCache(maxsize=10, ttl=60)
+    )
+    identity = new_identity()
+    lookups: List[str] = []
+
+    async def find_existed_identity(
+        email: str, token: str, session: Any
+    ) -> Optional[Tuple[cache.UserIdentity, bool]]:
+        lookups.append(token)
+        return identity, True
+
+    monkeypatch.setattr(
+        auth_crud, "find_existed_identity", find_existed_identity
+    )
+    token = (
+        await jwt.create_access_token(
+            data={"sub": identity.email}, expires_delta=timedelta(days=1)
+        )
+    )["access_token"]
+
+    async def get_current_user() -> cache.UserIdentity:
+        request = Request({"type": "http", "headers": []})
+        return await jwt.get_current_user(request, token, None)  # type: ignore
+
+    assert await get_current_user() == identity
+    assert await get_current_user() == identity
+    assert lookups == [token]
+    # an invalidated user is looked up again.
+    cache.token_cache.invalidate_user(identity.id)
+    assert await get_current_user() == identity
+    assert lookups == [token, token]
+
+
+async def test_revoked_tokens_are_rejected_from_the_cache(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        cache, "token_cache", cache.TokenCache(maxsize=10, ttl=60)
+    )
+    identity = new_identity()
+    token = (
+        await jwt.create_access_token(
+            data={"sub": identity.email}, expires_delta=timedelta(days=1)
+        )
+    )["access_token"]
+    cache.token_cache.set_token(token, identity.id, None)
+    request = Request({"type": "http", "headers": []})
+    with pytest.raises(HTTPException) as raised:
+        await jwt.get_current_user(request, token, None)  # type: ignore
+    assert raised.value.status_code == 401
@@ -0,0 +1,64 @@
+"""Tests of the utils crypt module."""
+
+import pytest
+
+import asyncio
+import threading
+from typing import (
+    List,
+)
+
+from app.utils import (
+    crypt,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_passwords_are_hashed_off_the_event_loop() -> None:
+    hasher = crypt.PasswordHasher(max_workers=1, max_queue=0)
+    threads: List[str] = []
+
+    def hash_password(password: str) -> str:
+        threads.append(threading.current_thread().name)
+        return crypt.get_password_hash(password)
+
+    try:
+        hashed = await hasher._submit(hash_password, "secret")
+        assert await hasher.verify("secret", hashed)
+        assert not await hasher.verify("other", hashed)
+    finally:
+        hasher.shutdown()
+    assert threads[0].startswith("password-hasher")
+    assert hasher.stats()["completed"] == 3
+
+
+async def test_calls_beyond_the_queue_are_rejected() -> None:
+    hasher = crypt.PasswordHasher(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    def wait() -> bool:
+        return release.wait(5)
+
+    try:
+        calls = [asyncio.ensure_future(hasher._submit(wait)) for _ in "ab"]
+        await asyncio.sleep(0.05)
+        # one call runs, one waits for the worker, the next fails fast.
+        with pytest.raises(crypt.PasswordHasherBusyError):
+            await hasher.hash("secret")
+        stats = hasher.stats()
+        assert (stats["running"], stats["queued"], stats["rejected"]) == (
+            1,
+            1,
+            1,
+        )
+        release.set()
+        assert await asyncio.gather(*calls) == [True, True]
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert (stats["running"], stats["queued"], stats["completed"]) == (
+        0,
+        0,
+        2,
+    )
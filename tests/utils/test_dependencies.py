@@ -0,0 +1,114 @@
+"""Tests of the utils dependencies module."""
+
+import pytest
+
+from fastapi import (
+    Depends,
+    FastAPI,
+)
+import httpx
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+)
+
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    dependencies,
+)
+from tests import (
+    fakes,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def started(
+    monkeypatch: pytest.MonkeyPatch, db_engine: AIOEngine
+) -> List[fakes.FakeDriverSession]:
+    """
+    The driver sessions started by the engine, from now on.
+    """
+    start_session = db_engine.client.start_session
+    driver_sessions: List[fakes.FakeDriverSession] = []
+
+    async def recording(**kwargs: Any) -> fakes.FakeDriverSession:
+        driver_session = await start_session(**kwargs)
+        driver_sessions.append(driver_session)
+        return driver_session
+
+    monkeypatch.setattr(db_engine.client, "start_session", recording)
+    return driver_sessions
+
+
+@pytest.fixture
+async def client(db_engine: AIOEngine) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of an app with a route that queries and one that doesn't.
+    """
+    app = FastAPI()
+    app.state.engine = db_engine
+
+    @app.get("/static")
+    async def static(
+        session: dependencies.LazySession = Depends(
+            dependencies.get_db_session
+        ),
+    ) -> Dict[str, bool]:
+        return {"started": session.is_started}
+
+    @app.get("/users")
+    async def users(
+        session: dependencies.LazySession = Depends(
+            dependencies.get_db_session
+        ),
+    ) -> Dict[str, int]:
+        found = await session.find(users_models.User)
+        return {"count": len(found)}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        yield client
+
+
+async def test_requests_without_queries_start_no_session(
+    client: httpx.AsyncClient, started: List[fakes.FakeDriverSession]
+) -> None:
+    response = await client.get("/static")
+    assert response.json() == {"started": False}
+    assert started == []
+
+
+async def test_the_first_query_starts_the_session(
+    users: List[users_models.User],
+    client: httpx.AsyncClient,
+    started: List[fakes.FakeDriverSession],
+) -> None:
+    response = await client.get("/users")
+    assert response.json() == {"count": 2}
+    assert len(started) == 1
+
+
+async def test_lazy_sessions_start_once(
+    db_engine: AIOEngine,
+    users: List[users_models.User],
+    started: List[fakes.FakeDriverSession],
+) -> None:
+    session = dependencies.LazySession(db_engine)
+    assert session.get_driver_session() is None
+    assert not session.is_started
+    found = [user async for user in session.find(users_models.User)]
+    assert len(found) == 2
+    assert await session.count(users_models.User) == 2
+    assert session.get_driver_session() is started[0]
+    assert len(started) == 1
+    await session.end()
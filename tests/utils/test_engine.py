@@ -0,0 +1,137 @@
+"""Tests of the utils engine module."""
+
+import pytest
+
+from odmantic import (
+    AIOEngine,
+)
+from odmantic.session import (
+    AIOSession,
+)
+from pymongo.errors import (
+    OperationFailure,
+)
+from typing import (
+    Any,
+    List,
+    Optional,
+)
+
+from app.utils import (
+    engine,
+)
+from tests.fakes import (
+    FakeDriverSession,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def labelled_error(label: str) -> OperationFailure:
+    return OperationFailure("failed", 112, {"errorLabels": [label]})
+
+
+class FakeSession(AIOSession):
+    """
+    An odmantic session over a fake motor session.
+    """
+
+    def __init__(self, driver_session: FakeDriverSession):
+        super().__init__(AIOEngine())
+        self.session = driver_session
+
+    @property
+    def is_started(self) -> bool:
+        return True
+
+    def get_driver_session(self) -> Any:
+        return self.session
+
+
+async def test_commits_once() -> None:
+    driver_session = FakeDriverSession()
+
+    async def callback(session: AIOSession) -> str:
+        assert engine.in_transaction(session)
+        return "done"
+
+    result = await engine.run_in_transaction(
+        FakeSession(driver_session), callback
+    )
+    assert result == "done"
+    assert driver_session.calls == ["start", "commit"]
+
+
+async def test_retries_the_callback_on_transient_errors() -> None:
+    driver_session = FakeDriverSession()
+    attempts: List[int] = []
+
+    async def callback(session: AIOSession) -> int:
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise labelled_error(engine.TRANSIENT_TRANSACTION_ERROR)
+        return len(attempts)
+
+    result = await engine.run_in_transaction(
+        FakeSession(driver_session), callback, max_attempts=3
+    )
+    assert result == 2
+    assert driver_session.calls == ["start", "abort", "start", "commit"]
+
+
+async def test_retries_the_callback_on_given_errors() -> None:
+    attempts: List[None] = []
+
+    async def callback(session: AIOSession) -> None:
+        attempts.append(None)
+        raise KeyError("duplicate")
+
+    with pytest.raises(KeyError):
+        await engine.run_in_transaction(
+            FakeSession(FakeDriverSession()),
+            callback,
+            retry_on=(KeyError,),
+            max_attempts=3,
+        )
+    assert len(attempts) == 3
+
+
+async def test_does_not_retry_other_errors() -> None:
+    driver_session = FakeDriverSession()
+
+    async def callback(session: AIOSession) -> None:
+        raise ValueError("invalid")
+
+    with pytest.raises(ValueError):
+        await engine.run_in_transaction(FakeSession(driver_session), callback)
+    assert driver_session.calls == ["start", "abort"]
+
+
+async def test_retries_the_commit_on_unknown_results() -> None:
+    driver_session = FakeDriverSession(
+        [labelled_error(engine.UNKNOWN_COMMIT_RESULT)]
+    )
+    attempts: List[None] = []
+
+    async def callback(session: AIOSession) -> None:
+        attempts.append(None)
+
+    await engine.run_in_transaction(
+        FakeSession(driver_session), callback, max_attempts=3
+    )
+    assert len(attempts) == 1
+    assert driver_session.calls == ["start", "commit", "commit"]
+
+
+async def test_raises_commit_failures_after_the_last_attempt() -> None:
+    error = labelled_error(engine.TRANSIENT_TRANSACTION_ERROR)
+    driver_session = FakeDriverSession([error, error])
+
+    async def callback(session: AIOSession) -> None:
+        return None
+
+    with pytest.raises(OperationFailure):
+        await engine.run_in_transaction(
+            FakeSession(driver_session), callback, max_attempts=2
+        )
+    assert driver_session.calls == ["start", "commit", "start", "commit"]
@@ -0,0 +1,95 @@
+"""Tests of the utils indexes module."""
+
+import pytest
+
+from mongomock_motor import (
+    AsyncMongoMockClient,
+)
+from odmantic import (
+    AIOEngine,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from app.config import (
+    settings,
+)
+from app.messages import (
+    models as messages_models,
+)
+from app.users import (
+    models as users_models,
+)
+from app.utils import (
+    indexes,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def get_index(report: List[Dict[str, Any]], query: str) -> Any:
+    return next(entry["index"] for entry in report if entry["query"] == query)
+
+
+@pytest.fixture
+def engine() -> AIOEngine:
+    return AIOEngine(client=AsyncMongoMockClient(), database="tests")
+
+
+async def test_replaces_the_legacy_email_index(engine: AIOEngine) -> None:
+    users = engine.get_collection(users_models.User)
+    await users.create_index("email", name="email_1")
+    await users.insert_one({"email": "user@test.com"})
+    report = await indexes.configure_indexes(engine)
+    existing = await users.index_information()
+    assert "email_1" not in existing
+    assert existing["email_unique_index"]["unique"]
+    assert (
+        get_index(report, "auth.crud.find_existed_user")
+        == "email_unique_index"
+    )
+
+
+async def test_reports_indexes_failing_to_build(engine: AIOEngine) -> None:
+    users = engine.get_collection(users_models.User)
+    await users.create_index("email", name="email_1")
+    await users.insert_many([{"email": "user@test.com"} for _ in range(2)])
+    report = await indexes.configure_indexes(engine)
+    assert "email_unique_index" not in await users.index_information()
+    assert get_index(report, "auth.crud.find_existed_user") is None
+
+
+@pytest.mark.parametrize("drop_obsolete", [False, True])
+async def test_drops_the_legacy_conversation_indexes_when_enabled(
+    monkeypatch: pytest.MonkeyPatch, engine: AIOEngine, drop_obsolete: bool
+) -> None:
+    monkeypatch.setattr(
+        settings(), "MONGODB_DROP_OBSOLETE_INDEXES", drop_obsolete
+    )
+    conversations = engine.get_collection(messages_models.Conversation)
+    for field in ("sender", "receiver"):
+        await conversations.create_index(field, name=f"{field}_1")
+    await indexes.configure_indexes(engine)
+    existing = await conversations.index_information()
+    for name in ("sender_1", "receiver_1"):
+        assert (name in existing) is not drop_obsolete
+
+
+def test_text_indexes_cover_search_as_reported_by_the_server() -> None:
+    query = next(
+        query
+        for query in indexes.get_hot_queries()
+        if query.name == "messages.crud.search_messages"
+    )
+    declared = indexes.get_declared_indexes(messages_models.Message)
+    existing = indexes.get_index_models(
+        {
+            "_id_": {"key": [("_id", 1)]},
+            "content_text_index": {"key": [("_fts", "text"), ("_ftsx", 1)]},
+        }
+    )
+    assert indexes.find_covering_index(query, declared) == "content_text_index"
+    assert indexes.find_covering_index(query, existing) == "content_text_index"
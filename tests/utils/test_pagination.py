@@ -0,0 +1,69 @@
+"""Tests of the utils pagination module."""
+
+import pytest
+
+from bson import (
+    ObjectId,
+)
+from datetime import (
+    datetime,
+)
+from odmantic import (
+    AIOEngine,
+)
+
+from app.messages import (
+    models as messages_models,
+)
+from app.utils import (
+    pagination,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursors_round_trip() -> None:
+    date, object_id = datetime(2024, 1, 2, 3, 4, 5, 678), ObjectId()
+    cursor = pagination.encode_cursor(date, object_id)
+    assert pagination.decode_cursor(cursor) == (date, object_id)
+    assert (
+        pagination.decode_offset_cursor(pagination.encode_offset_cursor(40))
+        == 40
+    )
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        pagination.encode_offset_cursor(1),
+        pagination.encode_cursor(datetime.utcnow(), ObjectId())[:-4],
+    ],
+)
+def test_invalid_cursors_are_rejected(cursor: str) -> None:
+    with pytest.raises(ValueError, match="Invalid cursor!"):
+        pagination.decode_cursor(cursor)
+
+
+def test_invalid_offset_cursors_are_rejected() -> None:
+    for cursor in ("not-a-cursor", pagination.encode_offset_cursor(-1)):
+        with pytest.raises(ValueError, match="Invalid cursor!"):
+            pagination.decode_offset_cursor(cursor)
+
+
+async def test_cursor_queries_break_date_ties_on_ids(
+    db_engine: AIOEngine,
+) -> None:
+    date = datetime.utcnow().replace(microsecond=0)
+    collection = db_engine.get_collection(messages_models.Message)
+    ids = sorted(ObjectId() for _ in range(3))
+    await collection.insert_many(
+        [{"_id": object_id, "creation_date": date} for object_id in ids]
+    )
+    for before, expected in ((True, ids[:1]), (False, ids[2:])):
+        found = await collection.find(
+            pagination.get_cursor_query(
+                "creation_date", date, ids[1], before=before
+            )
+        ).to_list(None)
+        assert [document["_id"] for document in found] == expected
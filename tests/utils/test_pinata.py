@@ -0,0 +1,94 @@
+"""Tests of the utils pinata module."""
+
+import pytest
+
+import httpx
+import json
+from typing import (
+    AsyncIterator,
+    List,
+)
+
+from app.utils import (
+    pinata,
+)
+
+pytestmark = pytest.mark.anyio
+
+CID = "QmYwAPJzv5CZsnAzt8auVZRn1sjkY3Nio7Wr5Xm7ib3hV9"
+
+
+def new_client(
+    requests: List[httpx.Request], status_code: int = 200
+) -> pinata.PinataClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.method == "DELETE":
+            return httpx.Response(status_code)
+        return httpx.Response(status_code, json={"IpfsHash": CID})
+
+    return pinata.PinataClient(
+        api_url="https://pinata.test/",
+        api_key="key",
+        api_secret="secret",
+        gateway_url="https://gateway.test/ipfs/",
+        timeout=1,
+        max_concurrency=2,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+async def test_pin_file_streams_a_wrapped_multipart_body() -> None:
+    requests: List[httpx.Request] = []
+    client = new_client(requests)
+    cid = await client.pin_file(b"\x89PNG content", "photo.png", "image/png")
+    await client.close()
+    assert cid == CID
+    (request,) = requests
+    assert request.url == "https://pinata.test/pinning/pinFileToIPFS"
+    assert request.headers["pinata_api_key"] == "key"
+    assert request.headers["pinata_secret_api_key"] == "secret"
+    assert int(request.headers["Content-Length"]) == len(request.content)
+    boundary = request.headers["Content-Type"].split("boundary=")[1]
+    parts = request.content.split(f"--{boundary}".encode())
+    assert json.dumps({"wrapWithDirectory": True}).encode() in parts[1]
+    assert b'filename="photo.png"' in parts[2]
+    assert b"Content-Type: image/png" in parts[2]
+    assert parts[2].endswith(b"\r\n\r\n\x89PNG content\r\n")
+    assert parts[3] == b"--\r\n"
+    assert client.stats()["pinned"] == 1
+
+
+async def test_pin_file_streams_an_unsized_source() -> None:
+    requests: List[httpx.Request] = []
+    client = new_client(requests)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for chunk in (b"first ", b"second"):
+            yield chunk
+
+    await client.pin_file(chunks(), "notes.txt")
+    await client.close()
+    (request,) = requests
+    assert "Content-Length" not in request.headers
+    assert b"first second" in request.content
+
+
+async def test_pin_file_failure_raises_pinata_error() -> None:
+    client = new_client([], status_code=500)
+    with pytest.raises(pinata.PinataError):
+        await client.pin_file(b"content", "photo.png")
+    await client.close()
+    assert client.stats()["failed"] == 1
+    assert client.stats()["in_flight"] == 0
+
+
+async def test_unpin_deletes_the_pin() -> None:
+    requests: List[httpx.Request] = []
+    client = new_client(requests)
+    await client.unpin(CID)
+    await client.close()
+    assert [(request.method, request.url.path) for request in requests] == [
+        ("DELETE", f"/pinning/unpin/{CID}")
+    ]
+    assert client.stats()["unpinned"] == 1
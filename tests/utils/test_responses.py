@@ -0,0 +1,251 @@
+"""Tests of the utils responses module."""
+
+import pytest
+
+import httpx
+import os
+from starlette.applications import (
+    Starlette,
+)
+from starlette.requests import (
+    Request,
+)
+from starlette.responses import (
+    Response,
+)
+from starlette.routing import (
+    Route,
+)
+from starlette.types import (
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+)
+
+from app.media import (
+    storage as media_storage,
+)
+from app.utils import (
+    responses,
+)
+
+pytestmark = pytest.mark.anyio
+
+KEY = "ab" + "0" * 62
+CONTENT = bytes(range(256)) * 1024
+ETAG = f'"{KEY}"'
+
+
+@pytest.fixture
+def extensions() -> Dict[str, Any]:
+    """
+    The ASGI extensions the server advertises, none by default.
+    """
+    return {}
+
+
+@pytest.fixture
+def sent() -> List[str]:
+    """
+    The types of the ASGI messages sent by the app.
+    """
+    return []
+
+
+@pytest.fixture
+async def client(
+    tmp_path: str, extensions: Dict[str, Any], sent: List[str]
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of an app serving the files of a local storage in a temp dir,
+    behind a server sending the files the app hands over.
+    """
+    storage = media_storage.LocalStorage(
+        str(tmp_path), "http://testserver/media"
+    )
+    await storage.save(KEY, CONTENT, "image/webp")
+
+    async def get_file(request: Request) -> Response:
+        return await responses.get_file_response(
+            request,
+            storage.get_path(request.path_params["key"]),
+            "image/webp",
+            ETAG,
+            "public, max-age=31536000, immutable",
+        )
+
+    app = Starlette(
+        routes=[Route("/media/{key}", get_file, methods=["GET", "HEAD"])]
+    )
+
+    async def server(scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_file(message: Message) -> None:
+            sent.append(message["type"])
+            if message["type"] == "http.response.pathsend":
+                with open(message["path"], "rb") as file:
+                    message = {
+                        "type": "http.response.body",
+                        "body": file.read(),
+                    }
+            elif message["type"] == "http.response.zerocopy":
+                body = os.pread(
+                    message["file"].fileno(),
+                    message["count"],
+                    message["offset"],
+                )
+                message = {"type": "http.response.body", "body": body}
+            await send(message)
+
+        scope["extensions"] = {**scope.get("extensions", {}), **extensions}
+        await app(scope, receive, send_file)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server),
+        base_url="http://testserver",
+    ) as client:
+        yield client
+
+
+async def test_get_whole_file(client: httpx.AsyncClient) -> None:
+    response = await client.get(f"/media/{KEY}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == ETAG
+
+
+async def test_get_byte_range(client: httpx.AsyncClient) -> None:
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=100-70000"}
+    )
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:70001]
+    assert response.headers["content-range"] == (
+        f"bytes 100-70000/{len(CONTENT)}"
+    )
+    # an open range ends at the end of the file, a suffix counts from it.
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=262000-"}
+    )
+    assert response.status_code == 206
+    assert response.content == CONTENT[262000:]
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=-10"}
+    )
+    assert response.status_code == 206
+    assert response.content == CONTENT[-10:]
+
+
+async def test_get_unsatisfiable_range(client: httpx.AsyncClient) -> None:
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": f"bytes={len(CONTENT)}-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+async def test_get_multiple_ranges_sends_whole_file(
+    client: httpx.AsyncClient,
+) -> None:
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=0-1,4-5"}
+    )
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+async def test_get_not_modified(client: httpx.AsyncClient) -> None:
+    response = await client.get(
+        f"/media/{KEY}", headers={"if-none-match": ETAG}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == ETAG
+    response = await client.get(
+        f"/media/{KEY}", headers={"if-none-match": '"other"'}
+    )
+    assert response.status_code == 200
+
+
+async def test_if_range_mismatch_sends_whole_file(
+    client: httpx.AsyncClient,
+) -> None:
+    response = await client.get(
+        f"/media/{KEY}",
+        headers={"range": "bytes=0-9", "if-range": '"other"'},
+    )
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=0-9", "if-range": ETAG}
+    )
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+async def test_head_sends_headers_only(client: httpx.AsyncClient) -> None:
+    response = await client.head(f"/media/{KEY}")
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(CONTENT))
+    response = await client.head(
+        f"/media/{KEY}", headers={"range": "bytes=0-9"}
+    )
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-length"] == "10"
+
+
+async def test_get_missing_file(client: httpx.AsyncClient) -> None:
+    response = await client.get(f"/media/{'cd' + '0' * 62}")
+    assert response.status_code == 404
+    assert response.json() == {
+        "status_code": 404,
+        "message": "File not found!",
+    }
+
+
+async def test_whole_files_are_handed_over_as_paths(
+    client: httpx.AsyncClient, extensions: Dict[str, Any], sent: List[str]
+) -> None:
+    extensions["http.response.pathsend"] = {}
+    response = await client.get(f"/media/{KEY}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert sent == ["http.response.start", "http.response.pathsend"]
+    # a byte range isn't a whole file, it is read in chunks.
+    sent.clear()
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=10-19"}
+    )
+    assert response.content == CONTENT[10:20]
+    assert "http.response.pathsend" not in sent
+
+
+async def test_byte_ranges_are_handed_over_as_zero_copy(
+    client: httpx.AsyncClient, extensions: Dict[str, Any], sent: List[str]
+) -> None:
+    extensions["http.response.zerocopy"] = {}
+    response = await client.get(
+        f"/media/{KEY}", headers={"range": "bytes=100-70000"}
+    )
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:70001]
+    assert sent == ["http.response.start", "http.response.zerocopy"]
+
+
+async def test_files_are_read_in_chunks_otherwise(
+    client: httpx.AsyncClient, sent: List[str]
+) -> None:
+    response = await client.get(f"/media/{KEY}")
+    assert response.content == CONTENT
+    chunks = len(CONTENT) // responses.FileSliceResponse.chunk_size
+    assert sent == ["http.response.start"] + ["http.response.body"] * chunks
@@ -0,0 +1,133 @@
+"""Tests of the utils uploads module."""
+
+import pytest
+
+import anyio
+from fastapi import (
+    FastAPI,
+    UploadFile,
+)
+import hashlib
+import httpx
+import os
+from starlette.requests import (
+    Request,
+)
+import tempfile
+from typing import (
+    AsyncIterator,
+    Dict,
+)
+
+from app.utils import (
+    uploads,
+)
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+@pytest.fixture
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client of an app echoing the size of the bodies up to 100 bytes.
+    """
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request) -> Dict[str, int]:
+        return {"size": len(await request.body())}
+
+    app.add_middleware(uploads.MaxBodySizeMiddleware, max_body_size=100)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        yield client
+
+
+def new_upload(content: bytes, spool_size: int = 4096) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    spooled.write(content)
+    spooled.seek(0)
+    return UploadFile(spooled, size=len(content))  # type: ignore
+
+
+async def test_bodies_within_the_limit_are_passed(
+    client: httpx.AsyncClient,
+) -> None:
+    response = await client.post("/echo", content=b"x" * 100)
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+async def test_declared_large_bodies_are_rejected(
+    client: httpx.AsyncClient,
+) -> None:
+    response = await client.post("/echo", content=b"x" * 101)
+    assert response.status_code == 413
+    assert response.json() == {
+        "status_code": 413,
+        "message": "The request is too large!",
+    }
+
+
+async def test_streamed_large_bodies_are_rejected(
+    client: httpx.AsyncClient,
+) -> None:
+    async def chunks() -> AsyncIterator[bytes]:
+        for _ in range(3):
+            yield b"x" * 40
+
+    # a chunked body declares no length, its bytes are counted.
+    response = await client.post("/echo", content=chunks())
+    assert response.status_code == 413
+    assert response.json()["message"] == "The request is too large!"
+
+
+async def test_upload_stream_hashes_the_content() -> None:
+    stream = uploads.UploadStream(new_upload(IMAGE), 4096, chunk_size=100)
+    chunks = [chunk async for chunk in stream]
+    assert b"".join(chunks) == IMAGE
+    assert max(len(chunk) for chunk in chunks) == 100
+    assert stream.content_type == "image/png"
+    assert stream.size == len(IMAGE)
+    assert stream.sha256 == hashlib.sha256(IMAGE).hexdigest()
+    # a rewound stream is read and hashed again from the start.
+    await stream.rewind()
+    assert b"".join([chunk async for chunk in stream]) == IMAGE
+    assert stream.sha256 == hashlib.sha256(IMAGE).hexdigest()
+
+
+async def test_upload_stream_rejects_large_and_invalid_files() -> None:
+    upload = new_upload(IMAGE)
+    upload.size = None
+    with pytest.raises(uploads.UploadTooLargeError):
+        async for _ in uploads.UploadStream(upload, 1000, chunk_size=100):
+            pass
+    with pytest.raises(uploads.UnsupportedMediaTypeError):
+        await uploads.UploadStream(new_upload(b"not an image"), 4096).open()
+
+
+async def test_spool_to_file() -> None:
+    stream = uploads.UploadStream(new_upload(IMAGE), 4096, chunk_size=100)
+    path = await uploads.spool_to_file(stream)
+    try:
+        assert await anyio.Path(path).read_bytes() == IMAGE
+    finally:
+        os.remove(path)
+    # a failed spool leaves no file behind.
+    stream = uploads.UploadStream(new_upload(IMAGE), 1000, chunk_size=100)
+    spooled = set(os.listdir(tempfile.gettempdir()))
+    with pytest.raises(uploads.UploadTooLargeError):
+        await uploads.spool_to_file(stream)
+    assert set(os.listdir(tempfile.gettempdir())) <= spooled
+
+
+def test_upload_path_of_uploads_on_disk() -> None:
+    assert uploads.get_upload_path(new_upload(IMAGE)) is None
+    upload = new_upload(IMAGE, spool_size=100)
+    path = uploads.get_upload_path(upload)
+    assert path is not None
+    with open(path, "rb") as file:
+        assert file.read() == IMAGE